@@ -0,0 +1,452 @@
+"""
+Modulo con los almacenes de los objetos de datos (Parquet, GeoJSON, manifiesto)
+
+s3_loader y s3_manifest no hablan con boto3 directamente sino con el almacen
+configurado, que puede ser:
+- s3: el bucket de la app (por defecto), con la cache en disco, las
+  descargas por partes y las lecturas por rango de S3
+- local: un directorio con los objetos bajo su clave (p.ej.
+  <directorio>/raw/precios_municipios_cantabria.parquet), para trabajar sin
+  conexion o servir los datos desde un disco local rapido
+- memoria: los objetos en RAM, cargados de un directorio al arrancar o
+  guardados desde codigo (pruebas, benchmarks)
+
+Todos devuelven un ETag por objeto, de modo que las caches que se versionan
+con el (snapshots Arrow, geometrias simplificadas, figuras) funcionan igual
+con cualquier almacen. Un objeto que no existe es un FileNotFoundError.
+Tambien listan los objetos de un prefijo con sus ETag (datasets
+particionados, ver particiones) y guardan objetos nuevos.
+
+Se elige en la seccion [almacenamiento] de secrets.toml:
+
+    [almacenamiento]
+    tipo = "local"
+    directorio = "/datos/viviendas"
+
+o con las variables de entorno VIVIENDAS_ALMACENAMIENTO y
+VIVIENDAS_ALMACENAMIENTO_DIR.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+import pyarrow as pa
+import streamlit as st
+from botocore.exceptions import ClientError
+
+from s3_cache import get_disk_cache
+from s3_ranges import S3RangeFile, download_object
+from s3_session import get_s3_client, get_s3_bucket
+
+logger = logging.getLogger(__name__)
+
+TIPOS_ALMACEN = ('s3', 'local', 'memoria')
+DEFAULT_TIPO_ALMACEN = 's3'
+
+
+class _Almacen:
+    """
+    Contadores comunes de los almacenes
+    """
+
+    tipo = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {
+            'descargas': 0,
+            'bytes_descargados': 0,
+            'cabeceras': 0,
+            'listados': 0,
+            'aperturas': 0,
+            'sin_cambios': 0,
+        }
+
+    def _count(self, stat, amount=1):
+        with self._lock:
+            self._stats[stat] += amount
+
+    def descargar_si_cambia(self, clave, etag=None):
+        """
+        Descarga un objeto solo si su ETag ya no es el indicado
+
+        Returns:
+            Tupla (contenido en bytes, ETag), o None si no ha cambiado
+        """
+        if etag is not None and self.cabecera(clave)['etag'] == etag:
+            self._count('sin_cambios')
+            return None
+        return self.descargar(clave)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, tipo=self.tipo, ubicacion=self.ubicacion)
+
+
+def _es_no_encontrado(error):
+    """
+    Indica si un error de boto3 corresponde a un objeto que no existe
+    """
+    code = error.response.get('Error', {}).get('Code')
+    return code in ('NoSuchKey', '404', 'NotFound')
+
+
+class AlmacenS3(_Almacen):
+    """
+    Objetos en el bucket de S3 configurado (ver s3_session)
+
+    El cliente y el bucket se piden en cada operacion, de modo que
+    reset_s3_client() tambien se aplica a este almacen.
+    """
+
+    tipo = 's3'
+
+    @property
+    def ubicacion(self):
+        return f"s3://{get_s3_bucket()}"
+
+    def descargar(self, clave):
+        """
+        Descarga un objeto pasando por la cache en disco
+
+        Si hay copia local se revalida con un GET condicional, de modo que un
+        objeto sin cambios cuesta una peticion sin cuerpo en lugar de la descarga.
+
+        Returns:
+            Tupla (contenido en bytes, ETag)
+        """
+        s3_client = get_s3_client()
+        bucket = get_s3_bucket()
+        try:
+            disk_cache = get_disk_cache()
+            if disk_cache is not None:
+                data, etag = disk_cache.fetch(s3_client, bucket, clave)
+            else:
+                data, etag = download_object(s3_client, bucket, clave)
+        except ClientError as e:
+            if _es_no_encontrado(e):
+                raise FileNotFoundError(f"{self.ubicacion}/{clave}") from e
+            raise
+
+        self._count('descargas')
+        self._count('bytes_descargados', len(data))
+        return data, etag
+
+    def _head(self, clave):
+        self._count('cabeceras')
+        try:
+            return get_s3_client().head_object(Bucket=get_s3_bucket(), Key=clave)
+        except ClientError as e:
+            if _es_no_encontrado(e):
+                raise FileNotFoundError(f"{self.ubicacion}/{clave}") from e
+            raise
+
+    def cabecera(self, clave):
+        """
+        ETag y tamaño de un objeto (peticion HEAD)
+        """
+        head = self._head(clave)
+        return {'etag': head['ETag'], 'tamano': head['ContentLength']}
+
+    def guardar(self, clave, contenido):
+        """
+        Sube (o reemplaza) un objeto
+
+        Returns:
+            ETag del objeto
+        """
+        response = get_s3_client().put_object(Bucket=get_s3_bucket(), Key=clave, Body=bytes(contenido))
+        return response['ETag']
+
+    def listar(self, prefijo):
+        """
+        Objetos cuya clave empieza por un prefijo, con su ETag
+
+        Returns:
+            Diccionario {clave: ETag}
+        """
+        self._count('listados')
+        paginator = get_s3_client().get_paginator('list_objects_v2')
+        objetos = {}
+        for pagina in paginator.paginate(Bucket=get_s3_bucket(), Prefix=prefijo):
+            for objeto in pagina.get('Contents', []):
+                objetos[objeto['Key']] = objeto['ETag']
+        return objetos
+
+    def abrir(self, clave):
+        """
+        Fichero de solo lectura para leer partes de un objeto (p.ej. con pyarrow)
+
+        Es la copia en disco si corresponde a la version actual del objeto y
+        si no un S3RangeFile que pide a S3 solo los rangos que se leen.
+        """
+        head = self._head(clave)
+        self._count('aperturas')
+
+        disk_cache = get_disk_cache()
+        entry = disk_cache.lookup(get_s3_bucket(), clave) if disk_cache is not None else None
+        if entry is not None and entry['etag'] == head['ETag']:
+            return str(entry['path'])
+        return S3RangeFile(get_s3_client(), get_s3_bucket(), clave, size=head['ContentLength'], etag=head['ETag'])
+
+    def descargar_si_cambia(self, clave, etag=None):
+        # Un GET condicional en lugar de HEAD + GET
+        request = {'Bucket': get_s3_bucket(), 'Key': clave}
+        if etag is not None:
+            request['IfNoneMatch'] = etag
+
+        try:
+            response = get_s3_client().get_object(**request)
+        except ClientError as e:
+            status = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+            if status == 304 or e.response.get('Error', {}).get('Code') == '304':
+                self._count('sin_cambios')
+                return None
+            if _es_no_encontrado(e):
+                raise FileNotFoundError(f"{self.ubicacion}/{clave}") from e
+            raise
+
+        data = response['Body'].read()
+        self._count('descargas')
+        self._count('bytes_descargados', len(data))
+        return data, response['ETag']
+
+
+class AlmacenLocal(_Almacen):
+    """
+    Objetos en un directorio local, con la clave como ruta relativa
+
+    El ETag se forma con la fecha de modificacion y el tamaño del fichero
+    (como hacen los servidores web): cambia al reescribirlo sin tener que
+    leerlo. Para publicar datos nuevos conviene escribir a un fichero
+    temporal y renombrarlo, de modo que un lector nunca vea uno a medias.
+    """
+
+    tipo = 'local'
+
+    def __init__(self, directorio):
+        super().__init__()
+        self.directorio = Path(directorio).resolve()
+        if not self.directorio.is_dir():
+            raise FileNotFoundError(f"No existe el directorio de datos {self.directorio}")
+
+    @property
+    def ubicacion(self):
+        return str(self.directorio)
+
+    def _ruta(self, clave):
+        ruta = (self.directorio / clave).resolve()
+        if self.directorio not in ruta.parents:
+            raise ValueError(f"Clave fuera del directorio de datos: {clave}")
+        return ruta
+
+    @staticmethod
+    def _etag(stat):
+        return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+    def descargar(self, clave):
+        ruta = self._ruta(clave)
+        with open(ruta, 'rb') as f:
+            etag = self._etag(os.fstat(f.fileno()))
+            data = f.read()
+
+        self._count('descargas')
+        self._count('bytes_descargados', len(data))
+        return data, etag
+
+    def cabecera(self, clave):
+        self._count('cabeceras')
+        stat = self._ruta(clave).stat()
+        return {'etag': self._etag(stat), 'tamano': stat.st_size}
+
+    def guardar(self, clave, contenido):
+        # Fichero temporal y renombrado: un lector nunca ve uno a medias
+        ruta = self._ruta(clave)
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        fd, ruta_tmp = tempfile.mkstemp(dir=ruta.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(contenido)
+            os.replace(ruta_tmp, ruta)
+        except BaseException:
+            if os.path.exists(ruta_tmp):
+                os.remove(ruta_tmp)
+            raise
+        return self._etag(ruta.stat())
+
+    def listar(self, prefijo):
+        self._count('listados')
+        objetos = {}
+        # Un prefijo que no acaba en / puede cortar un nombre: se recorre el
+        # directorio que lo contiene
+        base = self.directorio
+        if prefijo:
+            base = self._ruta(prefijo) if prefijo.endswith('/') else self._ruta(prefijo).parent
+        raiz = str(self.directorio) + os.sep
+        # os.walk y os.stat en lugar de pathlib: miles de particiones
+        for directorio, _, ficheros in os.walk(base):
+            for fichero in ficheros:
+                ruta = os.path.join(directorio, fichero)
+                clave = ruta[len(raiz):].replace(os.sep, '/')
+                if clave.startswith(prefijo):
+                    objetos[clave] = self._etag(os.stat(ruta))
+        return objetos
+
+    def abrir(self, clave):
+        ruta = self._ruta(clave)
+        if not ruta.is_file():
+            raise FileNotFoundError(str(ruta))
+        self._count('aperturas')
+        return str(ruta)
+
+
+class AlmacenMemoria(_Almacen):
+    """
+    Objetos en memoria, con el MD5 del contenido como ETag (como S3)
+    """
+
+    tipo = 'memoria'
+
+    def __init__(self, objetos=None):
+        super().__init__()
+        self._objetos = {}
+        for clave, contenido in (objetos or {}).items():
+            self.guardar(clave, contenido)
+
+    @classmethod
+    def desde_directorio(cls, directorio):
+        """
+        Almacen con una copia de todos los ficheros de un directorio
+        """
+        directorio = Path(directorio)
+        if not directorio.is_dir():
+            raise FileNotFoundError(f"No existe el directorio de datos {directorio}")
+        return cls({
+            ruta.relative_to(directorio).as_posix(): ruta.read_bytes()
+            for ruta in sorted(directorio.rglob('*')) if ruta.is_file()
+        })
+
+    @property
+    def ubicacion(self):
+        return f"memoria ({len(self._objetos)} objetos)"
+
+    def guardar(self, clave, contenido):
+        """
+        Guarda (o reemplaza) un objeto
+
+        Returns:
+            ETag del objeto
+        """
+        contenido = bytes(contenido)
+        etag = f'"{hashlib.md5(contenido).hexdigest()}"'
+        with self._lock:
+            self._objetos[clave] = (contenido, etag)
+        return etag
+
+    def borrar(self, clave):
+        with self._lock:
+            self._objetos.pop(clave, None)
+
+    def _objeto(self, clave):
+        with self._lock:
+            objeto = self._objetos.get(clave)
+        if objeto is None:
+            raise FileNotFoundError(f"memoria/{clave}")
+        return objeto
+
+    def descargar(self, clave):
+        data, etag = self._objeto(clave)
+        self._count('descargas')
+        self._count('bytes_descargados', len(data))
+        return data, etag
+
+    def cabecera(self, clave):
+        self._count('cabeceras')
+        data, etag = self._objeto(clave)
+        return {'etag': etag, 'tamano': len(data)}
+
+    def listar(self, prefijo):
+        self._count('listados')
+        with self._lock:
+            return {clave: etag for clave, (_, etag) in self._objetos.items() if clave.startswith(prefijo)}
+
+    def abrir(self, clave):
+        data, _ = self._objeto(clave)
+        self._count('aperturas')
+        return pa.BufferReader(data)
+
+
+_lock = threading.Lock()
+_almacen = None
+
+
+def _read_almacen_config():
+    """
+    Lee el tipo de almacen y su directorio desde secrets.toml o variables de entorno
+    """
+    try:
+        config = st.secrets.get("almacenamiento", {})
+        tipo = config.get("tipo", DEFAULT_TIPO_ALMACEN)
+        directorio = config.get("directorio")
+    except:
+        tipo = os.environ.get('VIVIENDAS_ALMACENAMIENTO', DEFAULT_TIPO_ALMACEN)
+        directorio = os.environ.get('VIVIENDAS_ALMACENAMIENTO_DIR')
+
+    return tipo, directorio
+
+
+def crear_almacen(tipo, directorio=None):
+    """
+    Crea un almacen de un tipo
+
+    Args:
+        tipo: 's3', 'local' o 'memoria'
+        directorio: Directorio de los objetos (obligatorio para 'local'; para
+            'memoria' se copia a RAM al crearlo)
+    """
+    if tipo == 's3':
+        return AlmacenS3()
+    if tipo == 'local':
+        if not directorio:
+            raise ValueError("El almacen local necesita un directorio")
+        return AlmacenLocal(directorio)
+    if tipo == 'memoria':
+        return AlmacenMemoria.desde_directorio(directorio) if directorio else AlmacenMemoria()
+    raise ValueError(f"Tipo de almacen desconocido: {tipo} (validos: {', '.join(TIPOS_ALMACEN)})")
+
+
+def get_almacen():
+    """
+    Devuelve el almacen del proceso, creandolo la primera vez segun la configuracion
+    """
+    global _almacen
+
+    if _almacen is None:
+        with _lock:
+            if _almacen is None:
+                _almacen = crear_almacen(*_read_almacen_config())
+                logger.info("Almacen de datos: %s (%s)", _almacen.tipo, _almacen.ubicacion)
+    return _almacen
+
+
+def configurar_almacen(almacen):
+    """
+    Sustituye el almacen del proceso (p.ej. por uno en memoria en pruebas)
+
+    Las caches en memoria de s3_loader no se vacian (ver
+    swr_cache.clear_swr_caches).
+    """
+    global _almacen
+
+    with _lock:
+        _almacen = almacen
+
+
+def get_almacen_stats():
+    """
+    Tipo, ubicacion y contadores del almacen del proceso
+    """
+    return get_almacen().stats()
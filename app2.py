@@ -3,7 +3,10 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from s3_loader import load_municipios_data, load_geojson_municipios
-import unicodedata
+from normalizacion_municipios import normalizar_municipios
+from vistas_materializadas import ultimo_por_zona
+from metricas_derivadas import ultimas_metricas
+from geometria import nivel_para_zoom
 
 # Configuracion de la pagina
 st.set_page_config(
@@ -12,48 +15,26 @@ st.set_page_config(
     layout="wide"
 )
 
-# Funcion para normalizar nombres de municipios
-def normalizar_municipio(nombre):
-    """Normaliza el nombre del municipio para hacer matching"""
-    if pd.isna(nombre):
-        return nombre
-
-    # Remover acentos
-    nombre = ''.join(c for c in unicodedata.normalize('NFD', str(nombre))
-                     if unicodedata.category(c) != 'Mn')
-
-    # Casos especiales
-    mapeo = {
-        'El Astillero': 'Astillero (El)',
-        'Cabuerniga (Valle de)': 'Cabuerniga',
-        'Ribamontan al Mar': 'Ribamontán al Mar',
-        'Ribamontan al Monte': 'Ribamontán al Monte',
-        'Penagos': 'Penagos',
-        'Penarrubia': 'Peñarrubia',
-        'Bareyo': 'Bareyo',
-    }
-
-    return mapeo.get(nombre, nombre)
-
 # Titulo principal - version compacta
 st.title("🏠 Dashboard Inmobiliario - Cantabria")
 
 # Cargar datos desde S3
 try:
-    df = load_municipios_data()
+    # Solo se necesitan estas columnas: el resto no se lee del Parquet
+    df = load_municipios_data(columns=['municipio', 'fecha', 'precio_m2'])
 
     # Obtener datos mas recientes por municipio
-    df_reciente = df.sort_values('fecha').groupby('municipio').tail(1)
+    df_reciente = ultimo_por_zona(df, 'municipio')
 
-    # Cargar GeoJSON de municipios desde S3
-    geojson_municipios = load_geojson_municipios()
+    # Cargar GeoJSON de municipios desde S3 (simplificado para el zoom del mapa)
+    geojson_municipios = load_geojson_municipios(nivel=nivel_para_zoom(7.8))
 
     # Obtener todos los municipios del GeoJSON
     municipios_geojson = [f['properties']['NOMBRE'] for f in geojson_municipios['features']]
 
     # Preparar datos para el mapa - normalizar nombres
     df_mapa = df_reciente[['municipio', 'precio_m2']].copy()
-    df_mapa['municipio_norm'] = df_mapa['municipio'].apply(normalizar_municipio)
+    df_mapa['municipio_norm'] = normalizar_municipios(df_mapa['municipio'], municipios_geojson)
 
     # Crear DataFrame completo con TODOS los municipios del GeoJSON
     municipios_con_datos = dict(zip(df_mapa['municipio_norm'], df_mapa.to_dict('records')))
@@ -88,12 +69,8 @@ try:
         [1.0, '#d73027']     # Rojo (caro)
     ]
 
-    # Calcular variaciones mensuales para todos los municipios
-    df_sorted = df.sort_values(['municipio', 'fecha'])
-    df_sorted['variacion_mensual'] = df_sorted.groupby('municipio')['precio_m2'].pct_change() * 100
-
-    # Obtener la ultima variacion mensual para cada municipio
-    df_ultimas_variaciones = df_sorted.groupby('municipio').tail(1)[['municipio', 'variacion_mensual', 'precio_m2']].copy()
+    # Ultima variacion mensual de cada municipio (calculada una vez por version)
+    df_ultimas_variaciones = ultimas_metricas(df, 'municipio')[['municipio', 'variacion_mensual', 'precio_m2']]
     df_ultimas_variaciones = df_ultimas_variaciones.dropna(subset=['variacion_mensual'])
 
     # Top 5 municipios con mayores variaciones positivas y negativas
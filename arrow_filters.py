@@ -0,0 +1,98 @@
+"""
+Modulo con utilidades para filtros en formato pyarrow
+
+Los filtros siguen la convencion del argumento filters de pyarrow: una lista
+de tuplas (columna, operador, valor) o una lista de listas de tuplas.
+"""
+import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+def as_dnf(filters):
+    """
+    Devuelve los filtros como lista de conjunciones (forma normal disyuntiva)
+
+    Acepta una lista de tuplas (una sola conjuncion) o una lista de listas de
+    tuplas, igual que el argumento filters de pyarrow.
+    """
+    if not filters:
+        return None
+    if isinstance(filters[0][0], str):
+        return [[tuple(f) for f in filters]]
+    return [[tuple(f) for f in conjunction] for conjunction in filters]
+
+
+def coerce_filter_value(value, arrow_type):
+    """
+    Adapta el valor de un filtro al tipo de la columna en el Parquet
+    """
+    if isinstance(value, (list, tuple, set)):
+        return [coerce_filter_value(v, arrow_type) for v in value]
+    if pa.types.is_timestamp(arrow_type):
+        return pd.Timestamp(value)
+    if pa.types.is_date(arrow_type):
+        return pd.Timestamp(value).date()
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        if isinstance(value, (datetime.date, pd.Timestamp)):
+            return value.strftime('%Y-%m-%d')
+        return str(value)
+    return value
+
+
+def stats_may_match(statistics, op, value):
+    """
+    Indica si un row group puede contener filas que cumplan (op, value)
+    segun el minimo y maximo guardados en el footer del Parquet
+    """
+    if statistics is None or not statistics.has_min_max:
+        return True
+
+    col_min, col_max = statistics.min, statistics.max
+    try:
+        if isinstance(col_min, datetime.datetime):
+            col_min, col_max = pd.Timestamp(col_min), pd.Timestamp(col_max)
+
+        if op in ('=', '=='):
+            return col_min <= value <= col_max
+        if op == '!=':
+            return not (col_min == col_max == value)
+        if op == '<':
+            return col_min < value
+        if op == '<=':
+            return col_min <= value
+        if op == '>':
+            return col_max > value
+        if op == '>=':
+            return col_max >= value
+        if op == 'in':
+            return any(col_min <= v <= col_max for v in value)
+    except TypeError:
+        # Tipos no comparables: no se puede descartar el row group
+        return True
+
+    return True
+
+
+def filter_table(table, filters):
+    """
+    Aplica filtros sobre una tabla de Arrow ya cargada
+
+    Args:
+        table: Tabla de pyarrow
+        filters: Filtros en formato pyarrow sobre columnas de la tabla
+
+    Returns:
+        Tabla con las filas que cumplen los filtros
+    """
+    dnf = as_dnf(filters)
+    if dnf is None:
+        return table
+
+    dnf = [
+        [(name, op, coerce_filter_value(value, table.schema.field(name).type)) for name, op, value in conjunction]
+        for conjunction in dnf
+    ]
+    return table.filter(pq.filters_to_expression(dnf))
@@ -0,0 +1,220 @@
+"""
+Modulo con el almacen local de snapshots Arrow de los datasets procesados
+
+La salida de cada loader de dominio de s3_loader se guarda en disco como
+fichero Arrow IPC (Feather v2) sin comprimir, identificado por el nombre del
+dataset y su version. Los ficheros se abren con memory-map: la lectura no
+copia los buffers y el decodificado del Parquet se hace una sola vez por
+version del dataset, aunque haya varios procesos de Streamlit en la misma
+maquina o se reinicie la aplicacion.
+"""
+import functools
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+import pyarrow as pa
+import streamlit as st
+
+from arrow_filters import filter_table
+from trazas import span
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SNAPSHOTS_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'viviendas_cantabria', 'snapshots')
+
+# Version del contenido de los snapshots: se incrementa cuando cambia lo que
+# guardan los loaders (p.ej. columnas nuevas) para no servir snapshots antiguos
+SNAPSHOT_FORMAT = 2
+
+
+class SnapshotStore:
+    """
+    Directorio de snapshots Arrow IPC, uno por (dataset, version)
+    """
+
+    def __init__(self, snapshots_dir):
+        self.snapshots_dir = Path(snapshots_dir)
+        self.snapshots_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._stats = {'aciertos': 0, 'fallos': 0, 'escrituras': 0}
+
+    def _path(self, name, version):
+        digest = hashlib.sha256(f"{SNAPSHOT_FORMAT}:{version}".encode('utf-8')).hexdigest()[:16]
+        return self.snapshots_dir / f"{name}-{digest}.arrow"
+
+    def _count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def load(self, name, version, columns=None, filters=None):
+        """
+        Abre el snapshot de un dataset con memory-map
+
+        Args:
+            name: Nombre del dataset
+            version: Version del dataset (p.ej. ETag del objeto de origen)
+            columns: Columnas a devolver (None = todas)
+            filters: Filtros en formato pyarrow sobre las columnas del snapshot
+
+        Returns:
+            DataFrame de pandas, o None si no hay snapshot para esa version
+        """
+        path = self._path(name, version)
+        if not path.exists():
+            self._count('fallos')
+            return None
+
+        try:
+            source = pa.memory_map(str(path), 'r')
+            table = pa.ipc.open_file(source).read_all()
+        except (OSError, pa.ArrowInvalid) as e:
+            logger.warning("Snapshot %s ilegible, se descarta: %s", path, e)
+            self._count('fallos')
+            return None
+
+        table = filter_table(table, filters)
+        if columns is not None:
+            table = table.select([c for c in columns if c in table.column_names])
+
+        self._count('aciertos')
+        # split_blocks evita consolidar columnas: las numericas sin nulos
+        # quedan apuntando al fichero mapeado sin copiarse
+        return table.to_pandas(split_blocks=True)
+
+    def save(self, name, version, df):
+        """
+        Guarda el snapshot de un dataset y elimina los de versiones anteriores
+        """
+        path = self._path(name, version)
+        table = pa.Table.from_pandas(df)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.snapshots_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                with pa.ipc.new_file(f, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self._count('escrituras')
+
+        for old_path in self.snapshots_dir.glob(f"{name}-*.arrow"):
+            if old_path != path:
+                try:
+                    old_path.unlink()
+                except FileNotFoundError:
+                    pass
+
+    def stats(self):
+        """
+        Contadores de aciertos, fallos y escrituras
+        """
+        with self._lock:
+            return dict(self._stats)
+
+
+_lock = threading.Lock()
+_snapshot_store = None
+_snapshot_store_configured = False
+
+
+def _read_snapshots_config():
+    """
+    Lee la configuracion de los snapshots desde secrets.toml o variables de entorno
+    """
+    try:
+        cache_secrets = st.secrets.get("cache", {})
+        enabled = cache_secrets.get("snapshots", True)
+        snapshots_dir = cache_secrets.get("snapshots_dir", DEFAULT_SNAPSHOTS_DIR)
+    except:
+        enabled = os.environ.get('VIVIENDAS_SNAPSHOTS_ENABLED', '1') != '0'
+        snapshots_dir = os.environ.get('VIVIENDAS_SNAPSHOTS_DIR', DEFAULT_SNAPSHOTS_DIR)
+
+    return enabled, snapshots_dir
+
+
+def get_snapshot_store():
+    """
+    Devuelve el almacen de snapshots del proceso (None si esta desactivado)
+    """
+    global _snapshot_store, _snapshot_store_configured
+
+    if not _snapshot_store_configured:
+        with _lock:
+            if not _snapshot_store_configured:
+                enabled, snapshots_dir = _read_snapshots_config()
+                if enabled:
+                    try:
+                        _snapshot_store = SnapshotStore(snapshots_dir)
+                    except OSError as e:
+                        logger.warning("Snapshots desactivados (%s): %s", snapshots_dir, e)
+                _snapshot_store_configured = True
+
+    return _snapshot_store
+
+
+def arrow_snapshot(name, version_func):
+    """
+    Decorador que sirve un loader de dominio desde su snapshot Arrow
+
+    El loader decorado debe aceptar los argumentos columns y filters. Si
+    existe snapshot para la version actual se devuelve (aplicando columnas y
+    filtros sobre el snapshot) sin llamar al loader; si no, se llama al loader
+    y, cuando se ha cargado el dataset completo, se guarda el resultado.
+
+    Args:
+        name: Nombre del dataset
+        version_func: Funcion sin argumentos que devuelve la version actual
+
+    El DataFrame devuelto lleva la version en df.attrs['version'], el nombre
+    del dataset en df.attrs['dataset'] y las columnas y filtros pedidos en
+    df.attrs['proyeccion'].
+    """
+    def decorator(loader):
+        @functools.wraps(loader)
+        def wrapper(columns=None, filters=None):
+            store = get_snapshot_store()
+            try:
+                version = version_func()
+            except Exception as e:
+                # Sin version no hay snapshot posible: cargar directamente
+                logger.warning("No se pudo obtener la version de %s: %s", name, e)
+                return loader(columns=columns, filters=filters)
+
+            df = None
+            if store is not None:
+                with span('snapshot.lectura', dataset=name):
+                    df = store.load(name, version, columns=columns, filters=filters)
+
+            if df is None:
+                df = loader(columns=columns, filters=filters)
+                if store is not None and columns is None and filters is None:
+                    try:
+                        with span('snapshot.escritura', dataset=name):
+                            store.save(name, version, df)
+                    except (OSError, pa.ArrowException) as e:
+                        logger.warning("No se pudo guardar el snapshot de %s: %s", name, e)
+
+            df.attrs['version'] = version
+            df.attrs['dataset'] = name
+            df.attrs['proyeccion'] = repr((columns, filters))
+            return df
+
+        return wrapper
+
+    return decorator
+
+
+def get_snapshot_stats():
+    """
+    Estadisticas del almacen de snapshots (diccionario vacio si esta desactivado)
+    """
+    store = get_snapshot_store()
+    return store.stats() if store is not None else {}
@@ -0,0 +1,420 @@
+"""
+Benchmark de los loaders y las vistas con datos sinteticos a varias escalas
+
+Para cada escala genera los datos de datos_sinteticos, los deja en el
+almacen elegido (ver almacenamiento: un directorio local por defecto, la
+memoria o un bucket de un endpoint compatible con S3 como MinIO o moto) y
+mide en un proceso aparte:
+- Cada loader de s3_loader en frio (descarga, decodificacion y snapshot) y
+  en caliente (sin la cache en memoria, desde la cache en disco y el snapshot)
+- Las etapas de cada vista a partir de sus spans (ver trazas): transformacion,
+  construccion de figuras y serializacion de cada st.plotly_chart, en el
+  primer render (cache de figuras vacia) y en los siguientes
+- Con --particionado, la recarga de los historicos tras publicar un mes nuevo
+
+El proceso de cada escala arranca sin secrets.toml (HOME y directorio de
+trabajo temporales) y se configura con las variables de entorno de los
+modulos de la app, de modo que no usa los datos de produccion y las caches
+de una escala no contaminan la siguiente.
+
+Los resultados se pueden guardar como linea base y las ejecuciones
+siguientes marcan como regresion toda medida que la supere en mas de la
+tolerancia (y de un minimo absoluto, para no avisar por ruido).
+
+Uso:
+    python benchmark_datos.py --escalas 1,10,100 --guardar-baseline
+    python benchmark_datos.py --escalas 1,10,100
+    python benchmark_datos.py --escalas 1,10,100 --particionado
+    python benchmark_datos.py --almacen s3 --endpoint-url http://localhost:9000 --escalas 1,10
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from almacenamiento import TIPOS_ALMACEN
+from datos_sinteticos import ESCALAS, escribir_en_directorio, generar_objetos, subir_a_s3
+
+DEFAULT_BUCKET = 'viviendas-cantabria-benchmark'
+DEFAULT_BASELINE = 'benchmark_datos_baseline.json'
+DEFAULT_REPETICIONES = 3
+DEFAULT_TOLERANCIA = 0.25
+DEFAULT_MINIMO_MS = 5.0
+
+# Spans de las vistas que se miden como etapas
+SPANS_ETAPAS = ('figura.construccion', 'plotly_chart')
+SUFIJO_TRANSFORMACION = '.transformacion'
+
+
+def _loaders():
+    """
+    Loaders a medir: {nombre: (funcion, kwargs)}, con los mismos argumentos
+    que la precarga de app.py
+    """
+    from s3_loader import (
+        load_municipios_data, load_distritos_data, load_portales_data,
+        load_secciones_santander_portales_data, load_geojson_municipios, load_geojson_santander,
+    )
+    from vistas import NIVEL_MAPA_CANTABRIA, NIVEL_MAPA_SANTANDER
+
+    return {
+        'municipios': (load_municipios_data, {}),
+        'distritos': (load_distritos_data, {}),
+        'portales': (load_portales_data, {}),
+        'secciones_santander': (load_secciones_santander_portales_data, {}),
+        'geojson_municipios': (load_geojson_municipios, {'nivel': NIVEL_MAPA_CANTABRIA}),
+        'geojson_santander': (load_geojson_santander, {'nivel': NIVEL_MAPA_SANTANDER}),
+    }
+
+
+def _cronometrar(funcion, **kwargs):
+    inicio = time.perf_counter()
+    resultado = funcion(**kwargs)
+    return resultado, (time.perf_counter() - inicio) * 1000
+
+
+def medir_loaders(repeticiones):
+    """
+    Mide cada loader en frio y en caliente
+
+    En frio es la primera llamada del proceso, con las caches en disco
+    vacias. En caliente se vacian antes las caches en memoria de s3_loader,
+    de modo que se sirve de la cache en disco y de los snapshots Arrow, como
+    tras reiniciar la app.
+
+    Returns:
+        Tupla ({loader: {'frio_ms', 'caliente_ms'}}, {loader: filas o features})
+    """
+    from swr_cache import clear_swr_caches
+
+    resultados, tamanos = {}, {}
+    for nombre, (loader, kwargs) in _loaders().items():
+        datos, frio = _cronometrar(loader, **kwargs)
+        calientes = []
+        for _ in range(repeticiones):
+            clear_swr_caches()
+            _, ms = _cronometrar(loader, **kwargs)
+            calientes.append(ms)
+
+        resultados[nombre] = {'frio_ms': frio, 'caliente_ms': statistics.median(calientes)}
+        tamanos[nombre] = len(datos['features']) if isinstance(datos, dict) else len(datos)
+    return resultados, tamanos
+
+
+def medir_incremental(repeticiones):
+    """
+    Con los historicos particionados, mide la recarga de cada uno tras
+    publicar un mes nuevo (una particion mas), que solo descarga esa particion
+
+    Returns:
+        {loader: ms de la recarga (mediana)}
+    """
+    import pandas as pd
+    from almacenamiento import get_almacen
+    from particiones import COLUMNA_PARTICION, get_dataset_particionado, particionar, prefijo_particionado
+    from s3_loader import DATASETS_PARTICIONADOS, MUNICIPIOS_KEY, DISTRITOS_KEY
+    from swr_cache import clear_swr_caches
+
+    loaders = _loaders()
+    nombres = {MUNICIPIOS_KEY: 'municipios', DISTRITOS_KEY: 'distritos'}
+    almacen = get_almacen()
+    resultados = {}
+    for clave in DATASETS_PARTICIONADOS:
+        loader, kwargs = loaders[nombres[clave]]
+        dataset = get_dataset_particionado(prefijo_particionado(clave))
+        tiempos = []
+        for _ in range(repeticiones):
+            # Los precios del ultimo mes publicados como los del siguiente
+            valor, ficheros = max(dataset.listar().items())
+            df = pd.concat(pd.read_parquet(io.BytesIO(almacen.descargar(clave_fichero)[0])) for clave_fichero in ficheros)
+            df[COLUMNA_PARTICION] = pd.Timestamp(valor) + pd.DateOffset(months=1)
+            for clave_nueva, contenido in particionar(df, dataset.prefijo).items():
+                almacen.guardar(clave_nueva, contenido)
+            # Volver a listar para que la version vea la particion nueva sin
+            # esperar a que caduque el listado
+            dataset.listar()
+
+            clear_swr_caches()
+            _, ms = _cronometrar(loader, **kwargs)
+            tiempos.append(ms)
+        resultados[nombres[clave]] = statistics.median(tiempos)
+    return resultados
+
+
+def _etapas(traza, modulo):
+    """
+    Milisegundos de cada etapa de una vista en una traza
+    """
+    etapas = {}
+    for s in traza.a_diccionario()['spans']:
+        if s['nombre'].endswith(SUFIJO_TRANSFORMACION):
+            etapa = 'transformacion'
+        elif s['nombre'] in SPANS_ETAPAS:
+            etapa = f"{s['nombre']}[{s['atributos'].get('figura')}]"
+        else:
+            continue
+        etapas[f"{modulo}/{etapa}"] = etapas.get(f"{modulo}/{etapa}", 0.0) + s['duracion_ms']
+    return etapas
+
+
+def medir_vistas(repeticiones):
+    """
+    Mide las etapas de cada vista en el primer render y en los siguientes
+
+    Las vistas se ejecutan fuera de una sesion de Streamlit: los widgets
+    devuelven su valor por defecto y los elementos se construyen (y las
+    figuras se serializan) sin enviarse a ningun navegador.
+
+    Returns:
+        Diccionario {vista/etapa: {'frio_ms', 'caliente_ms'}}
+    """
+    from s3_loader import load_municipios_data, load_distritos_data, load_portales_data
+    from trazas import iniciar_traza, finalizar_traza
+    from vistas import VISTAS, DatosApp, cargar_vista
+    from vistas_materializadas import resumen_por_zona
+
+    # Los mismos datos comunes que prepara app.py
+    municipios, distritos = load_municipios_data(), load_distritos_data()
+    datos_app = DatosApp(
+        municipios=municipios,
+        distritos=distritos,
+        portales=load_portales_data(),
+        resumen_municipios=resumen_por_zona(municipios, 'municipio'),
+        resumen_distritos=resumen_por_zona(distritos, 'distrito'),
+    )
+    # La primera figura del proceso paga la carga de los validadores de Plotly,
+    # que no es de ninguna vista
+    import plotly.express as px
+    import streamlit as st
+    st.plotly_chart(px.bar(x=[0], y=[0]))
+
+    resultados = {}
+    for nombre, modulo in VISTAS.items():
+        vista = cargar_vista(nombre)
+        renders = []
+        for _ in range(repeticiones + 1):
+            iniciar_traza('benchmark')
+            vista.mostrar(datos_app)
+            renders.append(_etapas(finalizar_traza(), modulo))
+
+        for etapa in sorted(set().union(*renders)):
+            resultados[etapa] = {
+                'frio_ms': renders[0].get(etapa, 0.0),
+                'caliente_ms': statistics.median(r.get(etapa, 0.0) for r in renders[1:]),
+            }
+    return resultados
+
+
+def medir_escala(escala, repeticiones):
+    """
+    Mide una escala en el proceso actual (configurado por el proceso padre)
+    """
+    # Fuera de una sesion Streamlit avisa en cada llamada de que falta el contexto
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+
+    inicio = time.perf_counter()
+    loaders, tamanos = medir_loaders(repeticiones)
+    vistas = medir_vistas(repeticiones)
+
+    from particiones import particionado_enabled
+    if particionado_enabled():
+        for nombre, ms in medir_incremental(repeticiones).items():
+            loaders[nombre]['incremental_ms'] = ms
+    return {
+        'escala': escala,
+        'tamanos': tamanos,
+        'loaders': loaders,
+        'vistas': vistas,
+        'segundos': time.perf_counter() - inicio,
+    }
+
+
+def _entorno_proceso(directorio, args):
+    """
+    Variables de entorno del proceso de una escala
+    """
+    entorno = dict(os.environ)
+    if args.almacen == 's3':
+        entorno.update({'AWS_ENDPOINT_URL': args.endpoint_url, 'S3_BUCKET': args.bucket})
+    entorno.update({
+        'HOME': directorio,
+        'PYTHONPATH': os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(__file__)), os.environ.get('PYTHONPATH')])),
+        'VIVIENDAS_ALMACENAMIENTO': args.almacen,
+        'VIVIENDAS_ALMACENAMIENTO_DIR': os.path.join(directorio, 'datos'),
+        'VIVIENDAS_CACHE_DIR': os.path.join(directorio, 'cache'),
+        'VIVIENDAS_SNAPSHOTS_DIR': os.path.join(directorio, 'snapshots'),
+        'VIVIENDAS_COMPACT_SCHEMA': '1' if args.compact_schema else '0',
+        'VIVIENDAS_PARTICIONADO': '1' if args.particionado else '0',
+    })
+    return entorno
+
+
+def ejecutar_escala(escala, args):
+    """
+    Deja los datos de una escala en el almacen y la mide en un proceso nuevo
+    """
+    objetos = generar_objetos(escala, args.semilla, args.particionado)
+
+    with tempfile.TemporaryDirectory(prefix='benchmark_datos_') as directorio:
+        if args.almacen == 's3':
+            import boto3
+            s3_client = boto3.client('s3', endpoint_url=args.endpoint_url, region_name=os.environ.get('AWS_REGION', 'eu-west-1'))
+            subir_a_s3(objetos, s3_client, args.bucket)
+        else:
+            escribir_en_directorio(objetos, os.path.join(directorio, 'datos'))
+
+        proceso = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--medir-escala', str(escala), '--repeticiones', str(args.repeticiones)],
+            cwd=directorio,
+            env=_entorno_proceso(directorio, args),
+            capture_output=True,
+            text=True,
+        )
+    if proceso.returncode != 0:
+        raise RuntimeError(f"Fallo la medicion de la escala {escala}:\n{proceso.stderr[-2000:]}")
+
+    resultado = json.loads(proceso.stdout.strip().splitlines()[-1])
+    resultado['bytes'] = {}
+    for clave, contenido in objetos.items():
+        # Las particiones de un dataset cuentan juntas bajo su prefijo
+        clave = re.sub(r'[^/]+=[^/]+/[^/]+$', '', clave)
+        resultado['bytes'][clave] = resultado['bytes'].get(clave, 0) + len(contenido)
+    return resultado
+
+
+def aplanar(resultados):
+    """
+    Medidas como {'escala/grupo/nombre/modo': ms}
+    """
+    medidas = {}
+    for escala, resultado in resultados['escalas'].items():
+        for grupo in ('loaders', 'vistas'):
+            for nombre, modos in resultado[grupo].items():
+                for modo, ms in modos.items():
+                    medidas[f"{escala}x/{grupo}/{nombre}/{modo}"] = ms
+    return medidas
+
+
+def comparar(resultados, baseline, tolerancia=DEFAULT_TOLERANCIA, minimo_ms=DEFAULT_MINIMO_MS):
+    """
+    Medidas que empeoran respecto a la linea base
+
+    Returns:
+        Lista de (medida, ms de la linea base, ms actuales), de mayor a menor
+        empeoramiento relativo
+    """
+    base = aplanar(baseline)
+    regresiones = []
+    for medida, ms in aplanar(resultados).items():
+        anterior = base.get(medida)
+        if anterior is None:
+            continue
+        if ms > anterior * (1 + tolerancia) and ms - anterior > minimo_ms:
+            regresiones.append((medida, anterior, ms))
+    return sorted(regresiones, key=lambda r: r[2] / max(r[1], 1e-9), reverse=True)
+
+
+def _imprimir(resultado):
+    print(f"\n=== Escala {resultado['escala']}x ({resultado['segundos']:.1f} s) ===")
+    for clave, num_bytes in resultado['bytes'].items():
+        print(f"{clave}: {num_bytes / 1e6:.2f} MB")
+    print(f"{'loader':<22}{'filas':>9}{'frio ms':>10}{'caliente ms':>13}{'mes nuevo ms':>14}")
+    for nombre, modos in resultado['loaders'].items():
+        incremental = f"{modos['incremental_ms']:>14.1f}" if 'incremental_ms' in modos else ''
+        print(f"{nombre:<22}{resultado['tamanos'][nombre]:>9}{modos['frio_ms']:>10.1f}{modos['caliente_ms']:>13.1f}{incremental}")
+    print(f"{'etapa de vista':<60}{'frio ms':>10}{'caliente ms':>13}")
+    for etapa, modos in resultado['vistas'].items():
+        print(f"{etapa:<60}{modos['frio_ms']:>10.1f}{modos['caliente_ms']:>13.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de loaders y vistas con datos sinteticos")
+    parser.add_argument('--almacen', choices=TIPOS_ALMACEN, default='local',
+                        help="Almacen del que leen los loaders (ver almacenamiento)")
+    parser.add_argument('--endpoint-url', default=os.environ.get('AWS_ENDPOINT_URL'),
+                        help="Con --almacen s3: endpoint compatible con S3 donde subir los datos (MinIO, moto...)")
+    parser.add_argument('--bucket', default=DEFAULT_BUCKET)
+    parser.add_argument('--escalas', default=','.join(str(e) for e in ESCALAS),
+                        help="Escalas separadas por comas")
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--repeticiones', type=int, default=DEFAULT_REPETICIONES,
+                        help="Mediciones en caliente por loader y vista (se toma la mediana)")
+    parser.add_argument('--compact-schema', action='store_true', help="Medir con compact_schema activado")
+    parser.add_argument('--particionado', action='store_true',
+                        help="Historicos particionados por fecha; mide tambien la recarga tras un mes nuevo")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Fichero JSON con la linea base")
+    parser.add_argument('--guardar-baseline', action='store_true', help="Guardar los resultados como linea base")
+    parser.add_argument('--tolerancia', type=float, default=DEFAULT_TOLERANCIA,
+                        help="Empeoramiento relativo que se marca como regresion")
+    parser.add_argument('--minimo-ms', type=float, default=DEFAULT_MINIMO_MS,
+                        help="Empeoramiento absoluto minimo para marcar una regresion")
+    parser.add_argument('--json', action='store_true', help="Imprimir los resultados en JSON")
+    parser.add_argument('--medir-escala', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.medir_escala is not None:
+        # Proceso de una escala lanzado por ejecutar_escala
+        print(json.dumps(medir_escala(args.medir_escala, args.repeticiones)))
+        return
+
+    if args.almacen == 's3' and not args.endpoint_url:
+        parser.error("Indica --endpoint-url (o AWS_ENDPOINT_URL): el benchmark no se ejecuta contra el bucket de produccion")
+
+    # Credenciales de relleno para endpoints locales que aceptan cualquiera (moto)
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+
+    resultados = {
+        'entorno': {
+            'python': platform.python_version(),
+            'almacen': args.almacen,
+            'plataforma': platform.platform(),
+            'compact_schema': args.compact_schema,
+            'particionado': args.particionado,
+            'semilla': args.semilla,
+            'repeticiones': args.repeticiones,
+        },
+        'escalas': {},
+    }
+    for escala in (int(e) for e in args.escalas.split(',')):
+        resultado = ejecutar_escala(escala, args)
+        resultados['escalas'][str(escala)] = resultado
+        if not args.json:
+            _imprimir(resultado)
+
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+
+    if args.guardar_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(resultados, f, indent=2)
+        print(f"\nLinea base guardada en {args.baseline}", file=sys.stderr)
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"\nSin linea base ({args.baseline}): ejecuta con --guardar-baseline para crearla", file=sys.stderr)
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regresiones = comparar(resultados, baseline, args.tolerancia, args.minimo_ms)
+    if not regresiones:
+        print(f"\nSin regresiones respecto a {args.baseline} (tolerancia {args.tolerancia:.0%})", file=sys.stderr)
+        return
+
+    print(f"\n{len(regresiones)} regresiones respecto a {args.baseline} (tolerancia {args.tolerancia:.0%}):", file=sys.stderr)
+    for medida, anterior, ms in regresiones:
+        print(f"  {medida}: {anterior:.1f} ms -> {ms:.1f} ms ({ms / max(anterior, 1e-9) - 1:+.0%})", file=sys.stderr)
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
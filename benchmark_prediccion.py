@@ -0,0 +1,157 @@
+"""
+Benchmark del cliente de prediccion contra el servidor local
+
+Para cada nivel de concurrencia envia un lote de consultas con el mismo
+camino que la prediccion por lotes de la app (prediccion_lotes.predecir_lote
+sobre un ClientePrediccion) y mide la latencia de cada consulta, incluidos
+los reintentos, y el rendimiento del lote.
+
+Uso:
+    python benchmark_prediccion.py --consultas 200 --concurrencia 1,4,8,16 --latencia-ms 80 --tasa-errores 0.05
+
+Con --url se mide contra un servidor ya arrancado (p.ej. el local con otra
+configuracion) en lugar de arrancar uno en el propio proceso.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from prediccion_api import ClientePrediccion
+from prediccion_lotes import COLUMNA_ERROR, predecir_lote
+from servidor_prediccion_local import ConfigServidor, iniciar_en_segundo_plano
+
+MUNICIPIOS_BENCHMARK = ['Santander', 'Torrelavega', 'Castro-Urdiales', 'Laredo', 'Camargo', 'Piélagos']
+
+
+class _ClienteCronometrado(ClientePrediccion):
+    """
+    ClientePrediccion que guarda la duracion exacta de cada consulta
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.duraciones = []
+
+    def predecir(self, payload, api_key):
+        inicio = time.perf_counter()
+        try:
+            return super().predecir(payload, api_key)
+        finally:
+            duracion = time.perf_counter() - inicio
+            with self._lock:
+                self.duraciones.append(duracion)
+
+
+def lote_sintetico(consultas, semilla=0):
+    """
+    DataFrame de inmuebles con las columnas del formulario
+    """
+    rng = np.random.default_rng(semilla)
+    return pd.DataFrame({
+        'm2_construidos': rng.integers(40, 250, consultas),
+        'habitaciones': rng.integers(1, 6, consultas),
+        'banos': rng.integers(1, 4, consultas),
+        'municipio': rng.choice(MUNICIPIOS_BENCHMARK, consultas),
+        'tipo_inmueble': rng.choice(['piso', 'chalet', 'adosado', 'duplex'], consultas),
+        'estado': rng.choice(['buen_estado', 'a_reformar', 'nuevo'], consultas),
+    })
+
+
+def medir(url, df, concurrencia, api_key='benchmark', **config_cliente):
+    """
+    Envia el lote con una concurrencia y devuelve sus metricas
+
+    Returns:
+        Diccionario con consultas, errores, reintentos, percentiles (ms) y
+        consultas por segundo
+    """
+    cliente = _ClienteCronometrado(api_url=url, **config_cliente)
+    inicio = time.perf_counter()
+    resultados = dict(predecir_lote(df, api_key, concurrencia=concurrencia, peticiones_por_segundo=0, cliente=cliente))
+    segundos = time.perf_counter() - inicio
+    cliente.session.close()
+
+    duraciones_ms = np.array(cliente.duraciones) * 1000
+    p50, p95, p99 = np.percentile(duraciones_ms, [50, 95, 99]) if len(duraciones_ms) else (np.nan,) * 3
+    stats = cliente.stats()
+    return {
+        'concurrencia': concurrencia,
+        'consultas': len(resultados),
+        'errores': sum(COLUMNA_ERROR in r for r in resultados.values()),
+        'reintentos': stats['reintentos'],
+        'p50_ms': round(float(p50), 1),
+        'p95_ms': round(float(p95), 1),
+        'p99_ms': round(float(p99), 1),
+        'consultas_por_segundo': round(len(resultados) / segundos, 1) if segundos else None,
+        'segundos': round(segundos, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del cliente de prediccion")
+    parser.add_argument('--url', default=None, help="URL de /predict (por defecto arranca el servidor local)")
+    parser.add_argument('--api-key', default='benchmark')
+    parser.add_argument('--consultas', type=int, default=200, help="Consultas por nivel de concurrencia")
+    parser.add_argument('--concurrencia', default='1,2,4,8,16', help="Niveles de concurrencia separados por comas")
+    parser.add_argument('--latencia-ms', type=float, default=50.0)
+    parser.add_argument('--jitter-ms', type=float, default=20.0)
+    parser.add_argument('--arranque-frio', type=float, default=0.0)
+    parser.add_argument('--arranque-frio-ms', type=float, default=1500.0)
+    parser.add_argument('--tasa-errores', type=float, default=0.0)
+    parser.add_argument('--tasa-cortes', type=float, default=0.0)
+    parser.add_argument('--read-timeout', type=float, default=None)
+    parser.add_argument('--max-reintentos', type=int, default=None)
+    parser.add_argument('--backoff', type=float, default=None)
+    parser.add_argument('--json', default=None, help="Fichero donde guardar los resultados")
+    args = parser.parse_args()
+
+    servidor = None
+    url = args.url
+    if url is None:
+        config = ConfigServidor(
+            latencia_ms=args.latencia_ms,
+            jitter_ms=args.jitter_ms,
+            arranque_frio=args.arranque_frio,
+            arranque_frio_ms=args.arranque_frio_ms,
+            tasa_errores=args.tasa_errores,
+            tasa_cortes=args.tasa_cortes,
+            semilla=0,
+        )
+        servidor, url = iniciar_en_segundo_plano(config)
+
+    config_cliente = {
+        nombre: valor for nombre, valor in (
+            ('read_timeout', args.read_timeout),
+            ('max_reintentos', args.max_reintentos),
+            ('backoff', args.backoff),
+        ) if valor is not None
+    }
+
+    df = lote_sintetico(args.consultas)
+    filas = []
+    try:
+        for concurrencia in [int(c) for c in args.concurrencia.split(',') if c]:
+            fila = medir(url, df, concurrencia, args.api_key, **config_cliente)
+            filas.append(fila)
+            print(
+                f"concurrencia {fila['concurrencia']:>3}: {fila['consultas']} consultas "
+                f"({fila['errores']} errores, {fila['reintentos']} reintentos) · "
+                f"p50 {fila['p50_ms']} ms · p95 {fila['p95_ms']} ms · p99 {fila['p99_ms']} ms · "
+                f"{fila['consultas_por_segundo']} consultas/s",
+                flush=True,
+            )
+    finally:
+        if servidor is not None:
+            servidor.shutdown()
+            servidor.server_close()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'url': url, 'resultados': filas}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""
+Modulo con la cache de figuras de Plotly ya construidas
+
+Cada figura se guarda con la clave (vista, parametros, versiones de los
+datos). En un rerun en el que no cambia nada de eso (p.ej. al abrir un
+expander o tocar un widget de otra vista) la figura se sirve desde la cache
+sin volver a llamar a Plotly Express. La cache es comun a todas las sesiones,
+tiene un numero maximo de figuras y desaloja la usada hace mas tiempo.
+
+Las figuras devueltas se comparten: no deben modificarse despues de
+obtenerlas.
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import streamlit as st
+
+from trazas import span
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_FIGURAS = 64
+
+
+def _congelar(valor):
+    """
+    Convierte listas, diccionarios y conjuntos en tuplas para usarlos en claves
+    """
+    if isinstance(valor, dict):
+        return tuple(sorted((k, _congelar(v)) for k, v in valor.items()))
+    if isinstance(valor, (list, tuple)):
+        return tuple(_congelar(v) for v in valor)
+    if isinstance(valor, (set, frozenset)):
+        return tuple(sorted(_congelar(v) for v in valor))
+    return valor
+
+
+def versiones_de(*datos):
+    """
+    Versiones de los datos de una figura para la clave de la cache
+
+    Los DataFrames aportan df.attrs['version'] (la fijan los loaders de
+    s3_loader); el resto de valores se usan tal cual.
+    """
+    return tuple(
+        dato.attrs.get('version') if isinstance(dato, pd.DataFrame) else dato
+        for dato in datos
+    )
+
+
+class CacheFiguras:
+    """
+    Cache LRU de figuras con contadores por vista
+    """
+
+    def __init__(self, max_figuras=DEFAULT_MAX_FIGURAS):
+        self.max_figuras = max_figuras
+        self._figuras = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _count(self, vista, stat):
+        contadores = self._stats.setdefault(vista, {'aciertos': 0, 'fallos': 0, 'desalojos': 0, 'sin_version': 0})
+        contadores[stat] += 1
+
+    def obtener(self, vista, parametros, versiones, construir):
+        """
+        Devuelve la figura de la cache o la construye y la guarda
+
+        Args:
+            vista: Nombre de la vista o grafico
+            parametros: Valores de los widgets que afectan a la figura
+            versiones: Versiones de los datos usados (p.ej. df.attrs['version'])
+            construir: Funcion sin argumentos que construye la figura
+
+        Si alguna version es None (datos sin version conocida) la figura se
+        construye sin guardarla.
+        """
+        if any(version is None for version in versiones):
+            with self._lock:
+                self._count(vista, 'sin_version')
+            with span('figura.construccion', figura=vista):
+                return construir()
+
+        clave = (vista, _congelar(parametros), _congelar(versiones))
+        with self._lock:
+            figura = self._figuras.get(clave)
+            if figura is not None:
+                self._figuras.move_to_end(clave)
+                self._count(vista, 'aciertos')
+                return figura
+
+        with span('figura.construccion', figura=vista):
+            figura = construir()
+
+        with self._lock:
+            self._count(vista, 'fallos')
+            self._figuras[clave] = figura
+            self._figuras.move_to_end(clave)
+            while len(self._figuras) > self.max_figuras:
+                clave_desalojada, _ = self._figuras.popitem(last=False)
+                self._count(clave_desalojada[0], 'desalojos')
+        return figura
+
+    def stats(self):
+        """
+        Aciertos, fallos, desalojos y tasa de aciertos de cada vista
+        """
+        with self._lock:
+            resultado = {}
+            for vista, contadores in self._stats.items():
+                total = contadores['aciertos'] + contadores['fallos'] + contadores['sin_version']
+                resultado[vista] = dict(
+                    contadores,
+                    tasa_aciertos=contadores['aciertos'] / total if total else 0.0,
+                )
+            resultado['_figuras'] = len(self._figuras)
+            return resultado
+
+
+_lock = threading.Lock()
+_cache_figuras = None
+
+
+def _read_max_figuras():
+    """
+    Lee el numero maximo de figuras desde secrets.toml o variables de entorno
+    """
+    try:
+        return int(st.secrets.get("cache", {}).get("max_figuras", DEFAULT_MAX_FIGURAS))
+    except:
+        return int(os.environ.get('VIVIENDAS_CACHE_MAX_FIGURAS', DEFAULT_MAX_FIGURAS))
+
+
+def get_cache_figuras():
+    """
+    Devuelve la cache de figuras del proceso
+    """
+    global _cache_figuras
+
+    if _cache_figuras is None:
+        with _lock:
+            if _cache_figuras is None:
+                _cache_figuras = CacheFiguras(_read_max_figuras())
+    return _cache_figuras
+
+
+def figura_cacheada(vista, parametros, versiones, construir):
+    """
+    Atajo de get_cache_figuras().obtener(...)
+    """
+    return get_cache_figuras().obtener(vista, parametros, versiones, construir)
+
+
+def get_cache_figuras_stats():
+    """
+    Estadisticas de la cache de figuras
+    """
+    return get_cache_figuras().stats()
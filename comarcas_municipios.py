@@ -1,3 +1,10 @@
+import functools
+
+import numpy as np
+import pandas as pd
+
+from coordenadas_municipios import tabla_coordenadas
+
 # Mapeo de municipios a comarcas de Cantabria
 MUNICIPIOS_COMARCAS = {
     # Comarca Santander
@@ -160,3 +167,50 @@ MUNICIPIOS_COMARCAS = {
 def obtener_comarca(municipio):
     """Obtiene la comarca de un municipio"""
     return MUNICIPIOS_COMARCAS.get(municipio, 'Desconocida')
+
+COMARCA_DESCONOCIDA = 'Desconocida'
+
+# Columnas que añade enriquecer_municipios
+COLUMNAS_ENRIQUECIMIENTO = ['comarca', 'lat', 'lon']
+
+@functools.lru_cache(maxsize=1)
+def tabla_municipios():
+    """
+    Tabla de referencia municipio -> comarca, lat, lon (una vez por proceso)
+    """
+    tabla = pd.Series(MUNICIPIOS_COMARCAS, name='comarca').to_frame().join(tabla_coordenadas(), how='outer')
+    tabla['comarca'] = tabla['comarca'].fillna(COMARCA_DESCONOCIDA)
+    return tabla
+
+def enriquecer_municipios(df, columna='municipio', columnas=None):
+    """
+    Añade comarca, lat y lon a un DataFrame con una columna de municipio
+
+    La tabla de referencia se cruza una sola vez con los valores distintos de
+    la columna (o con sus categorias si es categorica) y el resultado se
+    reparte a las filas por codigo, sin recorrer las filas en Python.
+
+    Args:
+        df: DataFrame a enriquecer (no se modifica)
+        columna: Columna con el nombre del municipio
+        columnas: Columnas a añadir (por defecto COLUMNAS_ENRIQUECIMIENTO)
+
+    Returns:
+        Copia superficial del DataFrame con las columnas añadidas
+    """
+    claves = df[columna]
+    if isinstance(claves.dtype, pd.CategoricalDtype):
+        codigos = claves.cat.codes.to_numpy()
+        valores = claves.cat.categories
+    else:
+        codigos, valores = pd.factorize(claves)
+
+    referencia = tabla_municipios().reindex(valores)
+    resultado = df.copy(deep=False)
+    for nombre in columnas or COLUMNAS_ENRIQUECIMIENTO:
+        por_defecto = COMARCA_DESCONOCIDA if nombre == 'comarca' else np.nan
+        # El ultimo elemento recoge los codigos -1 (municipio nulo)
+        tabla = np.append(referencia[nombre].fillna(por_defecto).to_numpy(), por_defecto)
+        resultado[nombre] = tabla[codigos]
+
+    return resultado
@@ -0,0 +1,157 @@
+"""
+Modulo con el esquema compacto (opcional) de los datasets cargados
+
+Convierte las etiquetas de baja cardinalidad (municipio, distrito, comarca,
+seccion, fecha_texto) en categoricas con categorias compartidas entre
+datasets y reduce los numericos a float32 o enteros estrechos cuando no se
+pierde precision. Asi los groupby, isin y merge trabajan sobre codigos
+enteros en lugar de hashear cadenas de Python.
+
+Se activa con compact_schema = true en la seccion [datos] de secrets.toml o
+con la variable de entorno VIVIENDAS_COMPACT_SCHEMA=1.
+"""
+import functools
+import logging
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from comarcas_municipios import MUNICIPIOS_COMARCAS
+from coordenadas_municipios import COORDENADAS_MUNICIPIOS
+from trazas import span
+
+logger = logging.getLogger(__name__)
+
+# Columnas de etiquetas que se convierten siempre a categoricas
+LABEL_COLUMNS = ['municipio', 'distrito', 'comarca', 'seccion', 'fecha_texto']
+
+# Otras columnas de texto se convierten si tienen menos valores distintos que
+# esta fraccion de las filas
+MAX_CARDINALITY_RATIO = 0.5
+
+# Error relativo maximo admitido al pasar de float64 a float32
+FLOAT32_RTOL = 1e-6
+
+_lock = threading.Lock()
+_shared_categories = {
+    # Categorias iniciales conocidas para que todos los datasets coincidan
+    'municipio': set(MUNICIPIOS_COMARCAS) | set(COORDENADAS_MUNICIPIOS),
+    'comarca': set(MUNICIPIOS_COMARCAS.values()) | {'Desconocida'},
+}
+_shared_dtypes = {}
+_memory_report = {}
+
+
+def compact_schema_enabled():
+    """
+    Indica si esta activado el esquema compacto
+    """
+    try:
+        return bool(st.secrets.get("datos", {}).get("compact_schema", False))
+    except:
+        return os.environ.get('VIVIENDAS_COMPACT_SCHEMA', '0') == '1'
+
+
+def _shared_dtype(column, values):
+    """
+    Devuelve el CategoricalDtype compartido de una columna que incluye values
+
+    Si aparecen valores nuevos el dtype compartido se amplia; los datasets
+    convertidos antes conservan el anterior (sus merges con los nuevos
+    funcionan igual, aunque sin la ventaja de los codigos comunes).
+    """
+    with _lock:
+        dtype = _shared_dtypes.get(column)
+        if dtype is not None and set(values) <= set(dtype.categories):
+            return dtype
+
+        categories = _shared_categories.setdefault(column, set())
+        categories.update(values)
+        dtype = pd.CategoricalDtype(sorted(categories))
+        _shared_dtypes[column] = dtype
+        return dtype
+
+
+def _compact_float(series):
+    """
+    Convierte una serie float64 a float32 si el error relativo es despreciable
+    """
+    values = series.to_numpy()
+    as_float32 = values.astype(np.float32)
+    if np.allclose(values, as_float32, rtol=FLOAT32_RTOL, atol=0, equal_nan=True):
+        return pd.Series(as_float32, index=series.index, name=series.name)
+    return series
+
+
+def compact_frame(df, name=None):
+    """
+    Devuelve una copia del DataFrame con el esquema compacto
+
+    Args:
+        df: DataFrame a compactar
+        name: Nombre del dataset para el informe de memoria
+
+    Returns:
+        DataFrame compactado (los attrs se conservan)
+    """
+    memory_before = int(df.memory_usage(deep=True).sum())
+    compact = df.copy(deep=False)
+
+    for column in compact.columns:
+        series = compact[column]
+        dtype = series.dtype
+
+        if dtype == object or pd.api.types.is_string_dtype(dtype):
+            if pd.api.types.infer_dtype(series, skipna=True) != 'string':
+                continue
+            unique_values = series.dropna().unique()
+            if column in LABEL_COLUMNS:
+                compact[column] = series.astype(_shared_dtype(column, unique_values))
+            elif len(unique_values) < MAX_CARDINALITY_RATIO * len(series):
+                compact[column] = series.astype('category')
+        elif pd.api.types.is_float_dtype(dtype) and dtype == np.float64:
+            compact[column] = _compact_float(series)
+        elif pd.api.types.is_integer_dtype(dtype) and not pd.api.types.is_extension_array_dtype(dtype):
+            compact[column] = pd.to_numeric(series, downcast='integer')
+
+    memory_after = int(compact.memory_usage(deep=True).sum())
+    if name is not None:
+        with _lock:
+            _memory_report[name] = {'bytes_antes': memory_before, 'bytes_despues': memory_after}
+        logger.info(
+            "Esquema compacto %s: %.1f KB -> %.1f KB",
+            name, memory_before / 1024, memory_after / 1024,
+        )
+
+    return compact
+
+
+def compact_dataset(name):
+    """
+    Decorador que aplica el esquema compacto a la salida de un loader
+
+    Solo actua si compact_schema_enabled() es cierto.
+    """
+    def decorator(loader):
+        @functools.wraps(loader)
+        def wrapper(*args, **kwargs):
+            df = loader(*args, **kwargs)
+            if compact_schema_enabled():
+                with span('compactacion', dataset=name):
+                    df = compact_frame(df, name=name)
+            return df
+
+        return wrapper
+
+    return decorator
+
+
+def get_compact_report():
+    """
+    Memoria de cada dataset antes y despues de compactar (en bytes)
+    """
+    with _lock:
+        return {name: dict(report) for name, report in _memory_report.items()}
@@ -1,3 +1,7 @@
+import functools
+
+import pandas as pd
+
 # Coordenadas (latitud, longitud) de municipios de Cantabria
 COORDENADAS_MUNICIPIOS = {
     'Santander': (43.4623, -3.8099),
@@ -130,3 +134,8 @@ COORDENADAS_MUNICIPIOS = {
 def obtener_coordenadas(municipio):
     """Obtiene las coordenadas de un municipio"""
     return COORDENADAS_MUNICIPIOS.get(municipio, None)
+
+@functools.lru_cache(maxsize=1)
+def tabla_coordenadas():
+    """Tabla municipio -> lat, lon con las coordenadas conocidas"""
+    return pd.DataFrame.from_dict(COORDENADAS_MUNICIPIOS, orient='index', columns=['lat', 'lon'])
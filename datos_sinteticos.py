@@ -0,0 +1,327 @@
+"""
+Generador determinista de datos sinteticos con los esquemas de s3_loader
+
+Produce los mismos objetos que lee la app (Parquet de precios y GeoJSON de
+municipios y secciones) a distintas escalas, para medir como se comporta a
+medida que crecen los datos. Con la misma escala y semilla los bytes son
+identicos, de modo que los ETag (y las caches que dependen de ellos) tambien.
+
+Lo que crece con la escala:
+- Precios de municipios, distritos y portales: meses de historia
+  (MESES_BASE x escala, hacia atras desde FECHA_FINAL)
+- Precios y GeoJSON de secciones de Santander: numero de secciones
+  (SECCIONES_BASE x escala)
+- GeoJSON de municipios: puntos de cada borde (PUNTOS_BORDE_MUNICIPIOS x escala)
+
+Las teselas de los GeoJSON comparten bordes exactos con sus vecinas, como
+los de verdad, para que la simplificacion de geometria trabaje igual.
+
+Con --particionado los historicos de municipios y distritos se escriben con
+un Parquet por fecha, como los lee s3_loader con particionado activado.
+
+Uso:
+    python datos_sinteticos.py --escala 10 --salida datos_sinteticos/
+    python datos_sinteticos.py --escala 10 --particionado --salida datos_particionados/
+"""
+import argparse
+import io
+import json
+import math
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from coordenadas_municipios import COORDENADAS_MUNICIPIOS
+from normalizacion_municipios import obtener_normalizador
+from particiones import particionar, prefijo_particionado
+from s3_loader import (
+    MUNICIPIOS_KEY, DISTRITOS_KEY, PORTALES_KEY, SECCIONES_SANTANDER_KEY,
+    GEOJSON_MUNICIPIOS_KEY, GEOJSON_SANTANDER_KEY, DATASETS_PARTICIONADOS,
+)
+
+ESCALAS = (1, 10, 100)
+
+# Tamaño de la escala 1
+MESES_BASE = 24
+SECCIONES_BASE = 180
+PUNTOS_BORDE_MUNICIPIOS = 8
+PUNTOS_BORDE_SECCIONES = 4
+FECHA_FINAL = '2024-12-01'
+
+# Filas por row group de los Parquet (las estadisticas min/max son por row group)
+FILAS_POR_GRUPO = 50_000
+
+DISTRITOS_SANTANDER = [
+    'Centro', 'Sardinero', 'Cueto', 'Monte', 'Castilla-Hermida',
+    'Cazoña', 'Peñacastillo', 'General Davila', 'Valdenoja', 'San Roman',
+]
+
+# Cajas (lon_min, lat_min, lon_max, lat_max) de las teselas
+BBOX_CANTABRIA = (-4.85, 42.75, -3.15, 43.52)
+BBOX_SANTANDER = (-3.89, 43.44, -3.76, 43.49)
+
+# Prefijo INE de Santander en los codigos de seccion del GeoJSON
+PREFIJO_SECCION = '39075'
+MAX_SECCIONES_POR_DISTRITO = 999
+
+# Secciones del GeoJSON sin precios (se pintan en gris en el mapa)
+FRACCION_SECCIONES_SIN_DATOS = 0.05
+
+
+def _nombre_geojson(municipio):
+    """
+    Nombre del municipio en el GeoJSON: con el articulo al final, como en
+    los nombres oficiales ('El Astillero' -> 'Astillero (El)')
+    """
+    for articulo in ('El', 'La', 'Los', 'Las'):
+        if municipio.startswith(articulo + ' '):
+            return f"{municipio[len(articulo) + 1:]} ({articulo})"
+    return municipio
+
+
+def _municipios():
+    """
+    Municipios de los datos (uno por nombre oficial: las localidades que
+    pertenecen a otro municipio se descartan) y su nombre en el GeoJSON
+    """
+    normalizador = obtener_normalizador()
+    nombres = {}
+    for municipio in COORDENADAS_MUNICIPIOS:
+        nombres.setdefault(_nombre_geojson(normalizador.normalizar(municipio)), municipio)
+    return list(nombres.values()), list(nombres)
+
+
+def _fechas(escala):
+    return pd.date_range(end=FECHA_FINAL, periods=MESES_BASE * escala, freq='MS')
+
+
+def _series_precios(rng, zonas, fechas, precio_min, precio_max):
+    """
+    Precio por m2 de cada zona y fecha: paseo aleatorio mensual sobre un
+    precio base por zona
+
+    Returns:
+        Array (zonas x fechas)
+    """
+    base = rng.uniform(precio_min, precio_max, size=(len(zonas), 1))
+    pasos = rng.normal(0.002, 0.01, size=(len(zonas), len(fechas)))
+    return np.round(base * np.exp(np.cumsum(pasos, axis=1)), 2)
+
+
+def _historico(rng, zonas, fechas, columna_zona, columna_precio, precio_min, precio_max):
+    """
+    DataFrame de una fila por zona y fecha
+    """
+    precios = _series_precios(rng, zonas, fechas, precio_min, precio_max)
+    return pd.DataFrame({
+        columna_zona: np.repeat(zonas, len(fechas)),
+        'fecha': np.tile(fechas.values, len(zonas)),
+        columna_precio: precios.ravel(),
+    })
+
+
+def _codigos_secciones(num_secciones):
+    """
+    Codigos de 5 caracteres: 2 del distrito y 3 de la seccion
+    """
+    por_distrito = min(math.ceil(num_secciones / len(DISTRITOS_SANTANDER)), MAX_SECCIONES_POR_DISTRITO)
+    indices = np.arange(num_secciones)
+    return [f"{d + 1:02d}{s + 1:03d}" for d, s in zip(indices // por_distrito, indices % por_distrito)]
+
+
+def _teselado(rng, num_teselas, bbox, puntos_borde):
+    """
+    Reparte una caja en teselas con bordes irregulares compartidos
+
+    Los vertices de una rejilla se desplazan al azar y cada borde entre dos
+    vertices recibe puntos intermedios; las dos teselas de un borde lo
+    recorren con los mismos puntos en sentido contrario.
+
+    Returns:
+        Lista de anillos exteriores [[lon, lat], ...] cerrados, uno por tesela
+    """
+    lon_min, lat_min, lon_max, lat_max = bbox
+    aspecto = (lon_max - lon_min) / (lat_max - lat_min)
+    nx = math.ceil(math.sqrt(num_teselas * aspecto))
+    ny = math.ceil(num_teselas / nx)
+    paso_x = (lon_max - lon_min) / nx
+    paso_y = (lat_max - lat_min) / ny
+
+    # Vertices de la rejilla (los del contorno no se mueven)
+    xs = lon_min + paso_x * np.arange(nx + 1)[:, None] + np.zeros((1, ny + 1))
+    ys = lat_min + paso_y * np.arange(ny + 1)[None, :] + np.zeros((nx + 1, 1))
+    xs[1:-1, 1:-1] += rng.uniform(-0.3, 0.3, size=(nx - 1, ny - 1)) * paso_x
+    ys[1:-1, 1:-1] += rng.uniform(-0.3, 0.3, size=(nx - 1, ny - 1)) * paso_y
+
+    # Desplazamiento perpendicular de los puntos intermedios de cada borde
+    t = np.arange(1, puntos_borde + 1) / (puntos_borde + 1)
+    ruido_h = rng.normal(0, 0.04, size=(nx, ny + 1, puntos_borde))
+    ruido_v = rng.normal(0, 0.04, size=(nx + 1, ny, puntos_borde))
+
+    def borde(a, b, ruido):
+        (xa, ya), (xb, yb) = a, b
+        x = xa + t * (xb - xa) - ruido * (yb - ya)
+        y = ya + t * (yb - ya) + ruido * (xb - xa)
+        return [a] + list(zip(x, y))
+
+    def vertice(i, j):
+        return (xs[i, j], ys[i, j])
+
+    anillos = []
+    for n in range(num_teselas):
+        i, j = n % nx, n // nx
+        abajo = borde(vertice(i, j), vertice(i + 1, j), ruido_h[i, j])
+        derecha = borde(vertice(i + 1, j), vertice(i + 1, j + 1), ruido_v[i + 1, j])
+        arriba = borde(vertice(i, j + 1), vertice(i + 1, j + 1), ruido_h[i, j + 1])
+        izquierda = borde(vertice(i, j), vertice(i, j + 1), ruido_v[i, j])
+        # Arriba e izquierda se recorren al reves para cerrar el anillo
+        puntos = (
+            abajo + derecha
+            + [vertice(i + 1, j + 1)] + arriba[:0:-1]
+            + [vertice(i, j + 1)] + izquierda[:0:-1]
+            + [vertice(i, j)]
+        )
+        anillos.append([[round(float(x), 6), round(float(y), 6)] for x, y in puntos])
+    return anillos
+
+
+def _geojson(anillos, propiedades):
+    return {
+        'type': 'FeatureCollection',
+        'features': [
+            {
+                'type': 'Feature',
+                'properties': props,
+                'geometry': {'type': 'Polygon', 'coordinates': [anillo]},
+            }
+            for anillo, props in zip(anillos, propiedades)
+        ],
+    }
+
+
+def _parquet(df):
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, index=False, row_group_size=FILAS_POR_GRUPO)
+    return buffer.getvalue()
+
+
+def _json(datos):
+    return json.dumps(datos, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def generar_datasets(escala=1, semilla=0):
+    """
+    Genera los DataFrames y GeoJSON de una escala
+
+    Returns:
+        Diccionario {clave de S3: DataFrame o GeoJSON}
+    """
+    if escala < 1:
+        raise ValueError(f"Escala no valida: {escala}")
+
+    rng = np.random.default_rng(semilla)
+    fechas = _fechas(escala)
+    municipios, nombres_geojson = _municipios()
+
+    # Como en los ficheros de origen, la columna de zona de municipios se
+    # llama distrito y el precio de los portales precio_m2_medio
+    df_municipios = _historico(rng, municipios, fechas, 'distrito', 'precio_m2', 900, 3200)
+    df_distritos = _historico(rng, DISTRITOS_SANTANDER, fechas, 'distrito', 'precio_m2', 1800, 3600)
+    df_portales = _historico(rng, municipios, fechas, 'municipio', 'precio_m2_medio', 1100, 3800)
+
+    codigos = _codigos_secciones(SECCIONES_BASE * escala)
+    con_datos = rng.random(len(codigos)) >= FRACCION_SECCIONES_SIN_DATOS
+    df_secciones = pd.DataFrame({
+        'seccion': codigos,
+        'distrito': [codigo[:2] for codigo in codigos],
+        'precio_m2_medio': np.round(rng.uniform(1500, 4500, len(codigos)), 2),
+        'num_viviendas': rng.integers(1, 60, len(codigos)),
+    })[con_datos].reset_index(drop=True)
+
+    anillos_municipios = _teselado(rng, len(municipios), BBOX_CANTABRIA, PUNTOS_BORDE_MUNICIPIOS * escala)
+    anillos_secciones = _teselado(rng, len(codigos), BBOX_SANTANDER, PUNTOS_BORDE_SECCIONES)
+
+    return {
+        MUNICIPIOS_KEY: df_municipios,
+        DISTRITOS_KEY: df_distritos,
+        PORTALES_KEY: df_portales,
+        SECCIONES_SANTANDER_KEY: df_secciones,
+        GEOJSON_MUNICIPIOS_KEY: _geojson(anillos_municipios, [{'NOMBRE': n} for n in nombres_geojson]),
+        GEOJSON_SANTANDER_KEY: _geojson(anillos_secciones, [{'seccion': PREFIJO_SECCION + c} for c in codigos]),
+    }
+
+
+def generar_objetos(escala=1, semilla=0, particionado=False):
+    """
+    Genera los objetos de una escala ya serializados
+
+    Args:
+        particionado: Publicar los datasets de DATASETS_PARTICIONADOS como
+            un Parquet por fecha (ver particiones) en lugar de uno solo
+
+    Returns:
+        Diccionario {clave de S3: bytes}
+    """
+    objetos = {}
+    for clave, datos in generar_datasets(escala, semilla).items():
+        if particionado and clave in DATASETS_PARTICIONADOS:
+            objetos.update(particionar(datos, prefijo_particionado(clave)))
+        elif isinstance(datos, pd.DataFrame):
+            objetos[clave] = _parquet(datos)
+        else:
+            objetos[clave] = _json(datos)
+    return objetos
+
+
+def escribir_en_directorio(objetos, directorio):
+    """
+    Escribe los objetos bajo un directorio, con la clave como ruta relativa
+    """
+    for clave, contenido in objetos.items():
+        ruta = os.path.join(directorio, *clave.split('/'))
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        with open(ruta, 'wb') as f:
+            f.write(contenido)
+
+
+def subir_a_s3(objetos, s3_client, bucket):
+    """
+    Sube los objetos a un bucket (p.ej. de MinIO o moto), creandolo si no existe
+    """
+    try:
+        s3_client.head_bucket(Bucket=bucket)
+    except Exception:
+        region = s3_client.meta.region_name
+        if region and region != 'us-east-1':
+            s3_client.create_bucket(Bucket=bucket, CreateBucketConfiguration={'LocationConstraint': region})
+        else:
+            s3_client.create_bucket(Bucket=bucket)
+
+    for clave, contenido in objetos.items():
+        s3_client.put_object(Bucket=bucket, Key=clave, Body=contenido)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera datos sinteticos con los esquemas de la app")
+    parser.add_argument('--escala', type=int, default=1, help="Multiplicador del tamaño de los datos (1, 10, 100...)")
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--salida', required=True, help="Directorio donde escribir los objetos")
+    parser.add_argument('--particionado', action='store_true',
+                        help="Historicos de municipios y distritos con un Parquet por fecha")
+    args = parser.parse_args()
+
+    objetos = generar_objetos(args.escala, args.semilla, args.particionado)
+    escribir_en_directorio(objetos, args.salida)
+    tamanos = {}
+    for clave, contenido in objetos.items():
+        # Las particiones de un dataset se resumen bajo su prefijo
+        clave = re.sub(r'[^/]+=[^/]+/[^/]+$', '', clave)
+        tamanos[clave] = tamanos.get(clave, 0) + len(contenido)
+    for clave, num_bytes in tamanos.items():
+        print(f"{clave}: {num_bytes / 1e6:.2f} MB")
+
+
+if __name__ == '__main__':
+    main()
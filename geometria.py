@@ -0,0 +1,320 @@
+"""
+Modulo para simplificar las geometrias GeoJSON de los mapas coropleticos
+
+Los GeoJSON originales se envian completos al navegador en cada render. Este
+modulo genera, una vez por version de cada GeoJSON, copias simplificadas a
+varios niveles de detalle:
+- Las coordenadas se cuantizan a una rejilla (redondeo a N decimales)
+- Los limites se simplifican con Douglas-Peucker sobre arcos compartidos: el
+  borde comun de dos municipios se simplifica una sola vez y ambos usan el
+  mismo resultado, de modo que no aparecen huecos ni solapes entre ellos
+
+Las propiedades de cada feature (y por tanto los ids de featureidkey) no se
+modifican.
+"""
+import copy
+import json
+import logging
+import math
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Niveles de detalle: tolerancia de simplificacion (grados) y decimales de
+# las coordenadas
+NIVELES = {
+    'alto': {'tolerancia': 0.00005, 'decimales': 6},  # ~5 m, calles
+    'medio': {'tolerancia': 0.0002, 'decimales': 5},  # ~20 m, ciudad
+    'bajo': {'tolerancia': 0.001, 'decimales': 4},  # ~100 m, region
+}
+
+_lock = threading.Lock()
+_geometrias = {}
+_report = {}
+
+
+def nivel_para_zoom(zoom):
+    """
+    Nivel mas simplificado cuya tolerancia no supera el tamaño de un pixel
+
+    Args:
+        zoom: Zoom del mapa (escala de mapbox)
+    """
+    tamano_pixel = 360 / (256 * 2 ** zoom)
+    candidatos = [
+        nombre for nombre, nivel in NIVELES.items()
+        if nivel['tolerancia'] <= tamano_pixel
+    ]
+    if not candidatos:
+        return min(NIVELES, key=lambda nombre: NIVELES[nombre]['tolerancia'])
+    return max(candidatos, key=lambda nombre: NIVELES[nombre]['tolerancia'])
+
+
+def _douglas_peucker(puntos, tolerancia):
+    """
+    Simplifica una linea conservando sus extremos
+
+    Args:
+        puntos: Lista de tuplas (lon, lat)
+        tolerancia: Distancia maxima (en grados) entre la linea original y la
+            simplificada
+
+    Returns:
+        Lista de tuplas con los puntos conservados
+    """
+    n = len(puntos)
+    if n < 3:
+        return list(puntos)
+
+    coordenadas = np.asarray(puntos, dtype=np.float64)
+    conservar = np.zeros(n, dtype=bool)
+    conservar[0] = conservar[-1] = True
+
+    pendientes = [(0, n - 1)]
+    while pendientes:
+        i, j = pendientes.pop()
+        if j <= i + 1:
+            continue
+
+        inicio = coordenadas[i]
+        tramo = coordenadas[i + 1:j] - inicio
+        direccion = coordenadas[j] - inicio
+        longitud = math.hypot(direccion[0], direccion[1])
+        if longitud == 0:
+            distancias = np.hypot(tramo[:, 0], tramo[:, 1])
+        else:
+            distancias = np.abs(direccion[0] * tramo[:, 1] - direccion[1] * tramo[:, 0]) / longitud
+
+        k = int(np.argmax(distancias))
+        if distancias[k] > tolerancia:
+            conservar[i + 1 + k] = True
+            pendientes.append((i, i + 1 + k))
+            pendientes.append((i + 1 + k, j))
+
+    return [puntos[i] for i in np.flatnonzero(conservar)]
+
+
+def _cuantizar_anillo(anillo, decimales):
+    """
+    Redondea un anillo y quita el punto de cierre y los puntos repetidos
+    """
+    puntos = []
+    for coordenada in anillo:
+        punto = (round(coordenada[0], decimales), round(coordenada[1], decimales))
+        if not puntos or puntos[-1] != punto:
+            puntos.append(punto)
+    while len(puntos) > 1 and puntos[0] == puntos[-1]:
+        puntos.pop()
+    return puntos
+
+
+def anillos_geometria(geometria):
+    """
+    Anillos (exteriores y huecos) de un Polygon o MultiPolygon, como lista
+    de listas de coordenadas; ninguno si la geometria es de otro tipo
+    """
+    if geometria is None:
+        return []
+    if geometria['type'] == 'Polygon':
+        return list(geometria['coordinates'])
+    if geometria['type'] == 'MultiPolygon':
+        return [anillo for poligono in geometria['coordinates'] for anillo in poligono]
+    return []
+
+
+def _uniones(anillos):
+    """
+    Puntos en los que se separan arcos compartidos
+
+    Un punto es una union si, entre todas sus apariciones, tiene mas de dos
+    vecinos distintos: ahi termina un borde comun entre dos anillos.
+    """
+    vecinos = {}
+    for anillo in anillos:
+        n = len(anillo)
+        for i, punto in enumerate(anillo):
+            conjunto = vecinos.setdefault(punto, set())
+            conjunto.add(anillo[i - 1])
+            conjunto.add(anillo[(i + 1) % n])
+    return {punto for punto, conjunto in vecinos.items() if len(conjunto) > 2}
+
+
+class _SimplificadorArcos:
+    """
+    Simplifica arcos una sola vez, sea cual sea el sentido en que se recorren
+    """
+
+    def __init__(self, tolerancia):
+        self.tolerancia = tolerancia
+        self._arcos = {}
+
+    def simplificar(self, arco):
+        arco = tuple(arco)
+        invertido = arco[::-1]
+        canonico = min(arco, invertido)
+        simplificado = self._arcos.get(canonico)
+        if simplificado is None:
+            simplificado = _douglas_peucker(canonico, self.tolerancia)
+            self._arcos[canonico] = simplificado
+        return simplificado if canonico == arco else simplificado[::-1]
+
+
+def _simplificar_anillo(anillo, uniones, arcos):
+    """
+    Simplifica un anillo cuantizado partiendolo por sus uniones
+
+    Returns:
+        Lista de coordenadas [lon, lat] cerrada (el ultimo punto repite el
+        primero)
+    """
+    if len(anillo) < 3:
+        return [list(p) for p in anillo + anillo[:1]]
+
+    cortes = [i for i, punto in enumerate(anillo) if punto in uniones]
+    if not cortes:
+        # Anillo sin uniones: un unico arco cerrado que empieza en su punto
+        # menor, para que un enclave y el hueco que lo contiene coincidan
+        cortes = [anillo.index(min(anillo))]
+
+    # Empezar en la primera union y recorrer el anillo arco a arco
+    inicio = cortes[0]
+    rotado = anillo[inicio:] + anillo[:inicio]
+    posiciones = [c - inicio for c in cortes] + [len(anillo)]
+    rotado = rotado + rotado[:1]
+
+    resultado = []
+    for desde, hasta in zip(posiciones[:-1], posiciones[1:]):
+        tramo = arcos.simplificar(rotado[desde:hasta + 1])
+        resultado.extend(tramo[:-1])
+    resultado.append(resultado[0])
+
+    # Un anillo necesita al menos 3 puntos distintos
+    if len(resultado) < 4:
+        return [list(p) for p in anillo + anillo[:1]]
+    return [list(p) for p in resultado]
+
+
+def simplificar_geojson(geojson, tolerancia, decimales):
+    """
+    Devuelve una copia simplificada de un FeatureCollection
+
+    Args:
+        geojson: FeatureCollection original (no se modifica)
+        tolerancia: Tolerancia de Douglas-Peucker en grados
+        decimales: Decimales con que se cuantizan las coordenadas
+
+    Returns:
+        Nuevo FeatureCollection con las mismas features y propiedades
+    """
+    features = geojson.get('features', [])
+
+    # Cuantizar primero para que los vertices compartidos coincidan exactamente
+    cuantizadas = []
+    for feature in features:
+        geometria = feature.get('geometry')
+        cuantizadas.append([_cuantizar_anillo(anillo, decimales) for anillo in anillos_geometria(geometria)])
+
+    uniones = _uniones([anillo for anillos in cuantizadas for anillo in anillos])
+    arcos = _SimplificadorArcos(tolerancia)
+
+    resultado = {k: v for k, v in geojson.items() if k != 'features'}
+    resultado['features'] = []
+    for feature, anillos in zip(features, cuantizadas):
+        nueva = {k: v for k, v in feature.items() if k != 'geometry'}
+        geometria = feature.get('geometry')
+        simplificados = iter([_simplificar_anillo(anillo, uniones, arcos) for anillo in anillos])
+
+        if geometria is None:
+            nueva['geometry'] = None
+        elif geometria['type'] == 'Polygon':
+            nueva['geometry'] = {
+                'type': 'Polygon',
+                'coordinates': [next(simplificados) for _ in geometria['coordinates']],
+            }
+        elif geometria['type'] == 'MultiPolygon':
+            nueva['geometry'] = {
+                'type': 'MultiPolygon',
+                'coordinates': [
+                    [next(simplificados) for _ in poligono]
+                    for poligono in geometria['coordinates']
+                ],
+            }
+        else:
+            # Puntos y lineas no se simplifican
+            nueva['geometry'] = copy.deepcopy(geometria)
+
+        resultado['features'].append(nueva)
+
+    return resultado
+
+
+def _contar_puntos(geojson):
+    return sum(
+        len(anillo)
+        for feature in geojson.get('features', [])
+        for anillo in anillos_geometria(feature.get('geometry'))
+    )
+
+
+def geojson_simplificado(nombre, version, geojson, nivel):
+    """
+    Devuelve un GeoJSON simplificado a un nivel, calculando todos los niveles
+    una sola vez por version
+
+    Args:
+        nombre: Identificador del GeoJSON (p.ej. su clave en S3)
+        version: Version del GeoJSON (p.ej. su ETag)
+        geojson: FeatureCollection original
+        nivel: Nombre del nivel en NIVELES
+
+    Returns:
+        FeatureCollection simplificado (compartido: no debe modificarse)
+    """
+    if nivel not in NIVELES:
+        raise ValueError(f"Nivel de simplificacion no valido: {nivel}")
+
+    with _lock:
+        guardado = _geometrias.get(nombre)
+        if guardado is not None and guardado[0] == version:
+            return guardado[1][nivel]
+
+    puntos_originales = _contar_puntos(geojson)
+    bytes_originales = len(json.dumps(geojson, separators=(',', ':')))
+    niveles = {}
+    report = {}
+    for nombre_nivel, parametros in NIVELES.items():
+        simplificado = simplificar_geojson(geojson, parametros['tolerancia'], parametros['decimales'])
+        niveles[nombre_nivel] = simplificado
+        report[nombre_nivel] = {
+            'puntos': _contar_puntos(simplificado),
+            'bytes': len(json.dumps(simplificado, separators=(',', ':'))),
+        }
+        logger.info(
+            "GeoJSON %s nivel %s: %d -> %d puntos",
+            nombre, nombre_nivel, puntos_originales, report[nombre_nivel]['puntos'],
+        )
+    report['original'] = {'puntos': puntos_originales, 'bytes': bytes_originales}
+
+    with _lock:
+        _geometrias[nombre] = (version, niveles)
+        _report[nombre] = report
+    return niveles[nivel]
+
+
+def version_geojson(nombre):
+    """
+    Version del ultimo GeoJSON simplificado con ese nombre (None si no hay)
+    """
+    with _lock:
+        guardado = _geometrias.get(nombre)
+        return guardado[0] if guardado is not None else None
+
+
+def get_geometria_report():
+    """
+    Puntos y bytes de cada GeoJSON original y de cada nivel simplificado
+    """
+    with _lock:
+        return {nombre: dict(report) for nombre, report in _report.items()}
@@ -0,0 +1,520 @@
+"""
+Modulo con indices espaciales sobre poligonos GeoJSON
+
+IndicePoligonos reparte las cajas (bounding boxes) de los poligonos en una
+rejilla regular. Para un punto solo se prueban los poligonos de su celda:
+primero la caja y despues el punto en poligono (regla par-impar sobre todos
+los anillos, de modo que los huecos y los MultiPolygon funcionan igual).
+Para un lote los puntos se ordenan por celda y cada poligono prueba solo los
+puntos de las celdas que cubre, con numpy y sin bucles por punto.
+
+IndiceMunicipios lo usa con el GeoJSON de municipios para resolver lat/lon a
+municipio y comarca. Los puntos que no caen en ningun poligono (costa,
+coordenadas imprecisas) se asignan al municipio de coordenadas conocidas
+mas cercano si esta a menos de DISTANCIA_MAXIMA_KM.
+
+IndiceSecciones lo usa con el GeoJSON de Santander para asignar anuncios a
+secciones censales y agregar su precio por m2 (ver agregar_por_seccion).
+
+Cada indice se construye una vez por version de su GeoJSON (ver
+obtener_indice_municipios y obtener_indice_secciones).
+"""
+import json
+import logging
+import math
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from comarcas_municipios import MUNICIPIOS_COMARCAS, COMARCA_DESCONOCIDA
+from coordenadas_municipios import COORDENADAS_MUNICIPIOS
+from geometria import anillos_geometria
+from normalizacion_municipios import plegar, separar_articulo
+
+logger = logging.getLogger(__name__)
+
+# Poligonos por celda de la rejilla (aproximado)
+POLIGONOS_POR_CELDA = 0.5
+
+# Elementos (puntos x aristas) de cada bloque del punto en poligono por lotes
+MAX_ELEMENTOS_BLOQUE = 2_000_000
+
+# Distancia maxima para asignar un punto fuera de los poligonos al
+# municipio mas cercano
+DISTANCIA_MAXIMA_KM = 10.0
+
+# Las secciones de los datos de portales son los ultimos 5 caracteres del
+# codigo del GeoJSON (sin el prefijo 39075 de Santander) y el distrito sus
+# 2 primeros
+LONGITUD_SECCION = 5
+LONGITUD_DISTRITO = 2
+KM_POR_GRADO_LAT = 110.57
+KM_POR_GRADO_LON_ECUADOR = 111.32
+
+
+def _punto_en_aristas(lon, lat, x1, y1, x2, y2):
+    """
+    Regla par-impar: puntos (n,) contra aristas (e,)
+
+    Returns:
+        Array booleano (n,) con los puntos dentro
+    """
+    lon = lon[:, None]
+    lat = lat[:, None]
+    cruza = (y1 > lat) != (y2 > lat)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_corte = x1 + (lat - y1) * (x2 - x1) / (y2 - y1)
+    return np.count_nonzero(cruza & (lon < x_corte), axis=1) % 2 == 1
+
+
+class IndicePoligonos:
+    """
+    Rejilla de cajas para localizar puntos en un conjunto de poligonos
+
+    Args:
+        geometrias: Geometrias GeoJSON (Polygon o MultiPolygon), una por clave
+        claves: Identificador de cada geometria (p.ej. el NOMBRE del municipio)
+    """
+
+    def __init__(self, geometrias, claves):
+        self.claves = list(claves)
+
+        # Aristas de todos los poligonos seguidas, con el inicio de cada uno
+        aristas, inicios = [], [0]
+        cajas = []
+        for geometria in geometrias:
+            anillos = [np.asarray(anillo, dtype=float)[:, :2] for anillo in anillos_geometria(geometria) if len(anillo) >= 3]
+            if anillos:
+                aristas.extend(np.hstack([anillo[:-1], anillo[1:]]) for anillo in anillos)
+                puntos = np.vstack(anillos)
+                cajas.append((*puntos.min(axis=0), *puntos.max(axis=0)))
+            else:
+                cajas.append((np.inf, np.inf, -np.inf, -np.inf))
+            inicios.append(inicios[-1] + sum(len(a) - 1 for a in anillos))
+
+        aristas = np.vstack(aristas) if aristas else np.empty((0, 4))
+        self._x1, self._y1, self._x2, self._y2 = (np.ascontiguousarray(aristas[:, i]) for i in range(4))
+        self._inicios = np.asarray(inicios)
+        self.cajas = np.asarray(cajas, dtype=float).reshape(-1, 4)
+
+        validas = np.isfinite(self.cajas).all(axis=1)
+        if validas.any():
+            self.extension = (
+                self.cajas[validas, 0].min(), self.cajas[validas, 1].min(),
+                self.cajas[validas, 2].max(), self.cajas[validas, 3].max(),
+            )
+        else:
+            self.extension = (0.0, 0.0, 1.0, 1.0)
+        self._construir_rejilla(validas)
+
+    def _construir_rejilla(self, validas):
+        lon_min, lat_min, lon_max, lat_max = self.extension
+        ancho, alto = max(lon_max - lon_min, 1e-9), max(lat_max - lat_min, 1e-9)
+        celdas = max(1, int(validas.sum() / POLIGONOS_POR_CELDA))
+        self._nx = max(1, int(round(math.sqrt(celdas * ancho / alto))))
+        self._ny = max(1, int(math.ceil(celdas / self._nx)))
+        self._dx, self._dy = ancho / self._nx, alto / self._ny
+
+        # Rango de celdas de la caja de cada poligono
+        self._rangos = np.zeros((len(self.cajas), 4), dtype=np.int64)
+        self._rangos[:, 0], self._rangos[:, 1] = self._celda(self.cajas[:, 0], self.cajas[:, 1])
+        self._rangos[:, 2], self._rangos[:, 3] = self._celda(self.cajas[:, 2], self.cajas[:, 3])
+
+        # Poligonos de cada celda (formato CSR: inicio y fin en _poligonos_celda)
+        por_celda = [[] for _ in range(self._nx * self._ny)]
+        for poligono in np.flatnonzero(validas):
+            cx0, cy0, cx1, cy1 = self._rangos[poligono]
+            for cy in range(cy0, cy1 + 1):
+                for cx in range(cx0, cx1 + 1):
+                    por_celda[cy * self._nx + cx].append(poligono)
+        tamanos = np.fromiter((len(p) for p in por_celda), dtype=np.int64, count=len(por_celda))
+        self._celda_inicio = np.concatenate([[0], np.cumsum(tamanos)])
+        self._poligonos_celda = np.fromiter(
+            (p for poligonos in por_celda for p in poligonos), dtype=np.int64, count=int(tamanos.sum())
+        )
+
+    def _celda(self, lon, lat):
+        """
+        Columna y fila de la rejilla (acotadas a la rejilla) de unos puntos
+        """
+        lon_min, lat_min, _, _ = self.extension
+        cx = np.clip(np.floor((np.asarray(lon) - lon_min) / self._dx), 0, self._nx - 1).astype(np.int64)
+        cy = np.clip(np.floor((np.asarray(lat) - lat_min) / self._dy), 0, self._ny - 1).astype(np.int64)
+        return cx, cy
+
+    def _aristas(self, poligono):
+        inicio, fin = self._inicios[poligono], self._inicios[poligono + 1]
+        return self._x1[inicio:fin], self._y1[inicio:fin], self._x2[inicio:fin], self._y2[inicio:fin]
+
+    def _en_caja(self, poligono, lon, lat):
+        lon_min, lat_min, lon_max, lat_max = self.cajas[poligono]
+        return (lon >= lon_min) & (lon <= lon_max) & (lat >= lat_min) & (lat <= lat_max)
+
+    def _dentro(self, poligono, lon, lat):
+        """
+        Punto en poligono por bloques para no crear matrices enormes
+        """
+        x1, y1, x2, y2 = self._aristas(poligono)
+        bloque = max(1, MAX_ELEMENTOS_BLOQUE // max(len(x1), 1))
+        if len(lon) <= bloque:
+            return _punto_en_aristas(lon, lat, x1, y1, x2, y2)
+        return np.concatenate([
+            _punto_en_aristas(lon[i:i + bloque], lat[i:i + bloque], x1, y1, x2, y2)
+            for i in range(0, len(lon), bloque)
+        ])
+
+    def localizar(self, lon, lat):
+        """
+        Poligono que contiene un punto
+
+        Returns:
+            Posicion del poligono en claves, o None
+        """
+        lon_min, lat_min, lon_max, lat_max = self.extension
+        if not (lon_min <= lon <= lon_max and lat_min <= lat <= lat_max):
+            return None
+
+        cx, cy = self._celda(lon, lat)
+        celda = cy * self._nx + cx
+        punto_lon, punto_lat = np.array([lon], dtype=float), np.array([lat], dtype=float)
+        for poligono in self._poligonos_celda[self._celda_inicio[celda]:self._celda_inicio[celda + 1]]:
+            if self._en_caja(poligono, lon, lat) and self._dentro(poligono, punto_lon, punto_lat)[0]:
+                return int(poligono)
+        return None
+
+    def localizar_lote(self, lon, lat):
+        """
+        Poligono que contiene cada punto de un lote
+
+        Args:
+            lon, lat: Arrays (o Series) con las coordenadas; los NaN no se localizan
+
+        Returns:
+            Array de enteros con la posicion del poligono de cada punto (-1 si
+            no esta en ninguno)
+        """
+        lon = np.asarray(lon, dtype=float)
+        lat = np.asarray(lat, dtype=float)
+        resultado = np.full(len(lon), -1, dtype=np.int64)
+
+        lon_min, lat_min, lon_max, lat_max = self.extension
+        validos = np.flatnonzero(
+            np.isfinite(lon) & np.isfinite(lat)
+            & (lon >= lon_min) & (lon <= lon_max) & (lat >= lat_min) & (lat <= lat_max)
+        )
+        if not len(validos):
+            return resultado
+
+        # Puntos ordenados por celda: las celdas de una fila de la caja de un
+        # poligono son un tramo contiguo del orden
+        cx, cy = self._celda(lon[validos], lat[validos])
+        celdas = cy * self._nx + cx
+        orden = np.argsort(celdas, kind='stable')
+        celdas_ordenadas = celdas[orden]
+        puntos = validos[orden]
+
+        for poligono in np.flatnonzero(np.isfinite(self.cajas).all(axis=1)):
+            cx0, cy0, cx1, cy1 = self._rangos[poligono]
+            filas = np.arange(cy0, cy1 + 1) * self._nx
+            inicios = np.searchsorted(celdas_ordenadas, filas + cx0, side='left')
+            fines = np.searchsorted(celdas_ordenadas, filas + cx1, side='right')
+            candidatos = np.concatenate([puntos[i:f] for i, f in zip(inicios, fines) if f > i] or [np.empty(0, dtype=np.int64)])
+            if not len(candidatos):
+                continue
+
+            # Cada punto se queda con el primer poligono que lo contiene
+            candidatos = candidatos[resultado[candidatos] == -1]
+            candidatos = candidatos[self._en_caja(poligono, lon[candidatos], lat[candidatos])]
+            if len(candidatos):
+                dentro = self._dentro(poligono, lon[candidatos], lat[candidatos])
+                resultado[candidatos[dentro]] = poligono
+
+        return resultado
+
+
+def _nombre_natural(nombre):
+    """
+    'Astillero (El)' -> 'El Astillero'
+    """
+    partes = separar_articulo(nombre)
+    return ' '.join(partes) if partes else nombre
+
+
+class IndiceMunicipios:
+    """
+    Resuelve coordenadas a municipio y comarca
+
+    Args:
+        geojson_municipios: FeatureCollection con la propiedad NOMBRE (None =
+            solo el municipio de coordenadas conocidas mas cercano)
+        distancia_maxima_km: Distancia maxima de la asignacion por cercania
+    """
+
+    def __init__(self, geojson_municipios=None, distancia_maxima_km=DISTANCIA_MAXIMA_KM):
+        self.distancia_maxima_km = distancia_maxima_km
+
+        # Nombres de los datos (los de la tabla de coordenadas primero)
+        conocidos = {}
+        for nombre in list(COORDENADAS_MUNICIPIOS) + list(MUNICIPIOS_COMARCAS):
+            conocidos.setdefault(plegar(nombre), nombre)
+        self._comarcas = {plegar(nombre): comarca for nombre, comarca in MUNICIPIOS_COMARCAS.items()}
+
+        features = geojson_municipios['features'] if geojson_municipios else []
+        nombres = [_nombre_natural(f['properties']['NOMBRE']) for f in features]
+        self.municipios = np.array([conocidos.get(plegar(n), n) for n in nombres], dtype=object)
+        self.poligonos = IndicePoligonos([f['geometry'] for f in features], self.municipios) if features else None
+
+        # Coordenadas conocidas para la asignacion por cercania
+        self.municipios_cercania = np.array(list(COORDENADAS_MUNICIPIOS), dtype=object)
+        coordenadas = np.array(list(COORDENADAS_MUNICIPIOS.values()), dtype=float)
+        self._lat_cercania, self._lon_cercania = coordenadas[:, 0], coordenadas[:, 1]
+
+    def comarca(self, municipio):
+        if municipio is None:
+            return None
+        return self._comarcas.get(plegar(municipio), COMARCA_DESCONOCIDA)
+
+    def _cercano(self, lat, lon):
+        """
+        Posicion y distancia (km) del municipio de coordenadas conocidas mas
+        cercano a cada punto (distancia equirrectangular)
+        """
+        lat = np.asarray(lat, dtype=float)[:, None]
+        lon = np.asarray(lon, dtype=float)[:, None]
+        km_lon = KM_POR_GRADO_LON_ECUADOR * np.cos(np.radians(lat))
+        distancias = np.hypot((lon - self._lon_cercania) * km_lon, (lat - self._lat_cercania) * KM_POR_GRADO_LAT)
+        posiciones = np.argmin(distancias, axis=1)
+        return posiciones, distancias[np.arange(len(posiciones)), posiciones]
+
+    def localizar(self, lat, lon):
+        """
+        Municipio y comarca de un punto
+
+        Returns:
+            Diccionario con municipio, comarca y metodo ('poligono' o
+            'cercania', con distancia_km), o None si no se pudo resolver
+        """
+        if lat is None or lon is None or not (math.isfinite(lat) and math.isfinite(lon)):
+            return None
+
+        if self.poligonos is not None:
+            poligono = self.poligonos.localizar(lon, lat)
+            if poligono is not None:
+                municipio = self.municipios[poligono]
+                return {'municipio': municipio, 'comarca': self.comarca(municipio), 'metodo': 'poligono'}
+
+        posiciones, distancias = self._cercano([lat], [lon])
+        if distancias[0] > self.distancia_maxima_km:
+            return None
+        municipio = self.municipios_cercania[posiciones[0]]
+        return {
+            'municipio': municipio,
+            'comarca': self.comarca(municipio),
+            'metodo': 'cercania',
+            'distancia_km': float(distancias[0]),
+        }
+
+    def localizar_lote(self, lat, lon):
+        """
+        Municipio y comarca de muchos puntos a la vez
+
+        Args:
+            lat, lon: Arrays o Series con las coordenadas (NaN = sin coordenadas)
+
+        Returns:
+            DataFrame con municipio, comarca y metodo por punto (None si no se
+            pudo resolver), con el indice de lat si es una Series
+        """
+        indice = lat.index if isinstance(lat, pd.Series) else None
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+
+        municipios = np.full(len(lat), None, dtype=object)
+        metodos = np.full(len(lat), None, dtype=object)
+        # Puntos con coordenadas que aun no tienen municipio
+        pendiente = np.isfinite(lat) & np.isfinite(lon)
+
+        if self.poligonos is not None and len(lat):
+            posiciones = self.poligonos.localizar_lote(lon, lat)
+            encontrados = posiciones >= 0
+            municipios[encontrados] = self.municipios[posiciones[encontrados]]
+            metodos[encontrados] = 'poligono'
+            pendiente &= ~encontrados
+
+        pendientes = np.flatnonzero(pendiente)
+        if len(pendientes):
+            cercanos, distancias = self._cercano(lat[pendientes], lon[pendientes])
+            cerca = distancias <= self.distancia_maxima_km
+            municipios[pendientes[cerca]] = self.municipios_cercania[cercanos[cerca]]
+            metodos[pendientes[cerca]] = 'cercania'
+
+        # La comarca se resuelve una vez por municipio distinto
+        comarcas = {m: self.comarca(m) for m in set(municipios) if m is not None}
+        return pd.DataFrame({
+            'municipio': municipios,
+            'comarca': [comarcas.get(m) for m in municipios],
+            'metodo': metodos,
+        }, index=indice)
+
+
+class IndiceSecciones:
+    """
+    Resuelve coordenadas a seccion censal de Santander
+
+    Args:
+        geojson_santander: FeatureCollection con la propiedad seccion (codigo
+            completo, p.ej. '3907501001')
+    """
+
+    def __init__(self, geojson_santander):
+        features = geojson_santander['features']
+        self.secciones = np.array([f['properties']['seccion'] for f in features], dtype=object)
+        self._codigos = np.array([seccion[-LONGITUD_SECCION:] for seccion in self.secciones], dtype=object)
+        self.poligonos = IndicePoligonos([f['geometry'] for f in features], self.secciones)
+
+    def localizar_lote(self, lat, lon):
+        """
+        Seccion (codigo de 5 caracteres, como en los datos de portales) de
+        cada punto, None si no esta en ninguna
+        """
+        indice = lat.index if isinstance(lat, pd.Series) else None
+        posiciones = self.poligonos.localizar_lote(lon, lat)
+        secciones = np.full(len(posiciones), None, dtype=object)
+        encontrados = posiciones >= 0
+        secciones[encontrados] = self._codigos[posiciones[encontrados]]
+        return pd.Series(secciones, index=indice, name='seccion')
+
+
+def agregar_por_seccion(df, indice=None, columna_lat='latitud', columna_lon='longitud'):
+    """
+    Precio por m2 de unos anuncios agregado por seccion censal de Santander
+
+    Cada anuncio se asigna a la seccion que contiene sus coordenadas (todos a
+    la vez, con el indice de secciones). El precio por m2 es la columna
+    precio_m2 o, si no esta, precio / m2_construidos.
+
+    Args:
+        df: DataFrame de anuncios con latitud y longitud
+        indice: IndiceSecciones (None = el del proceso)
+
+    Returns:
+        Tupla (DataFrame con seccion, distrito, precio_m2 y num_viviendas como
+        el de load_secciones_santander_portales_data, numero de anuncios
+        fuera de las secciones o sin precio)
+    """
+    if not {columna_lat, columna_lon} <= set(df.columns):
+        raise ValueError(f"Los anuncios deben tener las columnas {columna_lat} y {columna_lon}")
+    if 'precio_m2' in df.columns:
+        precio_m2 = pd.to_numeric(df['precio_m2'], errors='coerce')
+    elif {'precio', 'm2_construidos'} <= set(df.columns):
+        precio_m2 = pd.to_numeric(df['precio'], errors='coerce') / pd.to_numeric(df['m2_construidos'], errors='coerce')
+    else:
+        raise ValueError("Los anuncios deben tener precio_m2 o precio y m2_construidos")
+
+    if indice is None:
+        indice = obtener_indice_secciones()
+    secciones = indice.localizar_lote(
+        pd.to_numeric(df[columna_lat], errors='coerce').to_numpy(),
+        pd.to_numeric(df[columna_lon], errors='coerce').to_numpy(),
+    ).to_numpy()
+
+    anuncios = pd.DataFrame({'seccion': secciones, 'precio_m2': precio_m2.to_numpy()})
+    # Sin infinitos: una superficie de 0 m2 da precio / 0 = inf
+    anuncios = anuncios[np.isfinite(anuncios['precio_m2']) & (anuncios['precio_m2'] > 0)].dropna()
+
+    agregado = (
+        anuncios.groupby('seccion', sort=True)['precio_m2']
+        .agg(precio_m2='mean', num_viviendas='size')
+        .reset_index()
+    )
+    agregado.insert(1, 'distrito', agregado['seccion'].str[:LONGITUD_DISTRITO])
+    return agregado, len(df) - len(anuncios)
+
+
+# Sin manifiesto de datos, cada indice se revalida contra su GeoJSON como
+# mucho una vez por este intervalo (el ttl de las caches de s3_loader)
+REVALIDACION_SEGUNDOS = 600
+
+_lock = threading.Lock()
+_indices = {}
+_report = {}
+
+
+def _indice_cacheado(nombre, clave, construir):
+    """
+    Indice construido con construir(geojson) una vez por version del objeto
+
+    Con manifiesto el indice vale mientras no cambie la version de los datos;
+    sin el, durante REVALIDACION_SEGUNDOS. Solo entonces se descarga el
+    GeoJSON (un GET condicional si esta en la cache en disco) y su ETag decide
+    si hay que reconstruirlo, sin peticiones en cada consulta.
+    """
+    from s3_loader import fetch_object, get_data_version, get_object_version
+
+    data_version = get_data_version()
+    with _lock:
+        guardado = _indices.get(nombre)
+    if guardado is not None:
+        version, indice, instante = guardado
+        if data_version is not None:
+            if version == data_version:
+                return indice
+        elif time.monotonic() - instante < REVALIDACION_SEGUNDOS:
+            return indice
+
+    content, etag = fetch_object(clave)
+    version = get_object_version(clave, etag=etag)
+    if guardado is not None and guardado[0] == version:
+        with _lock:
+            _indices[nombre] = (version, guardado[1], time.monotonic())
+            _report[nombre]['revalidaciones'] += 1
+        return guardado[1]
+
+    geojson = json.loads(content.decode('utf-8'))
+    inicio = time.perf_counter()
+    indice = construir(geojson)
+    segundos = time.perf_counter() - inicio
+    with _lock:
+        _indices[nombre] = (version, indice, time.monotonic())
+        report = _report.setdefault(nombre, {'construcciones': 0, 'revalidaciones': 0, 'segundos_construccion': 0.0})
+        report.update(version=version, poligonos=len(geojson['features']))
+        report['construcciones'] += 1
+        report['segundos_construccion'] += segundos
+    logger.info("Indice de %s: %d poligonos en %.3f s", nombre, len(geojson['features']), segundos)
+    return indice
+
+
+def obtener_indice_municipios():
+    """
+    Indice de municipios del proceso, construido una vez por version del GeoJSON
+
+    Si el GeoJSON no se puede cargar se devuelve un indice solo por
+    cercania (sin guardarlo, para reintentar en la siguiente llamada).
+    """
+    from s3_loader import GEOJSON_MUNICIPIOS_KEY
+
+    try:
+        return _indice_cacheado('municipios', GEOJSON_MUNICIPIOS_KEY, IndiceMunicipios)
+    except Exception as e:
+        logger.warning("Indice de municipios sin poligonos: %s", e)
+        return IndiceMunicipios(None)
+
+
+def obtener_indice_secciones():
+    """
+    Indice de secciones censales de Santander del proceso, construido una vez
+    por version del GeoJSON
+    """
+    from s3_loader import GEOJSON_SANTANDER_KEY
+
+    return _indice_cacheado('secciones_santander', GEOJSON_SANTANDER_KEY, IndiceSecciones)
+
+
+def get_indice_espacial_report():
+    """
+    Construcciones y revalidaciones de cada indice, su duracion y la version actual
+    """
+    with _lock:
+        return {nombre: dict(report) for nombre, report in _report.items()}
@@ -0,0 +1,146 @@
+"""
+Modulo con las metricas derivadas de las series de precios por zona
+
+Calcula en una sola pasada vectorizada, para todas las zonas a la vez:
+- variacion_mensual: variacion (%) respecto al registro anterior de la zona
+- variacion_anual: variacion (%) respecto a 12 registros antes
+- variacion_desde_inicio: variacion (%) respecto al primer registro de la zona
+
+El resultado se guarda por version del dataset (ver
+vistas_materializadas.clave_dataset), de modo que cambiar el tipo de
+visualizacion solo selecciona una columna.
+
+Los DataFrames devueltos se comparten entre sesiones: no deben modificarse.
+"""
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+from vistas_materializadas import clave_dataset
+
+logger = logging.getLogger(__name__)
+
+COLUMNAS_METRICAS = ['variacion_mensual', 'variacion_anual', 'variacion_desde_inicio']
+
+_lock = threading.Lock()
+_metricas = {}
+_stats = {'aciertos': 0, 'calculos': 0}
+
+
+class MetricasZonas:
+    """
+    Series con metricas derivadas de un dataset
+
+    Attributes:
+        serie: Todas las filas ordenadas por zona y fecha con las columnas de
+            COLUMNAS_METRICAS añadidas
+        ultimas: Ultima fila de cada zona de serie
+    """
+
+    def __init__(self, version, num_filas, serie, ultimas):
+        self.version = version
+        self.num_filas = num_filas
+        self.serie = serie
+        self.ultimas = ultimas
+
+
+def _variacion(actual, referencia, validos):
+    """
+    Variacion porcentual actual/referencia, NaN donde no hay referencia
+    """
+    resultado = np.full(len(actual), np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        resultado[validos] = (actual[validos] / referencia[validos] - 1) * 100
+    return resultado
+
+
+def _calcular(df, columna_zona, version):
+    """
+    Ordena por zona y fecha y calcula las metricas de todas las zonas
+    """
+    zonas = df[columna_zona]
+    if isinstance(zonas.dtype, pd.CategoricalDtype):
+        codigos = zonas.cat.codes.to_numpy()
+    else:
+        codigos, _ = pd.factorize(zonas, sort=True)
+
+    # Orden estable por zona y fecha (igual que sort_values([zona, 'fecha']))
+    orden = np.lexsort((df['fecha'].to_numpy(), codigos))
+    serie = df.iloc[orden].copy(deep=False)
+    codigos = codigos[orden]
+    precios = serie['precio_m2'].to_numpy(dtype=np.float64)
+
+    # Posicion de cada fila dentro de su zona
+    n = len(serie)
+    inicio_zona = np.ones(n, dtype=bool)
+    inicio_zona[1:] = codigos[1:] != codigos[:-1]
+    inicios = np.flatnonzero(inicio_zona)
+    primera_fila = np.repeat(inicios, np.diff(np.append(inicios, n)))
+    posicion = np.arange(n) - primera_fila
+
+    for columna, periodos in (('variacion_mensual', 1), ('variacion_anual', 12)):
+        validos = posicion >= periodos
+        referencia = np.full(n, np.nan)
+        referencia[periodos:] = precios[:max(n - periodos, 0)]
+        serie[columna] = _variacion(precios, referencia, validos)
+
+    serie['variacion_desde_inicio'] = _variacion(precios, precios[primera_fila], np.ones(n, dtype=bool))
+
+    fin_zona = np.append(inicios[1:], n) - 1
+    ultimas = serie.iloc[fin_zona] if n else serie
+
+    return MetricasZonas(version=version, num_filas=len(df), serie=serie, ultimas=ultimas)
+
+
+def obtener_metricas(df, columna_zona='municipio'):
+    """
+    Devuelve las metricas derivadas de un dataset cargado con s3_loader
+
+    Args:
+        df: DataFrame devuelto por un loader de dominio (con fecha y precio_m2)
+        columna_zona: Columna que identifica la zona
+
+    Returns:
+        MetricasZonas
+    """
+    clave, version = clave_dataset(df, columna_zona)
+    if version is None:
+        return _calcular(df, columna_zona, None)
+
+    with _lock:
+        anterior = _metricas.get(clave)
+        if anterior is not None and anterior.version == version and anterior.num_filas == len(df):
+            _stats['aciertos'] += 1
+            return anterior
+
+    metricas = _calcular(df, columna_zona, version)
+    logger.info("Metricas %s por %s: %d filas", clave[0], columna_zona, len(df))
+
+    with _lock:
+        _metricas[clave] = metricas
+        _stats['calculos'] += 1
+    return metricas
+
+
+def serie_con_metricas(df, columna_zona='municipio'):
+    """
+    Filas del dataset ordenadas por zona y fecha con las metricas derivadas
+    """
+    return obtener_metricas(df, columna_zona).serie
+
+
+def ultimas_metricas(df, columna_zona='municipio'):
+    """
+    Ultima fila de cada zona con sus metricas derivadas
+    """
+    return obtener_metricas(df, columna_zona).ultimas
+
+
+def get_metricas_stats():
+    """
+    Contadores de metricas servidas desde la cache y calculadas
+    """
+    with _lock:
+        return dict(_stats)
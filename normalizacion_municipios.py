@@ -0,0 +1,181 @@
+"""
+Modulo para normalizar nombres de municipios contra los nombres del GeoJSON
+
+Reune en un unico indice, construido una vez por proceso y por conjunto de
+nombres de referencia, las reglas que antes estaban repartidas entre app.py y
+app2.py:
+- Plegado de acentos, mayusculas y espacios ("Pielagos" == "Piélagos")
+- Articulo al final como en el GeoJSON ("El Astillero" -> "Astillero (El)")
+- Localidades que no son municipio ("Ajo" -> "Bareyo", "Isla" -> "Arnuero")
+- Variantes de nombre ("Campoo de Enmedio" -> "Enmedio")
+
+Las series se normalizan sobre sus valores unicos (o sobre las categorias si
+son categoricas) y no fila a fila.
+"""
+import functools
+import logging
+import re
+import unicodedata
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Nombres que difieren entre los datos y el GeoJSON y no se resuelven
+# solo con el plegado de acentos
+MAPEO_MUNICIPIOS = {
+    # Nombres con variaciones
+    'Campoo de Enmedio': 'Enmedio',
+    'Cabuerniga (Valle de)': 'Cabuérniga',
+    'Cabuérniga (Valle de)': 'Cabuérniga',
+}
+
+# Localidades que no son municipios oficiales y su municipio
+ALIAS_LOCALIDADES = {
+    'Ajo': 'Bareyo',  # Ajo es una localidad de Bareyo
+    'Beranga': 'Bareyo',  # Beranga es parte de Bareyo
+    'Boo': 'Piélagos',  # Boo es parte de Piélagos
+    'Cudon': 'Miengo',  # Cudón es parte de Miengo
+    'Guarnizo': 'Camargo',  # Guarnizo es parte de Camargo
+    'Hoznayo': 'Entrambasaguas',  # Hoznayo es parte de Entrambasaguas
+    'Isla': 'Arnuero',  # Isla es parte de Arnuero
+    'Mogro': 'Miengo',  # Mogro es parte de Miengo
+    'Pontejos': 'Marina de Cudeyo',  # Pontejos es parte de Marina de Cudeyo
+    'Puente San Miguel': 'Reocín',  # Puente San Miguel es parte de Reocín
+    'Solares': 'Medio Cudeyo',  # Solares es parte de Medio Cudeyo
+    'Soto de la Marina': 'Marina de Cudeyo',  # Soto de la Marina es parte de Marina de Cudeyo
+    'Vargas': 'Puente Viesgo',  # Vargas es parte de Puente Viesgo
+}
+
+# Nombres oficiales conocidos, para normalizar sin GeoJSON de referencia
+NOMBRES_OFICIALES = [
+    'Astillero (El)', 'Corrales de Buelna (Los)', 'Bárcena de Cicero', 'Cabezón de la Sal',
+    'Ribamontán al Mar', 'Ribamontán al Monte', 'Reocín', 'Solórzano', 'Udías', 'Valdáliga',
+    'Santa María de Cayón', 'Liérganes', 'Piélagos', 'Peñarrubia', 'Bareyo', 'Miengo',
+    'Camargo', 'Entrambasaguas', 'Arnuero', 'Marina de Cudeyo', 'Medio Cudeyo',
+    'Puente Viesgo', 'Enmedio', 'Cabuérniga',
+]
+
+_ARTICULO_FINAL = re.compile(r'^(?P<base>.+?)\s*\((?P<articulo>El|La|Los|Las)\)$')
+
+
+def plegar(nombre):
+    """
+    Clave de comparacion: sin acentos, en minusculas y con espacios simples
+    """
+    sin_acentos = ''.join(
+        c for c in unicodedata.normalize('NFKD', str(nombre))
+        if unicodedata.category(c) != 'Mn'
+    )
+    return ' '.join(sin_acentos.casefold().split())
+
+
+def separar_articulo(nombre):
+    """
+    Articulo y nombre de un municipio con el articulo al final
+
+    Returns:
+        Tupla (articulo, base), p.ej. 'Astillero (El)' -> ('El', 'Astillero'),
+        o None si el nombre no lleva articulo al final
+    """
+    match = _ARTICULO_FINAL.match(nombre)
+    return (match['articulo'], match['base']) if match else None
+
+
+class NormalizadorMunicipios:
+    """
+    Indice precalculado nombre plegado -> nombre de referencia
+    """
+
+    def __init__(self, nombres_referencia):
+        self.nombres_referencia = frozenset(nombres_referencia)
+        self._indice = {}
+
+        for nombre in self.nombres_referencia:
+            self._indice[plegar(nombre)] = nombre
+
+            # "Astillero (El)" tambien se reconoce como "El Astillero"
+            partes = separar_articulo(nombre)
+            if partes:
+                self._indice.setdefault(plegar(' '.join(partes)), nombre)
+
+        for origen, destino in list(MAPEO_MUNICIPIOS.items()) + list(ALIAS_LOCALIDADES.items()):
+            self._indice[plegar(origen)] = self._indice.get(plegar(destino), destino)
+
+    def normalizar(self, nombre):
+        """
+        Normaliza un nombre suelto; si no hay correspondencia se devuelve tal cual
+        """
+        if pd.isna(nombre):
+            return nombre
+        nombre_str = str(nombre).strip()
+        return self._indice.get(plegar(nombre_str), nombre_str)
+
+    def mapeo(self, nombres):
+        """
+        Diccionario nombre -> nombre normalizado para un conjunto de nombres
+        """
+        return {nombre: self.normalizar(nombre) for nombre in nombres if not pd.isna(nombre)}
+
+    def normalizar_serie(self, serie):
+        """
+        Normaliza una serie resolviendo cada valor distinto una sola vez
+
+        Returns:
+            Serie de cadenas con el mismo indice
+        """
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            categorias = serie.cat.categories
+            normalizadas = pd.Index([self.normalizar(c) for c in categorias], dtype=object)
+            codigos = serie.cat.codes.to_numpy()
+            valores = normalizadas.take(codigos).to_numpy(dtype=object)
+            valores[codigos == -1] = None
+            return pd.Series(valores, index=serie.index, name=serie.name)
+
+        return serie.map(self.mapeo(serie.unique())).astype(object)
+
+    def sin_coincidencia(self, serie):
+        """
+        Nombres de la serie que tras normalizar no estan en la referencia
+        """
+        valores = serie.dropna().unique()
+        return sorted(
+            str(nombre) for nombre, normalizado in self.mapeo(valores).items()
+            if normalizado not in self.nombres_referencia
+        )
+
+
+@functools.lru_cache(maxsize=8)
+def _normalizador_para(nombres_referencia):
+    return NormalizadorMunicipios(nombres_referencia)
+
+
+def obtener_normalizador(nombres_referencia=None):
+    """
+    Devuelve el normalizador para unos nombres de referencia (p.ej. los NOMBRE
+    del GeoJSON de municipios), construido una sola vez por proceso
+
+    Args:
+        nombres_referencia: Nombres validos de destino; por defecto los
+            nombres oficiales conocidos
+    """
+    if nombres_referencia is None:
+        nombres_referencia = NOMBRES_OFICIALES
+    return _normalizador_para(frozenset(nombres_referencia))
+
+
+def normalizar_municipios(serie, nombres_referencia=None):
+    """
+    Normaliza una serie de nombres de municipio para hacer matching con el GeoJSON
+
+    Los nombres que no encuentran correspondencia se registran en el log.
+    """
+    normalizador = obtener_normalizador(nombres_referencia)
+    resultado = normalizador.normalizar_serie(serie)
+
+    if nombres_referencia is not None:
+        sin_coincidencia = normalizador.sin_coincidencia(serie)
+        if sin_coincidencia:
+            logger.info("Municipios sin correspondencia en el GeoJSON: %s", ', '.join(sin_coincidencia))
+
+    return resultado
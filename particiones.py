@@ -0,0 +1,399 @@
+"""
+Modulo con los datasets particionados por fecha
+
+En lugar de un unico Parquet con toda la historia, un dataset particionado
+es un prefijo con un Parquet por fecha (rutas en formato Hive):
+
+    raw/precios_municipios_cantabria/fecha=2024-11-01/part-0.parquet
+    raw/precios_municipios_cantabria/fecha=2024-12-01/part-0.parquet
+
+Publicar un mes nuevo es subir un objeto, no reescribir el historico. Los
+ficheros que escribe particionar conservan la columna fecha (constante, se
+comprime a unos pocos bytes) para que el esquema y el orden de las columnas
+sean los del Parquet unico; si un fichero no la tiene se toma de la ruta.
+
+DatasetParticionado guarda en memoria la tabla Arrow de cada particion con
+el ETag de sus ficheros. El listado del prefijo (una peticion por cada 1000
+ficheros en S3) y la version que se deriva de el se reutilizan durante
+LISTADO_REUTILIZABLE_SEGUNDOS; al caducar, la carga solo descarga las
+particiones nuevas o con ficheros cambiados y descarta las que ya no
+existen. La union es una concatenacion de tablas Arrow sin copias, de modo
+que la descarga y el decodificado de una actualizacion dependen del tamaño
+del cambio y no del de la historia. cargar_procesado lleva lo mismo a
+pandas: cada particion se convierte y procesa una sola vez.
+
+Se activa con particionado = true en la seccion [datos] de secrets.toml o
+con la variable de entorno VIVIENDAS_PARTICIONADO=1 (ver
+s3_loader.DATASETS_PARTICIONADOS).
+"""
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+
+from almacenamiento import get_almacen
+from arrow_filters import as_dnf, filter_table
+from trazas import span
+
+logger = logging.getLogger(__name__)
+
+COLUMNA_PARTICION = 'fecha'
+FICHERO_PARTICION = 'part-0.parquet'
+
+# Descargas de particiones simultaneas
+DESCARGAS_SIMULTANEAS = 8
+
+# Un listado mas reciente que esto se reutiliza en la version y en la
+# carga: comprobar la version no lista el prefijo en cada llamada, y la
+# version y la carga ven las mismas particiones. Con manifiesto la version
+# es la suya y el listado solo se usa al cargar (ver s3_loader)
+LISTADO_REUTILIZABLE_SEGUNDOS = 60.0
+
+_PATRON_PARTICION = re.compile(r'(?:^|/)(?P<columna>[^/=]+)=(?P<valor>[^/]+)/[^/]+\.parquet$')
+
+
+def particionado_enabled():
+    """
+    Indica si los datasets historicos se leen particionados por fecha
+    """
+    try:
+        return bool(st.secrets.get("datos", {}).get("particionado", False))
+    except:
+        return os.environ.get('VIVIENDAS_PARTICIONADO', '0') == '1'
+
+
+def prefijo_particionado(clave):
+    """
+    Prefijo del dataset particionado de un Parquet
+    ('raw/precios.parquet' -> 'raw/precios/')
+    """
+    return re.sub(r'\.parquet$', '', clave) + '/'
+
+
+def _valor_particion(valor):
+    return valor.strftime('%Y-%m-%d') if isinstance(valor, (pd.Timestamp, pd.Period)) else str(valor)
+
+
+def particionar(df, prefijo, columna=COLUMNA_PARTICION):
+    """
+    Serializa un DataFrame como dataset particionado por una columna
+
+    Returns:
+        Diccionario {clave: bytes del Parquet de la particion}
+    """
+    objetos = {}
+    for valor, grupo in df.groupby(columna, sort=True):
+        tabla = pa.Table.from_pandas(grupo, preserve_index=False)
+        buffer = io.BytesIO()
+        pq.write_table(tabla, buffer)
+        objetos[f"{prefijo}{columna}={_valor_particion(valor)}/{FICHERO_PARTICION}"] = buffer.getvalue()
+    return objetos
+
+
+def _columna_constante(valor, filas):
+    """
+    Columna de la particion: fecha si el valor lo es, texto si no
+    """
+    try:
+        return pa.array([pd.Timestamp(valor)] * filas, type=pa.timestamp('ns'))
+    except ValueError:
+        return pa.array([valor] * filas, type=pa.string())
+
+
+def _podar(valores, filters, columna):
+    """
+    Valores de particion que pueden cumplir los filtros
+
+    Solo se usan los terminos sobre la columna de particion; una conjuncion
+    sin ninguno no descarta particiones.
+    """
+    dnf = as_dnf(filters)
+    if dnf is None:
+        return valores
+    terminos = [[t for t in conjuncion if t[0] == columna] for conjuncion in dnf]
+    if any(not conjuncion for conjuncion in terminos):
+        return valores
+
+    try:
+        columna_valores = pa.concat_arrays([_columna_constante(valor, 1) for valor in valores])
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Valores de tipos mezclados: no se poda
+        return valores
+    tabla = pa.table({columna: columna_valores, '_posicion': pa.array(range(len(valores)))})
+    return [valores[i] for i in filter_table(tabla, terminos)['_posicion'].to_pylist()]
+
+
+class DatasetParticionado:
+    """
+    Dataset particionado bajo un prefijo del almacen, cargado de forma incremental
+
+    Args:
+        prefijo: Prefijo de las claves (acabado en /)
+        columna: Columna de particion
+    """
+
+    def __init__(self, prefijo, columna=COLUMNA_PARTICION):
+        self.prefijo = prefijo
+        self.columna = columna
+        # valor -> ({clave: ETag}, tabla Arrow)
+        self._particiones = {}
+        # procesar -> (valores, tablas Arrow de las que sale, DataFrame procesado)
+        self._procesadas = {}
+        # (instante, listado, version)
+        self._ultimo_listado = (0.0, None, None)
+        self._lock = threading.Lock()
+        # Una actualizacion a la vez: las cargas simultaneas esperan a la primera
+        self._lock_carga = threading.Lock()
+        self._stats = {
+            'cargas': 0,
+            'listados': 0,
+            'particiones_nuevas': 0,
+            'particiones_cambiadas': 0,
+            'particiones_sin_cambios': 0,
+            'particiones_eliminadas': 0,
+            'particiones_procesadas': 0,
+            'bytes_descargados': 0,
+        }
+
+    def _count(self, stat, amount=1):
+        with self._lock:
+            self._stats[stat] += amount
+
+    def listar(self):
+        """
+        Ficheros de cada particion en el almacen
+
+        Lista siempre el prefijo; la version y la carga reutilizan el ultimo
+        listado si es reciente (ver LISTADO_REUTILIZABLE_SEGUNDOS), de modo
+        que llamar a listar tras publicar una particion la hace visible.
+
+        Returns:
+            Diccionario {valor de particion: {clave: ETag}}
+        """
+        self._count('listados')
+        particiones = {}
+        for clave, etag in get_almacen().listar(self.prefijo).items():
+            match = _PATRON_PARTICION.search(clave)
+            if match and match['columna'] == self.columna:
+                particiones.setdefault(match['valor'], {})[clave] = etag
+        version = _version_listado(particiones) if particiones else None
+        with self._lock:
+            self._ultimo_listado = (time.monotonic(), particiones, version)
+        return particiones
+
+    def _listado_reciente(self):
+        """
+        Ultimo listado y su version, volviendo a listar si ha caducado
+        """
+        with self._lock:
+            instante, listado, version = self._ultimo_listado
+        if listado is None or time.monotonic() - instante >= LISTADO_REUTILIZABLE_SEGUNDOS:
+            self.listar()
+            with self._lock:
+                _, listado, version = self._ultimo_listado
+        return listado, version
+
+    def version(self, listado=None):
+        """
+        Version del dataset: cambia si se añade, cambia o elimina una particion
+
+        Sin listado se usa el ultimo si es reciente, con la version ya
+        calculada; no lista el prefijo en cada llamada.
+        """
+        if listado is None:
+            listado, version = self._listado_reciente()
+        else:
+            version = _version_listado(listado) if listado else None
+        if not listado:
+            raise FileNotFoundError(f"Dataset particionado vacio: {self.prefijo}")
+        return version
+
+    def _descargar(self, valor, ficheros):
+        """
+        Tabla de una particion (todos sus ficheros) con la columna de particion
+        """
+        almacen = get_almacen()
+        tablas = []
+        for clave in sorted(ficheros):
+            contenido, _ = almacen.descargar(clave)
+            self._count('bytes_descargados', len(contenido))
+            tabla = pq.read_table(pa.BufferReader(contenido))
+            if self.columna not in tabla.column_names:
+                tabla = tabla.append_column(self.columna, _columna_constante(valor, tabla.num_rows))
+            # Sin metadatos de pandas, para poder concatenar las particiones
+            tablas.append(tabla.replace_schema_metadata(None))
+        return pa.concat_tables(tablas, promote_options='permissive')
+
+    def _actualizar(self, filters):
+        """
+        Descarga las particiones nuevas o cambiadas que pueden cumplir los
+        filtros (con _lock_carga tomado)
+
+        Returns:
+            (valores seleccionados en orden, {valor: (ETags, tabla)}, vacia)
+        """
+        listado, _ = self._listado_reciente()
+        if not listado:
+            raise FileNotFoundError(f"Dataset particionado vacio: {self.prefijo}")
+
+        with self._lock:
+            # Las particiones que ya no estan se descartan
+            for valor in [v for v in self._particiones if v not in listado]:
+                del self._particiones[valor]
+                self._stats['particiones_eliminadas'] += 1
+            guardadas = dict(self._particiones)
+
+        seleccion = _podar(sorted(listado), filters, self.columna)
+        # Sin particiones que cumplan los filtros se devuelve una tabla
+        # vacia con el esquema de la mas reciente
+        vacia = not seleccion
+        if vacia:
+            seleccion = [max(listado)]
+        pendientes = [v for v in seleccion if v not in guardadas or guardadas[v][0] != listado[v]]
+        self._count('particiones_sin_cambios', len(seleccion) - len(pendientes))
+
+        if pendientes:
+            with span('particiones.descarga', prefijo=self.prefijo, particiones=len(pendientes)):
+                with ThreadPoolExecutor(max_workers=min(DESCARGAS_SIMULTANEAS, len(pendientes))) as executor:
+                    tablas = list(executor.map(lambda v: self._descargar(v, listado[v]), pendientes))
+
+            with self._lock:
+                for valor, tabla in zip(pendientes, tablas):
+                    self._stats['particiones_nuevas' if valor not in guardadas else 'particiones_cambiadas'] += 1
+                    self._particiones[valor] = (listado[valor], tabla)
+                    guardadas[valor] = (listado[valor], tabla)
+            logger.info("%s: %d particiones actualizadas de %d", self.prefijo, len(pendientes), len(listado))
+
+        return seleccion, guardadas, vacia
+
+    def cargar(self, filters=None):
+        """
+        Tabla Arrow del dataset, actualizando solo las particiones que cambian
+
+        Args:
+            filters: Filtros en formato pyarrow; los de la columna de particion
+                evitan descargar las particiones que no los cumplen (el resto
+                de filtros no se aplica aqui)
+
+        Returns:
+            Tabla con las particiones ordenadas por su valor
+        """
+        self._count('cargas')
+        with self._lock_carga:
+            seleccion, guardadas, vacia = self._actualizar(filters)
+
+            # Con promocion de tipos: particiones escritas por herramientas
+            # distintas (p.ej. timestamp en ms o ns, int32 o int64)
+            tabla = pa.concat_tables([guardadas[valor][1] for valor in seleccion], promote_options='permissive')
+            return tabla.slice(0, 0) if vacia else tabla
+
+    def cargar_procesado(self, procesar):
+        """
+        DataFrame del dataset completo con procesar aplicado por particiones
+
+        Se guarda el DataFrame procesado junto a las tablas de las que sale.
+        En una actualizacion las particiones nuevas se concatenan en Arrow,
+        se convierten a pandas y se procesan juntas en una sola llamada, y
+        el resultado se añade al guardado: el coste depende de las
+        particiones nuevas y no de la historia (salvo la concatenacion final
+        en pandas, una copia de memoria). Si cambia o desaparece una
+        particion ya procesada, o aparece una anterior a las procesadas, se
+        procesa todo de nuevo. procesar debe trabajar fila a fila (tipos,
+        columnas derivadas, enriquecimiento), sin agregar entre particiones.
+
+        Args:
+            procesar: Funcion DataFrame -> DataFrame (la misma en cada llamada)
+
+        Returns:
+            DataFrame con las particiones ordenadas por su valor
+        """
+        self._count('cargas')
+        with self._lock_carga:
+            seleccion, guardadas, _ = self._actualizar(None)
+
+            with self._lock:
+                valores, tablas, anterior = self._procesadas.get(procesar, ((), (), None))
+            procesados = set(valores)
+            pendientes = [v for v in seleccion if v not in procesados]
+            # Lo procesado vale si todas sus particiones siguen con la misma
+            # tabla y las nuevas van detras (se publican meses nuevos); si no,
+            # se procesa todo
+            if (any(v not in guardadas or guardadas[v][1] is not t for v, t in zip(valores, tablas))
+                    or (pendientes and valores and min(pendientes) < max(valores))):
+                valores, tablas, anterior = (), (), None
+                pendientes = seleccion
+            if not pendientes:
+                return anterior
+
+            with span('particiones.procesado', prefijo=self.prefijo, particiones=len(pendientes)):
+                tabla = pa.concat_tables([guardadas[v][1] for v in pendientes], promote_options='permissive')
+                nuevo = procesar(tabla.to_pandas())
+                df = nuevo if anterior is None else pd.concat([anterior, _alinear_fechas(nuevo, anterior)], ignore_index=True)
+            valores = tuple(valores) + tuple(pendientes)
+            tablas = tuple(tablas) + tuple(guardadas[v][1] for v in pendientes)
+            with self._lock:
+                self._procesadas[procesar] = (valores, tablas, df)
+                self._stats['particiones_procesadas'] += len(pendientes)
+            return df
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, particiones=len(self._particiones))
+
+
+def _alinear_fechas(df, referencia):
+    """
+    Convierte las fechas de df a la unidad de las de referencia (ms, ns...)
+
+    pandas no concatena columnas de fechas con unidades distintas, que
+    aparecen con particiones escritas por herramientas distintas.
+    """
+    unidades = {
+        columna: referencia[columna].dtype
+        for columna in df.columns
+        if columna in referencia.columns
+        and pd.api.types.is_datetime64_any_dtype(df[columna])
+        and pd.api.types.is_datetime64_any_dtype(referencia[columna])
+        and df[columna].dtype != referencia[columna].dtype
+    }
+    return df.astype(unidades) if unidades else df
+
+
+def _version_listado(listado):
+    """
+    Hash de las claves y ETags de un listado de particiones
+    """
+    claves = sorted((clave, etag) for ficheros in listado.values() for clave, etag in ficheros.items())
+    return '"' + hashlib.sha256(repr(claves).encode('utf-8')).hexdigest()[:32] + '"'
+
+
+_lock = threading.Lock()
+_datasets = {}
+
+
+def get_dataset_particionado(prefijo):
+    """
+    Devuelve el dataset particionado de un prefijo (uno por proceso)
+    """
+    with _lock:
+        if prefijo not in _datasets:
+            _datasets[prefijo] = DatasetParticionado(prefijo)
+        return _datasets[prefijo]
+
+
+def get_particiones_stats():
+    """
+    Contadores de cada dataset particionado cargado en el proceso
+    """
+    with _lock:
+        datasets = dict(_datasets)
+    return {prefijo: dataset.stats() for prefijo, dataset in datasets.items()}
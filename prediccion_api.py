@@ -0,0 +1,325 @@
+"""
+Modulo con el cliente HTTP de la API de prediccion
+
+Todas las predicciones del proceso reutilizan una unica requests.Session con
+un pool de conexiones keep-alive, de modo que las consultas consecutivas no
+repiten el handshake TCP/TLS con API Gateway. Ademas:
+- Los timeouts de conexion y de lectura son independientes: un endpoint
+  inalcanzable falla en segundos y una Lambda en arranque en frio tiene
+  tiempo de responder
+- Los fallos en los que la peticion no llego a procesarse (errores de
+  conexion) o que el gateway marca como transitorios (502, 503, 504) se
+  reintentan un numero limitado de veces con espera exponencial y jitter
+- Se guarda un histograma de latencias de cada consulta
+
+La URL se puede cambiar en secrets.toml (seccion [prediccion]) o con la
+variable de entorno VIVIENDAS_PREDICCION_URL, p.ej. para apuntar a un
+servidor local de pruebas.
+"""
+import logging
+import math
+import os
+import random
+import threading
+import time
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+
+from trazas import trazado
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_URL = "https://nlv0wy2dj3.execute-api.eu-west-1.amazonaws.com/prod/predict"
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 30
+DEFAULT_MAX_REINTENTOS = 2
+DEFAULT_BACKOFF = 0.5
+# Conexiones maximas del pool (las predicciones por lotes usan varias a la vez)
+DEFAULT_POOL_CONNECTIONS = 16
+
+# Respuestas del gateway que indican un fallo transitorio
+ESTADOS_REINTENTABLES = frozenset({502, 503, 504})
+
+# Campos de la consulta, en el orden del formulario de la vista Prediccion
+CAMPOS_PAYLOAD = [
+    'm2_construidos', 'habitaciones', 'banos', 'municipio', 'tipo_inmueble',
+    'estado', 'antiguedad_anios', 'terraza', 'garaje', 'ascensor', 'piscina',
+    'planta', 'gas_natural', 'amueblado', 'orientacion',
+    'calificacion_energetica', 'latitud', 'longitud',
+]
+CAMPOS_ENTEROS = {'m2_construidos', 'habitaciones', 'banos', 'antiguedad_anios'}
+# Campos que se envian aunque valgan 0 (el resto solo si tienen valor)
+CAMPOS_OBLIGATORIOS = {'m2_construidos'}
+CAMPOS_COORDENADAS = {'latitud', 'longitud'}
+
+# Limites superiores (ms) de los intervalos del histograma de latencias
+LIMITES_HISTOGRAMA_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+def _valor_json(valor):
+    """
+    Convierte escalares de numpy/pandas en tipos de Python; None si no hay valor
+    """
+    if valor is None:
+        return None
+    if hasattr(valor, 'item'):
+        valor = valor.item()
+    if isinstance(valor, float) and math.isnan(valor):
+        return None
+    if isinstance(valor, str):
+        valor = valor.strip()
+    return valor
+
+
+def construir_payload(valores):
+    """
+    Construye la consulta a la API con los campos que tienen valor
+
+    La usan el formulario y la prediccion por lotes, de modo que una fila de
+    un fichero genera la misma consulta que el formulario con esos valores.
+
+    Args:
+        valores: Diccionario (o fila de un DataFrame) con campos de
+            CAMPOS_PAYLOAD; los campos desconocidos se ignoran
+
+    Returns:
+        Diccionario listo para enviar como JSON
+    """
+    payload = {}
+    for campo in CAMPOS_PAYLOAD:
+        valor = _valor_json(valores.get(campo))
+        if valor is None:
+            continue
+        if campo in CAMPOS_ENTEROS and isinstance(valor, float) and valor.is_integer():
+            # Columnas enteras con huecos se leen como float
+            valor = int(valor)
+        if campo in CAMPOS_OBLIGATORIOS or campo in CAMPOS_COORDENADAS or valor:
+            payload[campo] = valor
+    return payload
+
+
+class HistogramaLatencias:
+    """
+    Histograma de latencias con intervalos fijos
+    """
+
+    def __init__(self, limites_ms=LIMITES_HISTOGRAMA_MS):
+        self.limites_ms = tuple(limites_ms)
+        self._cuentas = [0] * (len(self.limites_ms) + 1)
+        self._total = 0
+        self._suma_ms = 0.0
+        self._max_ms = 0.0
+
+    def registrar(self, segundos):
+        ms = segundos * 1000
+        posicion = len(self.limites_ms)
+        for i, limite in enumerate(self.limites_ms):
+            if ms <= limite:
+                posicion = i
+                break
+        self._cuentas[posicion] += 1
+        self._total += 1
+        self._suma_ms += ms
+        self._max_ms = max(self._max_ms, ms)
+
+    def percentil(self, p):
+        """
+        Limite superior (ms) del intervalo que contiene el percentil p (0-100)
+        """
+        if not self._total:
+            return None
+        objetivo = p / 100 * self._total
+        acumulado = 0
+        for limite, cuenta in zip(self.limites_ms, self._cuentas):
+            acumulado += cuenta
+            if acumulado >= objetivo:
+                return limite
+        return self._max_ms
+
+    def resumen(self):
+        etiquetas = [f"<={limite} ms" for limite in self.limites_ms] + [f">{self.limites_ms[-1]} ms"]
+        return {
+            'total': self._total,
+            'media_ms': self._suma_ms / self._total if self._total else None,
+            'max_ms': self._max_ms,
+            'p50_ms': self.percentil(50),
+            'p95_ms': self.percentil(95),
+            'p99_ms': self.percentil(99),
+            'intervalos': dict(zip(etiquetas, self._cuentas)),
+        }
+
+
+class ClientePrediccion:
+    """
+    Cliente de la API de prediccion con pool de conexiones y reintentos
+    """
+
+    def __init__(
+        self,
+        api_url=DEFAULT_API_URL,
+        connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+        read_timeout=DEFAULT_READ_TIMEOUT,
+        max_reintentos=DEFAULT_MAX_REINTENTOS,
+        backoff=DEFAULT_BACKOFF,
+        pool_connections=DEFAULT_POOL_CONNECTIONS,
+    ):
+        self.api_url = api_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_reintentos = max_reintentos
+        self.backoff = backoff
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_connections)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._lock = threading.Lock()
+        self._histograma = HistogramaLatencias()
+        self._stats = {
+            'consultas': 0,
+            'intentos': 0,
+            'reintentos': 0,
+            'errores_conexion': 0,
+            'timeouts_lectura': 0,
+            'estados': {},
+        }
+
+    def _espera(self, intento):
+        """
+        Espera antes del reintento intento (1, 2, ...): exponencial con jitter completo
+        """
+        return random.uniform(0, self.backoff * 2 ** (intento - 1))
+
+    def _intentar(self, payload, headers):
+        """
+        Un intento de la consulta, contando su resultado
+        """
+        with self._lock:
+            self._stats['intentos'] += 1
+        try:
+            response = self.session.post(self.api_url, json=payload, headers=headers, timeout=self.timeout)
+        except requests.exceptions.ConnectionError:
+            # Incluye ConnectTimeout: la peticion no llego a la API
+            with self._lock:
+                self._stats['errores_conexion'] += 1
+            raise
+        except requests.exceptions.ReadTimeout:
+            # La API pudo recibir la peticion: no se reintenta
+            with self._lock:
+                self._stats['timeouts_lectura'] += 1
+            raise
+
+        with self._lock:
+            estados = self._stats['estados']
+            estados[response.status_code] = estados.get(response.status_code, 0) + 1
+        return response
+
+    def predecir(self, payload, api_key):
+        """
+        Envia una consulta a la API de prediccion
+
+        Args:
+            payload: Diccionario con las caracteristicas del inmueble
+            api_key: API key del usuario (cabecera x-api-key)
+
+        Returns:
+            requests.Response de la ultima respuesta recibida
+
+        Raises:
+            requests.exceptions.RequestException si no se obtuvo respuesta
+            tras agotar los reintentos
+        """
+        headers = {
+            "Content-Type": "application/json",
+            "x-api-key": api_key,
+        }
+
+        inicio = time.perf_counter()
+        intento = 0
+        try:
+            while True:
+                try:
+                    response = self._intentar(payload, headers)
+                    if response.status_code not in ESTADOS_REINTENTABLES or intento >= self.max_reintentos:
+                        return response
+                    logger.warning("API de prediccion: %s, reintentando", response.status_code)
+                except requests.exceptions.ConnectionError as e:
+                    if intento >= self.max_reintentos:
+                        raise
+                    logger.warning("API de prediccion: error de conexion (%s), reintentando", e)
+
+                intento += 1
+                with self._lock:
+                    self._stats['reintentos'] += 1
+                time.sleep(self._espera(intento))
+        finally:
+            with self._lock:
+                self._stats['consultas'] += 1
+                self._histograma.registrar(time.perf_counter() - inicio)
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self._stats,
+                estados=dict(self._stats['estados']),
+                latencias=self._histograma.resumen(),
+            )
+
+
+_lock = threading.Lock()
+_cliente = None
+
+
+def _read_prediccion_config():
+    """
+    Lee la configuracion del cliente desde secrets.toml o variables de entorno
+    """
+    try:
+        config = st.secrets.get("prediccion", {})
+        return {
+            'api_url': config.get("api_url", DEFAULT_API_URL),
+            'connect_timeout': float(config.get("connect_timeout", DEFAULT_CONNECT_TIMEOUT)),
+            'read_timeout': float(config.get("read_timeout", DEFAULT_READ_TIMEOUT)),
+            'max_reintentos': int(config.get("max_reintentos", DEFAULT_MAX_REINTENTOS)),
+            'backoff': float(config.get("backoff", DEFAULT_BACKOFF)),
+        }
+    except:
+        return {
+            'api_url': os.environ.get('VIVIENDAS_PREDICCION_URL', DEFAULT_API_URL),
+            'connect_timeout': float(os.environ.get('VIVIENDAS_PREDICCION_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT)),
+            'read_timeout': float(os.environ.get('VIVIENDAS_PREDICCION_READ_TIMEOUT', DEFAULT_READ_TIMEOUT)),
+            'max_reintentos': int(os.environ.get('VIVIENDAS_PREDICCION_REINTENTOS', DEFAULT_MAX_REINTENTOS)),
+            'backoff': float(os.environ.get('VIVIENDAS_PREDICCION_BACKOFF', DEFAULT_BACKOFF)),
+        }
+
+
+def get_cliente_prediccion():
+    """
+    Devuelve el cliente de prediccion del proceso
+    """
+    global _cliente
+
+    if _cliente is None:
+        with _lock:
+            if _cliente is None:
+                config = _read_prediccion_config()
+                logger.info("Cliente de prediccion: %s", config['api_url'])
+                _cliente = ClientePrediccion(**config)
+    return _cliente
+
+
+@trazado('prediccion_api.predecir')
+def predecir(payload, api_key):
+    """
+    Atajo de get_cliente_prediccion().predecir(...)
+    """
+    return get_cliente_prediccion().predecir(payload, api_key)
+
+
+def get_prediccion_stats():
+    """
+    Consultas, reintentos, errores y latencias del cliente de prediccion
+    """
+    return get_cliente_prediccion().stats()
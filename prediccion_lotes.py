@@ -0,0 +1,246 @@
+"""
+Modulo con la prediccion por lotes: una consulta a la API por cada fila de
+un fichero CSV o Parquet
+
+Las filas se envian en paralelo con el cliente compartido de prediccion_api
+(mismo pool de conexiones, timeouts y reintentos), con dos limites:
+- concurrencia: consultas en vuelo a la vez
+- peticiones_por_segundo: ritmo maximo de consultas nuevas (cubeta de fichas),
+  para no superar la cuota del API Gateway
+
+Los resultados se devuelven a medida que terminan, de modo que la vista
+puede mostrar el progreso. Las filas que fallan despues de los reintentos del
+cliente se separan para poder reintentarlas o descargarlas aparte.
+
+Las filas sin municipio pero con latitud y longitud lo toman del indice
+espacial de municipios (ver completar_municipios).
+"""
+import io
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+import requests
+import streamlit as st
+
+from prediccion_api import (
+    CAMPOS_COORDENADAS, CAMPOS_ENTEROS, CAMPOS_PAYLOAD, DEFAULT_POOL_CONNECTIONS,
+    construir_payload, get_cliente_prediccion,
+)
+from indice_espacial import obtener_indice_municipios
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCIA = 4
+DEFAULT_PETICIONES_POR_SEGUNDO = 10
+# El pool del cliente no admite mas conexiones simultaneas
+MAX_CONCURRENCIA = DEFAULT_POOL_CONNECTIONS
+
+# Columnas añadidas a las filas fallidas
+COLUMNA_ERROR = 'error'
+COLUMNA_ESTADO_HTTP = 'estado_http'
+
+
+class LimitadorTasa:
+    """
+    Cubeta de fichas: como mucho por_segundo consultas por segundo, con
+    rafagas de hasta rafaga consultas
+    """
+
+    def __init__(self, por_segundo, rafaga=1):
+        self.por_segundo = por_segundo
+        self.rafaga = rafaga
+        self._fichas = rafaga
+        self._instante = time.monotonic()
+        self._lock = threading.Lock()
+
+    def esperar(self):
+        """
+        Bloquea hasta que haya una ficha disponible y la consume
+        """
+        if not self.por_segundo:
+            return
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._fichas = min(self.rafaga, self._fichas + (ahora - self._instante) * self.por_segundo)
+                self._instante = ahora
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return
+                espera = (1 - self._fichas) / self.por_segundo
+            time.sleep(espera)
+
+
+def leer_lote(contenido, nombre):
+    """
+    Lee un fichero de inmuebles (CSV o Parquet) con columnas de CAMPOS_PAYLOAD
+
+    Args:
+        contenido: Bytes del fichero
+        nombre: Nombre del fichero (la extension decide el formato)
+
+    Returns:
+        DataFrame con una fila por inmueble
+
+    Raises:
+        ValueError si el formato no es valido o falta m2_construidos
+    """
+    if nombre.lower().endswith('.parquet'):
+        df = pd.read_parquet(io.BytesIO(contenido))
+    elif nombre.lower().endswith('.csv'):
+        # Los campos categoricos como texto (p.ej. planta "1" no es un numero)
+        numericos = CAMPOS_ENTEROS | CAMPOS_COORDENADAS
+        dtype = {campo: str for campo in CAMPOS_PAYLOAD if campo not in numericos}
+        df = pd.read_csv(io.BytesIO(contenido), dtype=dtype, sep=None, engine='python')
+    else:
+        raise ValueError(f"Formato no soportado: {nombre} (usa CSV o Parquet)")
+
+    if 'm2_construidos' not in df.columns:
+        raise ValueError("El fichero debe tener la columna m2_construidos")
+    return df.reset_index(drop=True)
+
+
+def completar_municipios(df, indice=None):
+    """
+    Rellena el municipio de las filas que no lo tienen a partir de latitud y
+    longitud, con el indice espacial de municipios (todas las filas a la vez)
+
+    Args:
+        df: DataFrame de leer_lote
+        indice: IndiceMunicipios (None = el del proceso)
+
+    Returns:
+        Tupla (DataFrame con la columna municipio, numero de filas completadas)
+    """
+    if not {'latitud', 'longitud'} <= set(df.columns):
+        return df, 0
+
+    municipios = df['municipio'] if 'municipio' in df.columns else pd.Series(None, index=df.index, dtype=object)
+    vacios = municipios.isna() | (municipios.astype(str).str.strip() == '')
+    vacios &= df['latitud'].notna() & df['longitud'].notna()
+    if not vacios.any():
+        return df, 0
+
+    if indice is None:
+        indice = obtener_indice_municipios()
+    localizados = indice.localizar_lote(
+        pd.to_numeric(df.loc[vacios, 'latitud'], errors='coerce'),
+        pd.to_numeric(df.loc[vacios, 'longitud'], errors='coerce'),
+    )['municipio'].dropna()
+
+    df = df.copy()
+    df['municipio'] = municipios.astype(object)
+    df.loc[localizados.index, 'municipio'] = localizados
+    return df, len(localizados)
+
+
+def _predecir_fila(cliente, payload, api_key, limitador, cancelado):
+    """
+    Consulta una fila y devuelve un diccionario con la respuesta o el error
+    """
+    if cancelado.is_set():
+        return {COLUMNA_ERROR: "Cancelado: API key no valida", COLUMNA_ESTADO_HTTP: None}
+
+    limitador.esperar()
+    try:
+        response = cliente.predecir(payload, api_key)
+    except requests.exceptions.RequestException as e:
+        return {COLUMNA_ERROR: f"{type(e).__name__}: {e}", COLUMNA_ESTADO_HTTP: None}
+
+    if response.status_code == 200:
+        try:
+            return response.json()
+        except ValueError:
+            return {COLUMNA_ERROR: "Respuesta no valida", COLUMNA_ESTADO_HTTP: 200}
+
+    if response.status_code == 403:
+        # Con una API key invalida fallarian todas: no enviar las pendientes
+        cancelado.set()
+        return {COLUMNA_ERROR: "API key no valida", COLUMNA_ESTADO_HTTP: 403}
+    return {COLUMNA_ERROR: response.text[:200], COLUMNA_ESTADO_HTTP: response.status_code}
+
+
+def predecir_lote(df, api_key, concurrencia=DEFAULT_CONCURRENCIA, peticiones_por_segundo=DEFAULT_PETICIONES_POR_SEGUNDO, cliente=None):
+    """
+    Envia una consulta por fila y devuelve los resultados segun terminan
+
+    Args:
+        df: DataFrame devuelto por leer_lote
+        api_key: API key del usuario
+        concurrencia: Consultas en vuelo a la vez (como mucho MAX_CONCURRENCIA)
+        peticiones_por_segundo: Ritmo maximo de consultas (0 sin limite)
+        cliente: ClientePrediccion (por defecto el del proceso)
+
+    Yields:
+        Tuplas (indice de la fila en df, diccionario con la respuesta o con
+        las claves error y estado_http)
+    """
+    cliente = cliente or get_cliente_prediccion()
+    concurrencia = max(1, min(int(concurrencia), MAX_CONCURRENCIA))
+    limitador = LimitadorTasa(peticiones_por_segundo)
+    cancelado = threading.Event()
+
+    payloads = [(indice, construir_payload(fila)) for indice, fila in zip(df.index, df.to_dict('records'))]
+
+    with ThreadPoolExecutor(max_workers=concurrencia, thread_name_prefix='prediccion-lote') as executor:
+        futuros = {
+            executor.submit(_predecir_fila, cliente, payload, api_key, limitador, cancelado): indice
+            for indice, payload in payloads
+        }
+        try:
+            for futuro in as_completed(futuros):
+                yield futuros[futuro], futuro.result()
+        finally:
+            # Si se abandona el generador, no enviar las filas pendientes
+            cancelado.set()
+            for futuro in futuros:
+                futuro.cancel()
+
+
+def combinar_resultados(df, resultados):
+    """
+    Une las filas del lote con sus resultados
+
+    Args:
+        df: DataFrame del lote
+        resultados: Diccionario {indice: resultado} de predecir_lote
+
+    Returns:
+        Tupla (filas correctas con las columnas de la respuesta, filas
+        fallidas con las columnas error y estado_http)
+    """
+    fallidos = [i for i, resultado in resultados.items() if COLUMNA_ERROR in resultado]
+    correctos = [i for i, resultado in resultados.items() if COLUMNA_ERROR not in resultado]
+
+    respuestas = pd.DataFrame.from_dict({i: resultados[i] for i in correctos}, orient='index')
+    df_correctos = df.loc[sorted(correctos)].join(respuestas, rsuffix='_prediccion')
+
+    errores = pd.DataFrame.from_dict(
+        {i: resultados[i] for i in fallidos}, orient='index',
+        columns=[COLUMNA_ERROR, COLUMNA_ESTADO_HTTP],
+    )
+    df_fallidos = df.loc[sorted(fallidos)].join(errores)
+    return df_correctos, df_fallidos
+
+
+def get_lotes_config():
+    """
+    Lee la concurrencia y el ritmo por defecto desde secrets.toml o
+    variables de entorno
+
+    Returns:
+        Tupla (concurrencia, peticiones_por_segundo)
+    """
+    try:
+        config = st.secrets.get("prediccion", {})
+        concurrencia = int(config.get("concurrencia_lote", DEFAULT_CONCURRENCIA))
+        por_segundo = float(config.get("peticiones_por_segundo", DEFAULT_PETICIONES_POR_SEGUNDO))
+    except:
+        concurrencia = int(os.environ.get('VIVIENDAS_PREDICCION_CONCURRENCIA', DEFAULT_CONCURRENCIA))
+        por_segundo = float(os.environ.get('VIVIENDAS_PREDICCION_POR_SEGUNDO', DEFAULT_PETICIONES_POR_SEGUNDO))
+
+    return min(concurrencia, MAX_CONCURRENCIA), por_segundo
@@ -0,0 +1,76 @@
+"""
+Modulo para precargar en paralelo los datasets de S3
+
+Lanza todas las cargas a la vez en un pool de hilos, de modo que el arranque
+en frio tarda lo que la descarga mas lenta y no la suma de todas. Las
+funciones que se precargan son los loaders cacheados de s3_loader, asi que
+las vistas obtienen despues los datos directamente de la cache.
+"""
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from trazas import span
+
+logger = logging.getLogger(__name__)
+
+MAX_WORKERS = 6
+
+
+def prefetch_datasets(loaders, max_workers=MAX_WORKERS):
+    """
+    Ejecuta en paralelo un conjunto de loaders
+
+    Args:
+        loaders: Diccionario {nombre: funcion sin argumentos}
+        max_workers: Numero maximo de descargas simultaneas
+
+    Returns:
+        Tupla (resultados, tiempos) con los resultados de cada loader y los
+        segundos que tardo cada uno ('total' incluye el tiempo de pared)
+
+    Raises:
+        La primera excepcion lanzada por un loader, una vez terminados todos
+    """
+    ctx = get_script_run_ctx()
+    timings = {}
+    results = {}
+
+    def run(name, loader):
+        # Los hilos necesitan el contexto de la sesion para usar st.error
+        if ctx is not None:
+            add_script_run_ctx(ctx=ctx)
+        start = time.perf_counter()
+        try:
+            with span(f"precarga.{name}"):
+                return loader()
+        finally:
+            timings[name] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='prefetch') as executor:
+        # Cada tarea con una copia del contexto: sus spans van a la traza del rerun
+        futures = {
+            name: executor.submit(contextvars.copy_context().run, run, name, loader)
+            for name, loader in loaders.items()
+        }
+
+    errors = []
+    for name, future in futures.items():
+        exception = future.exception()
+        if exception is not None:
+            errors.append(exception)
+        else:
+            results[name] = future.result()
+    timings['total'] = time.perf_counter() - start
+
+    for name, seconds in timings.items():
+        logger.info("Precarga %s: %.3f s", name, seconds)
+
+    if errors:
+        raise errors[0]
+
+    return results, timings
@@ -0,0 +1,272 @@
+"""
+Modulo con la cache en disco de objetos S3
+
+Cada objeto descargado se guarda en disco junto con su ETag. Cuando la cache
+de Streamlit caduca, el objeto se revalida con un GET condicional
+(If-None-Match): si no ha cambiado, S3 responde 304 sin cuerpo y se reutiliza
+la copia local. Las entradas se desalojan por LRU al superar el tamaño maximo.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+import streamlit as st
+from botocore.exceptions import ClientError
+
+from s3_ranges import download_object
+
+logger = logging.getLogger(__name__)
+
+# Valores por defecto de la cache en disco
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'viviendas_cantabria', 's3')
+DEFAULT_CACHE_MAX_MB = 512
+
+
+class DiskObjectCache:
+    """
+    Cache en disco de objetos S3 con revalidacion por ETag y desalojo LRU
+
+    Cada entrada son dos ficheros: los bytes del objeto y un .json con el
+    bucket, la clave y el ETag. La fecha de modificacion del fichero de datos
+    se actualiza en cada acierto y sirve como orden LRU, de modo que varios
+    procesos pueden compartir el mismo directorio.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stats = {
+            'aciertos': 0,
+            'fallos': 0,
+            'revalidaciones': 0,
+            'desalojos': 0,
+            'bytes_descargados': 0,
+            'bytes_servidos_desde_disco': 0,
+        }
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _entry_paths(self, bucket, key):
+        digest = hashlib.sha256(f"{bucket}/{key}".encode('utf-8')).hexdigest()
+        return self.cache_dir / f"{digest}.bin", self.cache_dir / f"{digest}.json"
+
+    def _count(self, stat, amount=1):
+        with self._lock:
+            self._stats[stat] += amount
+
+    def _read_meta(self, meta_path):
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _atomic_write(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def lookup(self, bucket, key):
+        """
+        Devuelve la entrada guardada para (bucket, key) sin contactar con S3
+
+        Returns:
+            Diccionario con 'etag', 'size' y 'path', o None si no hay copia local
+        """
+        data_path, meta_path = self._entry_paths(bucket, key)
+        meta = self._read_meta(meta_path)
+        if meta is None or not data_path.exists():
+            return None
+        return {'etag': meta['etag'], 'size': meta['size'], 'path': data_path}
+
+    def fetch(self, s3_client, bucket, key):
+        """
+        Obtiene el contenido de un objeto, revalidando la copia local si existe
+
+        Args:
+            s3_client: Cliente boto3 con el que hacer la peticion
+            bucket: Nombre del bucket
+            key: Clave del objeto
+
+        Returns:
+            Tupla (contenido en bytes, ETag)
+        """
+        data_path, meta_path = self._entry_paths(bucket, key)
+        entry = self.lookup(bucket, key)
+
+        if_none_match = None
+        if entry is not None:
+            if_none_match = entry['etag']
+            self._count('revalidaciones')
+
+        try:
+            data, etag = download_object(s3_client, bucket, key, if_none_match=if_none_match)
+        except ClientError as e:
+            status = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+            if entry is None or status != 304:
+                raise
+
+            # El objeto no ha cambiado: servir la copia local
+            try:
+                data = data_path.read_bytes()
+                os.utime(data_path)
+            except FileNotFoundError:
+                # Otro proceso la ha desalojado despues de consultarla: se
+                # descarta la entrada y se descarga sin condicion
+                self._discard(data_path)
+                data, etag = download_object(s3_client, bucket, key)
+            else:
+                self._count('aciertos')
+                self._count('bytes_servidos_desde_disco', len(data))
+                return data, entry['etag']
+
+        self._count('fallos')
+        self._count('bytes_descargados', len(data))
+
+        self.store(bucket, key, data, etag)
+        return data, etag
+
+    def store(self, bucket, key, data, etag):
+        """
+        Guarda un objeto en la cache y aplica el limite de tamaño
+        """
+        if len(data) > self.max_bytes:
+            # Objeto mayor que toda la cache: no se guarda
+            return
+
+        data_path, meta_path = self._entry_paths(bucket, key)
+        meta = {'bucket': bucket, 'key': key, 'etag': etag, 'size': len(data)}
+
+        try:
+            self._atomic_write(data_path, data)
+            self._atomic_write(meta_path, json.dumps(meta).encode('utf-8'))
+        except OSError as e:
+            logger.warning("No se pudo escribir %s en la cache de disco: %s", key, e)
+            return
+
+        self._evict()
+
+    def _evict(self):
+        """
+        Elimina las entradas menos usadas hasta quedar por debajo del limite
+        """
+        entries = []
+        total = 0
+        for data_path in self.cache_dir.glob('*.bin'):
+            try:
+                stat = data_path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, data_path))
+            total += stat.st_size
+
+        if total <= self.max_bytes:
+            return
+
+        for _, size, data_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._discard(data_path)
+            total -= size
+            self._count('desalojos')
+
+    def _discard(self, data_path):
+        """
+        Elimina una entrada (datos y metadatos) si sigue en disco
+        """
+        for path in (data_path, data_path.with_suffix('.json')):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        """
+        Vacia la cache en disco
+        """
+        for path in list(self.cache_dir.glob('*.bin')) + list(self.cache_dir.glob('*.json')):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        """
+        Contadores de aciertos, fallos, revalidaciones y desalojos
+        """
+        with self._lock:
+            stats = dict(self._stats)
+
+        stats['bytes_en_disco'] = 0
+        for data_path in self.cache_dir.glob('*.bin'):
+            try:
+                stats['bytes_en_disco'] += data_path.stat().st_size
+            except OSError:
+                # Desalojada por otro proceso mientras se recorria el directorio
+                continue
+        stats['max_bytes'] = self.max_bytes
+        return stats
+
+
+_lock = threading.Lock()
+_disk_cache = None
+_disk_cache_configured = False
+
+
+def _read_cache_config():
+    """
+    Lee la configuracion de la cache desde secrets.toml o variables de entorno
+    """
+    try:
+        cache_secrets = st.secrets.get("cache", {})
+        enabled = cache_secrets.get("enabled", True)
+        cache_dir = cache_secrets.get("dir", DEFAULT_CACHE_DIR)
+        max_mb = cache_secrets.get("max_mb", DEFAULT_CACHE_MAX_MB)
+    except:
+        enabled = os.environ.get('VIVIENDAS_CACHE_ENABLED', '1') != '0'
+        cache_dir = os.environ.get('VIVIENDAS_CACHE_DIR', DEFAULT_CACHE_DIR)
+        max_mb = int(os.environ.get('VIVIENDAS_CACHE_MAX_MB', DEFAULT_CACHE_MAX_MB))
+
+    return enabled, cache_dir, max_mb
+
+
+def get_disk_cache():
+    """
+    Devuelve la cache en disco compartida por el proceso
+
+    Returns:
+        DiskObjectCache, o None si la cache esta desactivada o el directorio
+        no se puede crear
+    """
+    global _disk_cache, _disk_cache_configured
+
+    if not _disk_cache_configured:
+        with _lock:
+            if not _disk_cache_configured:
+                enabled, cache_dir, max_mb = _read_cache_config()
+                if enabled:
+                    try:
+                        _disk_cache = DiskObjectCache(cache_dir, int(max_mb) * 1024 * 1024)
+                    except OSError as e:
+                        logger.warning("Cache de disco desactivada (%s): %s", cache_dir, e)
+                _disk_cache_configured = True
+
+    return _disk_cache
+
+
+def get_disk_cache_stats():
+    """
+    Estadisticas de la cache en disco (diccionario vacio si esta desactivada)
+    """
+    disk_cache = get_disk_cache()
+    return disk_cache.stats() if disk_cache is not None else {}
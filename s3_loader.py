@@ -1,77 +1,249 @@
 """
 Modulo para cargar datos desde AWS S3
+
+Los objetos se leen del almacen configurado (ver almacenamiento): el bucket
+de S3 por defecto, o un directorio local o la memoria para trabajar sin
+conexion.
+
+Los datasets de DATASETS_PARTICIONADOS pueden publicarse particionados por
+fecha (ver particiones): entonces se leen de forma incremental, descargando
+y procesando solo las particiones nuevas o cambiadas.
 """
 import streamlit as st
 import pandas as pd
-import boto3
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 import json
-from io import BytesIO
-import os
+from almacenamiento import get_almacen
+from arrow_filters import as_dnf, coerce_filter_value, filter_table, stats_may_match
+from arrow_snapshots import arrow_snapshot
+from compact_schema import compact_dataset
+from comarcas_municipios import COLUMNAS_ENRIQUECIMIENTO, enriquecer_municipios
+from geometria import geojson_simplificado
+from swr_cache import swr_cache
+from s3_manifest import get_data_version
+from particiones import get_dataset_particionado, particionado_enabled, prefijo_particionado
+from trazas import span, trazado
+
+# Objetos de S3 con los datos de cada loader de dominio
+MUNICIPIOS_KEY = 'raw/precios_municipios_cantabria.parquet'
+DISTRITOS_KEY = 'raw/precios_distritos_santander.parquet'
+PORTALES_KEY = 'raw/precios_municipios_cantabria_portales_de_venta.parquet'
+SECCIONES_SANTANDER_KEY = 'raw/precios_secciones_santander_portales_de_venta.parquet'
+GEOJSON_MUNICIPIOS_KEY = 'raw/municipios_cantabria.geojson'
+GEOJSON_SANTANDER_KEY = 'raw/santander.geojson'
+
+# Datasets historicos que se leen particionados por fecha si esta activado
+# (ver particiones.particionado_enabled)
+DATASETS_PARTICIONADOS = (MUNICIPIOS_KEY, DISTRITOS_KEY)
+
+def _particionado(s3_key):
+    """
+    Indica si un dataset se lee de su version particionada por fecha
+    """
+    return s3_key in DATASETS_PARTICIONADOS and particionado_enabled()
 
-def get_s3_config():
+def get_object_version(s3_key, etag=None):
     """
-    Obtiene la configuracion de S3 desde secrets.toml o variables de entorno
+    Devuelve la version actual de un objeto de S3
+
+    Es la version del manifiesto de datos si existe (ver s3_manifest), de
+    modo que una publicacion nueva cambia la version de todos los objetos a
+    la vez. Sin manifiesto es el ETag del objeto: el indicado o, si no se
+    indica, el que devuelve una peticion HEAD. Un dataset particionado tiene
+    la version de su listado de particiones.
     """
-    # Intentar obtener desde secrets de Streamlit
-    try:
-        aws_config = {
-            'region_name': st.secrets.get("aws", {}).get("aws_region", "eu-west-1")
-        }
+    data_version = get_data_version()
+    if data_version is not None:
+        return data_version
+    if etag is not None:
+        return etag
+    if _particionado(s3_key):
+        return get_dataset_particionado(prefijo_particionado(s3_key)).version()
+    return get_almacen().cabecera(s3_key)['etag']
+
+def fetch_object(s3_key):
+    """
+    Descarga un objeto del almacen de datos configurado
 
-        # Solo agregar credenciales si estan en secrets
-        if "aws" in st.secrets:
-            if "aws_access_key_id" in st.secrets["aws"]:
-                aws_config['aws_access_key_id'] = st.secrets["aws"]["aws_access_key_id"]
-            if "aws_secret_access_key" in st.secrets["aws"]:
-                aws_config['aws_secret_access_key'] = st.secrets["aws"]["aws_secret_access_key"]
+    Con S3 pasa por la cache en disco: si hay copia local se revalida con un
+    GET condicional, de modo que un objeto sin cambios cuesta una peticion
+    sin cuerpo en lugar de la descarga.
 
-        bucket = st.secrets.get("s3", {}).get("bucket_name", "viviendas-cantabria-raul")
+    Args:
+        s3_key: Clave del objeto (ruta en el bucket o en el directorio local)
+
+    Returns:
+        Tupla (contenido en bytes, ETag)
+    """
+    almacen = get_almacen()
+    with span('almacen.descarga', clave=s3_key, almacen=almacen.tipo):
+        return almacen.descargar(s3_key)
+
+def _resolve_column(name, schema_names, aliases):
+    """
+    Devuelve la columna del fichero que corresponde a un nombre de salida
+    """
+    for candidate in (aliases or {}).get(name, [name]):
+        if candidate in schema_names:
+            return candidate
+    return None
 
-        return aws_config, bucket
-    except:
-        # Fallback a valores por defecto o variables de entorno
-        aws_config = {
-            'region_name': os.environ.get('AWS_REGION', 'eu-west-1')
-        }
+def _read_parquet_projected(source, columns=None, filters=None, aliases=None):
+    """
+    Lee solo las columnas y row groups necesarios de un Parquet
 
-        # boto3 usara automaticamente las variables de entorno AWS_ACCESS_KEY_ID y AWS_SECRET_ACCESS_KEY
-        # o el archivo ~/.aws/credentials si existen
+    Los row groups se descartan con las estadisticas min/max del footer y las
+    filas restantes se filtran con pyarrow. Las columnas que no existen en el
+    fichero se ignoran.
 
-        bucket = os.environ.get('S3_BUCKET', 'viviendas-cantabria-raul')
+    Args:
+        source: Ruta local o fichero (p.ej. S3RangeFile) con el Parquet
+        columns: Columnas de salida a leer (None = todas)
+        filters: Filtros en formato pyarrow sobre columnas de salida
+        aliases: Diccionario {columna de salida: [columnas candidatas en el fichero]}
 
-        return aws_config, bucket
+    Returns:
+        DataFrame de pandas con las columnas de salida
+    """
+    parquet_file = pq.ParquetFile(source)
+    schema = parquet_file.schema_arrow
+    schema_names = schema.names
+
+    # Columnas del fichero -> columnas de salida
+    rename = {}
+    for name in (columns if columns is not None else (aliases or {})):
+        file_name = _resolve_column(name, schema_names, aliases)
+        if file_name is not None:
+            rename[file_name] = name
+    if columns is None:
+        for name in schema_names:
+            if name not in rename and name not in rename.values():
+                rename[name] = name
+
+    # Filtros traducidos a columnas del fichero y al tipo de cada columna
+    dnf = None
+    if filters:
+        dnf = []
+        for conjunction in as_dnf(filters):
+            resolved = []
+            for name, op, value in conjunction:
+                file_name = _resolve_column(name, schema_names, aliases)
+                if file_name is None:
+                    raise KeyError(f"Columna de filtro no encontrada en el Parquet: {name}")
+                resolved.append((file_name, op, coerce_filter_value(value, schema.field(file_name).type)))
+            dnf.append(resolved)
+
+    # Columnas a leer: las de salida mas las usadas en los filtros
+    read_columns = [name for name in schema_names if name in rename]
+    for conjunction in dnf or []:
+        for file_name, _, _ in conjunction:
+            if file_name not in read_columns:
+                read_columns.append(file_name)
+
+    # Poda de row groups con las estadisticas del footer
+    metadata = parquet_file.metadata
+    column_index = {metadata.schema.column(j).path: j for j in range(metadata.num_columns)}
+    row_groups = []
+    for i in range(metadata.num_row_groups):
+        row_group = metadata.row_group(i)
+        if dnf is None or any(
+            all(
+                stats_may_match(row_group.column(column_index[file_name]).statistics, op, value)
+                for file_name, op, value in conjunction
+            )
+            for conjunction in dnf
+        ):
+            row_groups.append(i)
+
+    table = parquet_file.read_row_groups(row_groups, columns=read_columns, use_pandas_metadata=True)
+
+    if dnf is not None:
+        table = table.filter(pq.filters_to_expression(dnf))
+
+    df = table.to_pandas()
+    df = df.drop(columns=[c for c in read_columns if c not in rename])
+    df = df.rename(columns=rename)
+
+    if columns is not None:
+        df = df[[c for c in columns if c in df.columns]]
+
+    return df
+
+def _project_table(table, columns=None, filters=None, aliases=None):
+    """
+    Aplica columnas, filtros y alias (como _read_parquet_projected) sobre una
+    tabla de Arrow ya cargada
 
-@st.cache_data(ttl=600)  # Cache por 10 minutos
-def load_parquet_from_s3(s3_key):
+    Returns:
+        DataFrame de pandas con las columnas de salida
+    """
+    names = table.column_names
+    rename = {}
+    for name in (columns if columns is not None else (aliases or {})):
+        file_name = _resolve_column(name, names, aliases)
+        if file_name is not None:
+            rename[file_name] = name
+    table = table.rename_columns([rename.get(name, name) for name in names])
+
+    table = filter_table(table, filters)
+    if columns is not None:
+        table = table.select([c for c in columns if c in table.column_names])
+
+    return table.to_pandas()
+
+@swr_cache(ttl=600, version_func=get_data_version)  # Cache hasta que cambie la version de los datos
+def load_parquet_from_s3(s3_key, columns=None, filters=None, aliases=None):
     """
     Carga un archivo parquet desde S3
 
+    Sin columnas ni filtros se descarga el objeto completo (pasando por la
+    cache en disco). Con columnas o filtros solo se leen el footer y los
+    column chunks de los row groups que pueden cumplir los filtros, desde la
+    copia en disco si esta al dia o mediante peticiones por rango a S3.
+
     Args:
         s3_key: Ruta del archivo en S3 (ej: 'raw/precios_distritos_santander.parquet')
+        columns: Columnas a leer (None = todas)
+        filters: Filtros en formato pyarrow (ej: [('fecha', '>=', '2024-01-01')])
+        aliases: Nombres alternativos de columnas en el fichero
+            (ej: {'municipio': ['municipio', 'distrito']})
+
+    Si el dataset esta particionado por fecha se actualizan solo las
+    particiones nuevas o cambiadas y los filtros sobre la fecha evitan
+    descargar las que no los cumplen.
 
     Returns:
         DataFrame de pandas con los datos
     """
     try:
-        # Obtener configuracion
-        aws_config, bucket = get_s3_config()
+        if _particionado(s3_key):
+            table = get_dataset_particionado(prefijo_particionado(s3_key)).cargar(filters)
+            with span('parquet.particiones', clave=s3_key, filas=table.num_rows):
+                return _project_table(table, columns=columns, filters=filters, aliases=aliases)
 
-        # Crear cliente S3
-        s3_client = boto3.client('s3', **aws_config)
+        if columns is None and filters is None and aliases is None:
+            # Descargar el archivo (o revalidar la copia en disco)
+            content, _ = fetch_object(s3_key)
 
-        # Descargar el archivo
-        response = s3_client.get_object(Bucket=bucket, Key=s3_key)
+            # Leer el contenido como parquet sin copiar el buffer descargado
+            with span('parquet.decodificacion', clave=s3_key):
+                df = pq.read_table(pa.BufferReader(content)).to_pandas()
 
-        # Leer el contenido como parquet
-        df = pd.read_parquet(BytesIO(response['Body'].read()))
+            return df
 
-        return df
+        # Copia en disco al dia, lecturas por rango a S3 o fichero local
+        source = get_almacen().abrir(s3_key)
+
+        with span('parquet.lectura_proyectada', clave=s3_key):
+            return _read_parquet_projected(source, columns=columns, filters=filters, aliases=aliases)
 
     except Exception as e:
         st.error(f"Error al cargar datos desde S3 ({s3_key}): {str(e)}")
         raise e
 
-@st.cache_data(ttl=600)  # Cache por 10 minutos
+@swr_cache(ttl=600, version_func=get_data_version)  # Cache hasta que cambie la version de los datos
 def load_json_from_s3(s3_key):
     """
     Carga un archivo JSON desde S3
@@ -83,18 +255,12 @@ def load_json_from_s3(s3_key):
         Diccionario con el contenido JSON
     """
     try:
-        # Obtener configuracion
-        aws_config, bucket = get_s3_config()
-
-        # Crear cliente S3
-        s3_client = boto3.client('s3', **aws_config)
-
-        # Descargar el archivo
-        response = s3_client.get_object(Bucket=bucket, Key=s3_key)
+        # Descargar el archivo (o revalidar la copia en disco)
+        content, _ = fetch_object(s3_key)
 
         # Leer el contenido como JSON
-        content = response['Body'].read().decode('utf-8')
-        data = json.loads(content)
+        with span('json.decodificacion', clave=s3_key):
+            data = json.loads(content.decode('utf-8'))
 
         return data
 
@@ -102,86 +268,222 @@ def load_json_from_s3(s3_key):
         st.error(f"Error al cargar JSON desde S3 ({s3_key}): {str(e)}")
         raise e
 
-@st.cache_data(ttl=600)
-def load_municipios_data():
+@swr_cache(ttl=600, version_func=get_data_version)  # Cache hasta que cambie la version de los datos
+def load_geojson_simplificado(s3_key, nivel):
     """
-    Carga datos de precios por municipios desde S3
+    Carga un GeoJSON desde S3 simplificado a un nivel de detalle
+
+    Los niveles (ver geometria.NIVELES) se calculan todos a la vez una sola
+    vez por version (ETag) del GeoJSON.
+
+    Args:
+        s3_key: Ruta del archivo en S3
+        nivel: Nivel de simplificacion ('alto', 'medio' o 'bajo')
+
+    Returns:
+        Diccionario con el FeatureCollection simplificado
     """
     try:
-        # Cargar datos desde S3
-        df = load_parquet_from_s3('raw/precios_municipios_cantabria.parquet')
+        content, etag = fetch_object(s3_key)
+        version = get_object_version(s3_key, etag=etag)
+        with span('geometria.simplificacion', clave=s3_key, nivel=nivel):
+            return geojson_simplificado(s3_key, version, json.loads(content.decode('utf-8')), nivel)
 
-        # Renombrar columna 'distrito' a 'municipio' si es necesario
-        if 'distrito' in df.columns and 'municipio' not in df.columns:
-            df = df.rename(columns={'distrito': 'municipio'})
+    except Exception as e:
+        st.error(f"Error al simplificar GeoJSON desde S3 ({s3_key}): {str(e)}")
+        raise e
 
-        # Procesar datos
-        df['fecha'] = pd.to_datetime(df['fecha'])
+def _projection_args(columns, filters, required, aliases):
+    """
+    Argumentos de lectura para un loader de dominio con proyeccion
 
-        # El parquet ya deberia tener precio_m2 como numerico
-        # pero lo verificamos por si acaso
-        if df['precio_m2'].dtype == 'object':
-            df['precio_m2'] = pd.to_numeric(df['precio_m2'], errors='coerce')
+    Añade a las columnas pedidas las que el loader necesita para procesar los
+    datos. Sin columnas ni filtros se lee el fichero completo.
+    """
+    if columns is None and filters is None:
+        return {}
 
-        df = df.dropna(subset=['precio_m2'])
+    read_columns = None
+    if columns is not None:
+        read_columns = list(columns) + [c for c in required if c not in columns]
 
-        # Generar fecha_texto si no existe
-        if 'fecha_texto' not in df.columns:
-            df['fecha_texto'] = df['fecha'].dt.strftime('%Y-%m')
+    return {'columns': read_columns, 'filters': filters, 'aliases': aliases}
+
+def _enrich_municipios(df, columns):
+    """
+    Añade comarca, lat y lon (las que se hayan pedido) a un dataset por municipio
+
+    Al hacerse dentro del loader queda guardado en el snapshot y en la cache,
+    de modo que se calcula una vez por version del dataset.
+    """
+    enrich_columns = [c for c in COLUMNAS_ENRIQUECIMIENTO if columns is None or c in columns]
+    if not enrich_columns or 'municipio' not in df.columns:
+        return df
+    return enriquecer_municipios(df, columnas=enrich_columns)
 
+def _fecha_texto(fechas):
+    """
+    Año y mes ('2024-01') de cada fecha
+
+    Solo se formatean las fechas distintas (una por mes, frente a una fila
+    por zona y mes), de modo que no crece con el numero de zonas.
+    """
+    codigos, unicas = pd.factorize(fechas)
+    # El codigo -1 (NaT) toma el ultimo elemento: NaN
+    textos = np.append(unicas.strftime('%Y-%m').to_numpy(dtype=object), np.nan)
+    return pd.Series(textos[codigos], index=fechas.index)
+
+def _select_columns(df, columns):
+    """
+    Devuelve solo las columnas pedidas (todas si columns es None)
+    """
+    if columns is None:
         return df
+    return df[[c for c in columns if c in df.columns]]
+
+@trazado()
+@swr_cache(ttl=600, version_func=get_data_version)
+@compact_dataset('municipios')
+@arrow_snapshot('municipios', lambda: get_object_version(MUNICIPIOS_KEY))
+def load_municipios_data(columns=None, filters=None):
+    """
+    Carga datos de precios por municipios desde S3
+
+    Args:
+        columns: Columnas a devolver (None = todas)
+        filters: Filtros sobre las filas en formato pyarrow, p.ej.
+            [('fecha', '>=', '2024-01-01'), ('municipio', 'in', ['Santander', 'Laredo'])]
+    """
+    try:
+        if columns is None and filters is None and _particionado(MUNICIPIOS_KEY):
+            # Historico completo particionado: cada particion se procesa una sola vez
+            return get_dataset_particionado(prefijo_particionado(MUNICIPIOS_KEY)).cargar_procesado(_procesar_municipios)
+
+        # Cargar datos desde S3 (solo las columnas y filas necesarias)
+        df = load_parquet_from_s3(
+            MUNICIPIOS_KEY,
+            **_projection_args(columns, filters, ['municipio', 'fecha', 'precio_m2'], {'municipio': ['municipio', 'distrito']})
+        )
+
+        return _select_columns(_procesar_municipios(df, columns), columns)
 
     except Exception as e:
         st.error(f"Error al procesar datos de municipios: {str(e)}")
         raise e
 
-@st.cache_data(ttl=600)
-def load_distritos_data():
+def _procesar_municipios(df, columns=None):
     """
-    Carga datos de precios por distritos de Santander desde S3
+    Tipos, fecha_texto y enriquecimiento de los precios por municipio
     """
-    try:
-        # Cargar datos desde S3
-        df = load_parquet_from_s3('raw/precios_distritos_santander.parquet')
+    # Renombrar columna 'distrito' a 'municipio' si es necesario
+    if 'distrito' in df.columns and 'municipio' not in df.columns:
+        df = df.rename(columns={'distrito': 'municipio'})
 
-        # Procesar datos
-        df['fecha'] = pd.to_datetime(df['fecha'])
+    # Procesar datos
+    df['fecha'] = pd.to_datetime(df['fecha'])
 
-        # El parquet ya deberia tener precio_m2 como numerico
-        # pero lo verificamos por si acaso
-        if df['precio_m2'].dtype == 'object':
-            df['precio_m2'] = pd.to_numeric(df['precio_m2'], errors='coerce')
+    # El parquet ya deberia tener precio_m2 como numerico
+    # pero lo verificamos por si acaso
+    if df['precio_m2'].dtype == 'object':
+        df['precio_m2'] = pd.to_numeric(df['precio_m2'], errors='coerce')
 
-        df = df.dropna(subset=['precio_m2'])
+    df = df.dropna(subset=['precio_m2'])
 
-        # Generar fecha_texto si no existe
-        if 'fecha_texto' not in df.columns:
-            df['fecha_texto'] = df['fecha'].dt.strftime('%Y-%m')
+    # Generar fecha_texto si no existe (y se ha pedido)
+    if 'fecha_texto' not in df.columns and (columns is None or 'fecha_texto' in columns):
+        df['fecha_texto'] = _fecha_texto(df['fecha'])
 
-        return df
+    # Comarca y coordenadas de cada municipio
+    return _enrich_municipios(df, columns)
+
+@trazado()
+@swr_cache(ttl=600, version_func=get_data_version)
+@compact_dataset('distritos')
+@arrow_snapshot('distritos', lambda: get_object_version(DISTRITOS_KEY))
+def load_distritos_data(columns=None, filters=None):
+    """
+    Carga datos de precios por distritos de Santander desde S3
+
+    Args:
+        columns: Columnas a devolver (None = todas)
+        filters: Filtros sobre las filas en formato pyarrow, p.ej.
+            [('fecha', '>=', '2024-01-01'), ('distrito', 'in', ['Centro', 'Sardinero'])]
+    """
+    try:
+        if columns is None and filters is None and _particionado(DISTRITOS_KEY):
+            # Historico completo particionado: cada particion se procesa una sola vez
+            return get_dataset_particionado(prefijo_particionado(DISTRITOS_KEY)).cargar_procesado(_procesar_distritos)
+
+        # Cargar datos desde S3 (solo las columnas y filas necesarias)
+        df = load_parquet_from_s3(
+            DISTRITOS_KEY,
+            **_projection_args(columns, filters, ['fecha', 'precio_m2'], None)
+        )
+
+        return _select_columns(_procesar_distritos(df, columns), columns)
 
     except Exception as e:
         st.error(f"Error al procesar datos de distritos: {str(e)}")
         raise e
 
-def load_geojson_municipios():
+def _procesar_distritos(df, columns=None):
+    """
+    Tipos y fecha_texto de los precios por distrito
+    """
+    # Procesar datos
+    df['fecha'] = pd.to_datetime(df['fecha'])
+
+    # El parquet ya deberia tener precio_m2 como numerico
+    # pero lo verificamos por si acaso
+    if df['precio_m2'].dtype == 'object':
+        df['precio_m2'] = pd.to_numeric(df['precio_m2'], errors='coerce')
+
+    df = df.dropna(subset=['precio_m2'])
+
+    # Generar fecha_texto si no existe (y se ha pedido)
+    if 'fecha_texto' not in df.columns and (columns is None or 'fecha_texto' in columns):
+        df['fecha_texto'] = _fecha_texto(df['fecha'])
+
+    return df
+
+@trazado()
+def load_geojson_municipios(nivel=None):
     """
     Carga el archivo GeoJSON de municipios desde S3
+
+    Args:
+        nivel: Nivel de simplificacion de la geometria (None = original)
     """
     try:
-        return load_json_from_s3('raw/municipios_cantabria.geojson')
+        if nivel is not None:
+            return load_geojson_simplificado(GEOJSON_MUNICIPIOS_KEY, nivel)
+        return load_json_from_s3(GEOJSON_MUNICIPIOS_KEY)
     except Exception as e:
         st.error(f"Error al cargar GeoJSON de municipios: {str(e)}")
         raise e
 
-@st.cache_data(ttl=600)
-def load_portales_data():
+@trazado()
+@swr_cache(ttl=600, version_func=get_data_version)
+@compact_dataset('portales')
+@arrow_snapshot('portales', lambda: get_object_version(PORTALES_KEY))
+def load_portales_data(columns=None, filters=None):
     """
     Carga datos de precios de portales de venta (Idealista + Fotocasa) desde S3
+
+    Args:
+        columns: Columnas a devolver (None = todas)
+        filters: Filtros sobre las filas en formato pyarrow, p.ej.
+            [('fecha', '>=', '2024-01-01'), ('municipio', 'in', ['Santander', 'Laredo'])]
     """
     try:
-        # Cargar datos desde S3
-        df = load_parquet_from_s3('raw/precios_municipios_cantabria_portales_de_venta.parquet')
+        # Cargar datos desde S3 (solo las columnas y filas necesarias)
+        df = load_parquet_from_s3(
+            PORTALES_KEY,
+            **_projection_args(columns, filters, ['municipio', 'fecha', 'precio_m2'], {
+                'municipio': ['municipio', 'distrito'],
+                'precio_m2': ['precio_m2_medio', 'precio_m2', 'precio_m2_mediano'],
+            })
+        )
 
         # Renombrar columna 'distrito' a 'municipio' si es necesario
         if 'distrito' in df.columns and 'municipio' not in df.columns:
@@ -198,7 +500,7 @@ def load_portales_data():
             df['fecha'] = pd.to_datetime(df['fecha'])
             # Generar fecha_texto si no existe
             if 'fecha_texto' not in df.columns:
-                df['fecha_texto'] = df['fecha'].dt.strftime('%Y-%m')
+                df['fecha_texto'] = _fecha_texto(df['fecha'])
         else:
             # Si no hay fecha, crear una fecha ficticia (datos actuales)
             import datetime
@@ -215,19 +517,33 @@ def load_portales_data():
         else:
             raise ValueError("No se encontro columna de precio (precio_m2, precio_m2_medio o precio_m2_mediano)")
 
-        return df
+        # Comarca y coordenadas de cada municipio
+        df = _enrich_municipios(df, columns)
+
+        return _select_columns(df, columns)
 
     except Exception as e:
         st.error(f"Error al procesar datos de portales: {str(e)}")
         raise e
 
-@st.cache_data(ttl=600)
-def load_secciones_santander_portales_data():
+@trazado()
+@swr_cache(ttl=600, version_func=get_data_version)
+@compact_dataset('secciones_santander_portales')
+@arrow_snapshot('secciones_santander_portales', lambda: get_object_version(SECCIONES_SANTANDER_KEY))
+def load_secciones_santander_portales_data(columns=None, filters=None):
     """
     Carga datos de precios por secciones censales de Santander (Portales)
+
+    Args:
+        columns: Columnas a devolver (None = todas)
+        filters: Filtros sobre las filas en formato pyarrow, p.ej.
+            [('distrito', '==', '01'), ('seccion', 'in', ['01001', '01002'])]
     """
     try:
-        df = load_parquet_from_s3('raw/precios_secciones_santander_portales_de_venta.parquet')
+        df = load_parquet_from_s3(
+            SECCIONES_SANTANDER_KEY,
+            **_projection_args(columns, filters, ['precio_m2'], {'precio_m2': ['precio_m2_medio', 'precio_m2']})
+        )
 
         # Renombrar precio_m2_medio a precio_m2 para consistencia
         if 'precio_m2_medio' in df.columns:
@@ -238,19 +554,25 @@ def load_secciones_santander_portales_data():
             df['precio_m2'] = pd.to_numeric(df['precio_m2'], errors='coerce')
 
         df = df.dropna(subset=['precio_m2'])
-        return df
+        return _select_columns(df, columns)
 
     except Exception as e:
         st.error(f"Error al procesar datos de secciones Santander: {str(e)}")
         raise e
 
-@st.cache_data(ttl=600)
-def load_geojson_santander():
+@trazado()
+@swr_cache(ttl=600, version_func=get_data_version)
+def load_geojson_santander(nivel=None):
     """
     Carga el archivo GeoJSON de secciones censales de Santander
+
+    Args:
+        nivel: Nivel de simplificacion de la geometria (None = original)
     """
     try:
-        return load_json_from_s3('raw/santander.geojson')
+        if nivel is not None:
+            return load_geojson_simplificado(GEOJSON_SANTANDER_KEY, nivel)
+        return load_json_from_s3(GEOJSON_SANTANDER_KEY)
     except Exception as e:
         st.error(f"Error al cargar GeoJSON de Santander: {str(e)}")
         raise e
@@ -0,0 +1,177 @@
+"""
+Modulo con el manifiesto de versiones de los datos publicados en S3
+
+El ETL publica junto a los Parquet un objeto pequeño (por defecto
+raw/manifest.json) con la version de la publicacion y los metadatos de cada
+fichero, p.ej.:
+
+    {
+        "version": "2024-06-01T03:00:00Z",
+        "objetos": {
+            "raw/precios_municipios_cantabria.parquet": {
+                "checksum": "9e107d9d372bb6826bd81d3542a419d6",
+                "registros": 12345,
+                "timestamp": "2024-06-01T02:58:11Z"
+            }
+        }
+    }
+
+La version del manifiesto se usa como clave de todas las caches (loaders,
+snapshots, vistas, figuras): duran hasta que se publican datos nuevos y una
+publicacion las invalida todas a la vez. El manifiesto se revalida como
+mucho cada manifest_interval segundos (seccion [cache] de secrets.toml, 60
+por defecto) con un GET condicional: un 304 sin cuerpo si no ha cambiado
+(con el almacen local o en memoria basta comparar el ETag).
+
+Si no existe el manifiesto, get_data_version() devuelve None y cada objeto
+se versiona con su ETag.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+import streamlit as st
+
+from almacenamiento import get_almacen
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MANIFEST_KEY = 'raw/manifest.json'
+DEFAULT_MANIFEST_INTERVAL = 60
+
+
+class ManifestWatcher:
+    """
+    Copia en memoria del manifiesto, revalidada como mucho cada interval segundos
+    """
+
+    def __init__(self, key, interval):
+        self.key = key
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._manifest = None
+        self._etag = None
+        self._checked_at = None
+        self._checking = False
+        self._first_check = threading.Event()
+        self._stats = {'comprobaciones': 0, 'sin_cambios': 0, 'cambios': 0, 'errores': 0}
+
+    def _fetch(self):
+        """
+        Descarga el manifiesto si ha cambiado desde la ultima comprobacion
+        """
+        try:
+            respuesta = get_almacen().descargar_si_cambia(self.key, self._etag)
+        except FileNotFoundError:
+            self._manifest, self._etag = None, None
+            return 'cambios'
+        if respuesta is None:
+            return 'sin_cambios'
+
+        contenido, etag = respuesta
+        manifest = json.loads(contenido.decode('utf-8'))
+        # Sin campo version, el ETag del propio manifiesto identifica la publicacion
+        manifest.setdefault('version', etag)
+        self._manifest, self._etag = manifest, etag
+        return 'cambios'
+
+    def get(self):
+        """
+        Devuelve el manifiesto actual (None si no existe o no se pudo leer)
+
+        Mientras un hilo revalida, los demas reciben la copia anterior.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._checked_at is not None and (self._checking or now - self._checked_at < self.interval):
+                return self._manifest
+            # La primera comprobacion la hace un solo hilo y los demas la esperan
+            first_check_running = self._checking
+            self._checking = True
+
+        if first_check_running:
+            self._first_check.wait()
+            return self._manifest
+
+        try:
+            result = self._fetch()
+            with self._lock:
+                self._stats['comprobaciones'] += 1
+                self._stats[result] += 1
+            if result == 'cambios':
+                logger.info("Manifiesto %s: version %s", self.key, self.version())
+        except Exception as e:
+            with self._lock:
+                self._stats['errores'] += 1
+            logger.warning("No se pudo leer el manifiesto %s: %s", self.key, e)
+        finally:
+            with self._lock:
+                self._checked_at = time.monotonic()
+                self._checking = False
+            self._first_check.set()
+
+        return self._manifest
+
+    def version(self):
+        manifest = self._manifest
+        return manifest['version'] if manifest is not None else None
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, version=self.version())
+
+
+_lock = threading.Lock()
+_watcher = None
+
+
+def _read_manifest_config():
+    """
+    Lee la clave del manifiesto y el intervalo de revalidacion desde
+    secrets.toml o variables de entorno
+    """
+    try:
+        key = st.secrets.get("s3", {}).get("manifest_key", DEFAULT_MANIFEST_KEY)
+        interval = st.secrets.get("cache", {}).get("manifest_interval", DEFAULT_MANIFEST_INTERVAL)
+    except:
+        key = os.environ.get('VIVIENDAS_MANIFEST_KEY', DEFAULT_MANIFEST_KEY)
+        interval = int(os.environ.get('VIVIENDAS_MANIFEST_INTERVAL', DEFAULT_MANIFEST_INTERVAL))
+
+    return key, interval
+
+
+def get_manifest_watcher():
+    """
+    Devuelve el vigilante del manifiesto del proceso
+    """
+    global _watcher
+
+    if _watcher is None:
+        with _lock:
+            if _watcher is None:
+                _watcher = ManifestWatcher(*_read_manifest_config())
+    return _watcher
+
+
+def get_manifest():
+    """
+    Manifiesto actual (diccionario) o None si no hay
+    """
+    return get_manifest_watcher().get()
+
+
+def get_data_version():
+    """
+    Version de la publicacion de datos actual, o None si no hay manifiesto
+    """
+    manifest = get_manifest()
+    return manifest['version'] if manifest is not None else None
+
+
+def get_manifest_stats():
+    """
+    Comprobaciones del manifiesto y version actual
+    """
+    return get_manifest_watcher().stats()
@@ -0,0 +1,275 @@
+"""
+Modulo con lecturas por rangos de bytes sobre objetos S3
+
+Permite a pyarrow leer solo el footer y los column chunks necesarios de un
+Parquet en S3 en lugar de descargar el objeto completo, y descargar los
+objetos grandes en varias partes concurrentes.
+"""
+import io
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+# Tamaño minimo de cada peticion por rango: evita muchas peticiones pequeñas
+# cuando pyarrow lee cabeceras de paginas consecutivas
+MIN_RANGE_SIZE = 64 * 1024
+
+# Descarga por partes: los objetos de hasta MULTIPART_THRESHOLD bytes se
+# descargan con una sola peticion
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+MIN_PART_SIZE = 4 * 1024 * 1024
+MAX_PART_SIZE = 32 * 1024 * 1024
+MAX_CONCURRENCY = 8
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+_executor_lock = threading.Lock()
+_executor = None
+_download_stats = {
+    'descargas_simples': 0,
+    'descargas_por_partes': 0,
+    'partes': 0,
+    'bytes': 0,
+    # Tiempo de las descargas completas (para el caudal)
+    'segundos': 0.0,
+}
+
+
+class S3RangeFile(io.RawIOBase):
+    """
+    Fichero de solo lectura respaldado por peticiones GET con cabecera Range
+
+    Cada lectura pide a S3 el rango exacto (con un minimo de MIN_RANGE_SIZE) y
+    fija If-Match con el ETag inicial, de modo que si el objeto cambia a mitad
+    de la lectura la peticion falla en lugar de mezclar versiones.
+    """
+
+    def __init__(self, s3_client, bucket, key, size=None, etag=None):
+        super().__init__()
+        self._client = s3_client
+        self._bucket = bucket
+        self._key = key
+
+        if size is None or etag is None:
+            head = s3_client.head_object(Bucket=bucket, Key=key)
+            size = head['ContentLength']
+            etag = head['ETag']
+
+        self._size = size
+        self._etag = etag
+        self._pos = 0
+        self._buffer_start = 0
+        self._buffer = b''
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.bytes_read = 0
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def etag(self):
+        return self._etag
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self._size + offset
+        else:
+            raise ValueError(f"whence no valido: {whence}")
+
+        if pos < 0:
+            raise ValueError("Posicion negativa")
+        self._pos = pos
+        return self._pos
+
+    def _fetch(self, start, end):
+        """
+        Descarga los bytes [start, end) del objeto
+        """
+        response = self._client.get_object(
+            Bucket=self._bucket,
+            Key=self._key,
+            Range=f"bytes={start}-{end - 1}",
+            IfMatch=self._etag,
+        )
+        data = response['Body'].read()
+        self.requests += 1
+        self.bytes_read += len(data)
+        return data
+
+    def read(self, size=-1):
+        with self._lock:
+            if self._pos >= self._size:
+                return b''
+
+            if size is None or size < 0:
+                end = self._size
+            else:
+                end = min(self._pos + size, self._size)
+
+            buffer_end = self._buffer_start + len(self._buffer)
+            if not (self._buffer_start <= self._pos and end <= buffer_end):
+                fetch_end = min(max(end, self._pos + MIN_RANGE_SIZE), self._size)
+                self._buffer = self._fetch(self._pos, fetch_end)
+                self._buffer_start = self._pos
+
+            offset = self._pos - self._buffer_start
+            data = self._buffer[offset:offset + (end - self._pos)]
+            self._pos += len(data)
+            return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+def _get_executor():
+    """
+    Pool de hilos compartido por todas las descargas por partes
+
+    Al ser comun, la concurrencia total contra S3 queda acotada aunque varias
+    descargas grandes coincidan (p.ej. durante la precarga).
+    """
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY, thread_name_prefix='s3-part')
+    return _executor
+
+
+def _count(stat, amount=1):
+    with _executor_lock:
+        _download_stats[stat] += amount
+
+
+def _read_into(body, view):
+    """
+    Copia el cuerpo de una respuesta en un trozo del buffer de destino
+    """
+    offset = 0
+    for chunk in body.iter_chunks(STREAM_CHUNK_SIZE):
+        view[offset:offset + len(chunk)] = chunk
+        offset += len(chunk)
+    if offset != len(view):
+        raise IOError(f"Descarga incompleta: {offset} de {len(view)} bytes")
+
+
+def plan_parts(size, first_part_size=MULTIPART_THRESHOLD):
+    """
+    Reparte los bytes que quedan tras la primera parte en rangos concurrentes
+
+    El tamaño de parte crece con el objeto (entre MIN_PART_SIZE y
+    MAX_PART_SIZE) para usar MAX_CONCURRENCY descargas sin crear partes
+    demasiado pequeñas.
+
+    Returns:
+        Lista de tuplas (inicio, fin) con fin exclusivo
+    """
+    remaining = size - first_part_size
+    if remaining <= 0:
+        return []
+
+    part_size = math.ceil(remaining / MAX_CONCURRENCY)
+    part_size = min(max(part_size, MIN_PART_SIZE), MAX_PART_SIZE)
+
+    return [
+        (start, min(start + part_size, size))
+        for start in range(first_part_size, size, part_size)
+    ]
+
+
+def download_object(s3_client, bucket, key, if_none_match=None):
+    """
+    Descarga un objeto completo, por partes si es grande
+
+    La primera peticion pide los primeros MULTIPART_THRESHOLD bytes: si el
+    objeto cabe, la descarga termina ahi con una sola peticion; si no, la
+    cabecera Content-Range indica el tamaño total y el resto se pide en
+    rangos concurrentes que se escriben directamente en un buffer reservado
+    de antemano (sin concatenar trozos).
+
+    Args:
+        s3_client: Cliente boto3
+        bucket: Nombre del bucket
+        key: Clave del objeto
+        if_none_match: ETag de la copia local; si coincide S3 responde 304 y
+            se lanza ClientError
+
+    Returns:
+        Tupla (contenido como bytes o bytearray, ETag)
+    """
+    inicio = time.perf_counter()
+    request = {'Bucket': bucket, 'Key': key, 'Range': f"bytes=0-{MULTIPART_THRESHOLD - 1}"}
+    if if_none_match is not None:
+        request['IfNoneMatch'] = if_none_match
+
+    try:
+        response = s3_client.get_object(**request)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'InvalidRange':
+            raise
+        # Objeto vacio: S3 no admite rangos sobre cero bytes
+        del request['Range']
+        response = s3_client.get_object(**request)
+
+    etag = response['ETag']
+    content_range = response.get('ContentRange')
+    size = int(content_range.rsplit('/', 1)[1]) if content_range else response['ContentLength']
+
+    if size <= MULTIPART_THRESHOLD or not content_range:
+        data = response['Body'].read()
+        _count('descargas_simples')
+        _count('bytes', len(data))
+        _count('segundos', time.perf_counter() - inicio)
+        return data, etag
+
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    _read_into(response['Body'], view[:MULTIPART_THRESHOLD])
+
+    def fetch_part(start, end):
+        part = s3_client.get_object(
+            Bucket=bucket,
+            Key=key,
+            Range=f"bytes={start}-{end - 1}",
+            IfMatch=etag,
+        )
+        _read_into(part['Body'], view[start:end])
+
+    parts = plan_parts(size)
+    futures = [_get_executor().submit(fetch_part, start, end) for start, end in parts]
+    for future in futures:
+        future.result()
+
+    _count('descargas_por_partes')
+    _count('partes', len(parts) + 1)
+    _count('bytes', size)
+    _count('segundos', time.perf_counter() - inicio)
+    return buffer, etag
+
+
+def get_download_stats():
+    """
+    Contadores de descargas simples y por partes
+    """
+    with _executor_lock:
+        return dict(_download_stats)
@@ -0,0 +1,184 @@
+"""
+Modulo con el cliente S3 compartido por todo el proceso
+
+Todas las cargas de s3_loader reutilizan un unico cliente boto3 con un pool
+de conexiones keep-alive, de modo que las descargas consecutivas (o
+concurrentes) del arranque no repiten la resolucion de credenciales ni el
+handshake TLS.
+"""
+import logging
+import os
+import threading
+import time
+
+import boto3
+import streamlit as st
+from botocore.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Conexiones maximas del pool: el arranque lanza entre 4 y 6 descargas a la vez
+MAX_POOL_CONNECTIONS = 16
+
+_lock = threading.Lock()
+_s3_config = None
+_s3_client = None
+_client_stats = {
+    'clientes_creados': 0,
+    'segundos_creacion': 0.0,
+}
+
+
+def _read_s3_config():
+    """
+    Lee la configuracion de S3 desde secrets.toml o variables de entorno
+    """
+    # Intentar obtener desde secrets de Streamlit
+    try:
+        aws_config = {
+            'region_name': st.secrets.get("aws", {}).get("aws_region", "eu-west-1")
+        }
+
+        # Solo agregar credenciales si estan en secrets
+        if "aws" in st.secrets:
+            if "aws_access_key_id" in st.secrets["aws"]:
+                aws_config['aws_access_key_id'] = st.secrets["aws"]["aws_access_key_id"]
+            if "aws_secret_access_key" in st.secrets["aws"]:
+                aws_config['aws_secret_access_key'] = st.secrets["aws"]["aws_secret_access_key"]
+
+            # Endpoint alternativo (MinIO, moto...) para pruebas en local
+            if "endpoint_url" in st.secrets["aws"]:
+                aws_config['endpoint_url'] = st.secrets["aws"]["endpoint_url"]
+
+        bucket = st.secrets.get("s3", {}).get("bucket_name", "viviendas-cantabria-raul")
+
+        return aws_config, bucket
+    except:
+        # Fallback a valores por defecto o variables de entorno
+        aws_config = {
+            'region_name': os.environ.get('AWS_REGION', 'eu-west-1')
+        }
+
+        # boto3 usara automaticamente las variables de entorno AWS_ACCESS_KEY_ID y AWS_SECRET_ACCESS_KEY
+        # o el archivo ~/.aws/credentials si existen
+        if os.environ.get('AWS_ENDPOINT_URL'):
+            aws_config['endpoint_url'] = os.environ['AWS_ENDPOINT_URL']
+
+        bucket = os.environ.get('S3_BUCKET', 'viviendas-cantabria-raul')
+
+        return aws_config, bucket
+
+
+def get_s3_config():
+    """
+    Obtiene la configuracion de S3 desde secrets.toml o variables de entorno
+
+    La configuracion se lee una sola vez por proceso.
+
+    Returns:
+        Tupla (aws_config, bucket)
+    """
+    global _s3_config
+
+    if _s3_config is None:
+        with _lock:
+            if _s3_config is None:
+                _s3_config = _read_s3_config()
+
+    aws_config, bucket = _s3_config
+    return dict(aws_config), bucket
+
+
+def get_s3_client():
+    """
+    Devuelve el cliente S3 compartido, creandolo la primera vez
+
+    Los clientes de boto3 son thread-safe, asi que el mismo cliente se usa
+    desde todas las sesiones de Streamlit y desde los hilos de precarga.
+    """
+    global _s3_client
+
+    if _s3_client is None:
+        aws_config, _ = get_s3_config()
+        with _lock:
+            if _s3_client is None:
+                inicio = time.perf_counter()
+
+                # Session propia: la sesion por defecto de boto3 no es thread-safe
+                session = boto3.session.Session()
+                client_config = Config(
+                    max_pool_connections=MAX_POOL_CONNECTIONS,
+                    tcp_keepalive=True,
+                    connect_timeout=5,
+                    read_timeout=60,
+                    retries={'max_attempts': 3, 'mode': 'standard'},
+                )
+                _s3_client = session.client('s3', config=client_config, **aws_config)
+
+                _client_stats['clientes_creados'] += 1
+                _client_stats['segundos_creacion'] += time.perf_counter() - inicio
+                logger.info("Cliente S3 creado en %.3f s", _client_stats['segundos_creacion'])
+
+    return _s3_client
+
+
+def get_s3_bucket():
+    """
+    Devuelve el nombre del bucket configurado
+    """
+    _, bucket = get_s3_config()
+    return bucket
+
+
+def reset_s3_client():
+    """
+    Descarta el cliente y la configuracion (p.ej. tras rotar credenciales)
+    """
+    global _s3_client, _s3_config
+
+    with _lock:
+        _s3_client = None
+        _s3_config = None
+
+
+def get_s3_pool_stats():
+    """
+    Estadisticas del pool de conexiones del cliente compartido
+
+    'conexiones_creadas' cuenta las conexiones nuevas abiertas por urllib3, que
+    en HTTPS equivalen a los handshakes TLS realizados.
+
+    Returns:
+        Diccionario con peticiones, conexiones creadas, conexiones reutilizadas
+        y conexiones ociosas en el pool
+    """
+    stats = {
+        'clientes_creados': _client_stats['clientes_creados'],
+        'segundos_creacion': round(_client_stats['segundos_creacion'], 4),
+        'pools': 0,
+        'peticiones': 0,
+        'conexiones_creadas': 0,
+        'conexiones_reutilizadas': 0,
+        'conexiones_ociosas': 0,
+    }
+
+    if _s3_client is None:
+        return stats
+
+    try:
+        manager = _s3_client._endpoint.http_session._manager
+        for pool_key in list(manager.pools.keys()):
+            pool = manager.pools.get(pool_key)
+            if pool is None:
+                continue
+            stats['pools'] += 1
+            stats['peticiones'] += pool.num_requests
+            stats['conexiones_creadas'] += pool.num_connections
+            if pool.pool is not None:
+                stats['conexiones_ociosas'] += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+    except AttributeError:
+        # Version de botocore/urllib3 sin estos atributos internos
+        return stats
+
+    stats['conexiones_reutilizadas'] = max(stats['peticiones'] - stats['conexiones_creadas'], 0)
+    return stats
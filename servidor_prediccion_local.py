@@ -0,0 +1,283 @@
+"""
+Servidor local que imita la API de prediccion para pruebas sin conexion
+
+Responde a POST /predict con el mismo esquema que la API de API Gateway (ver
+la seccion "API de Prediccion" del README). El precio es una funcion
+determinista de la consulta, no un modelo: sirve para medir el cliente
+(timeouts, reintentos, pool de conexiones, lotes), no las predicciones.
+
+La latencia y los fallos son configurables:
+- latencia_ms y jitter_ms: tiempo de respuesta base y variacion aleatoria
+- arranque_frio y arranque_frio_ms: probabilidad y latencia extra de una
+  Lambda en arranque en frio
+- tasa_errores y codigos_error: fraccion de respuestas con error del gateway
+- tasa_cortes: fraccion de conexiones cerradas sin responder
+
+Uso:
+    python servidor_prediccion_local.py --puerto 8080 --latencia-ms 120 --tasa-errores 0.05
+
+y en secrets.toml:
+    [prediccion]
+    api_url = "http://localhost:8080/predict"
+"""
+import argparse
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+RUTA_PREDICCION = '/predict'
+
+# Tipos de los campos del contrato del README y del formulario de la vista
+TIPOS_CAMPOS = {
+    'municipio': str,
+    'tipo': str,
+    'tipo_inmueble': str,
+    'm2_construidos': (int, float),
+    'm2_utiles': (int, float),
+    'habitaciones': int,
+    'banos': int,
+    'calificacion_energetica': str,
+    'latitud': (int, float),
+    'longitud': (int, float),
+    'estado': str,
+    'antiguedad_anios': int,
+    'planta': str,
+    'orientacion': str,
+    'terraza': str,
+    'garaje': str,
+    'ascensor': str,
+    'piscina': str,
+    'gas_natural': str,
+    'amueblado': str,
+}
+
+PRECIO_M2_BASE = 1800.0
+M2_POR_DEFECTO = 90.0
+
+
+class ConfigServidor:
+    """
+    Latencias y tasas de fallo del servidor local
+    """
+
+    def __init__(
+        self,
+        latencia_ms=50.0,
+        jitter_ms=20.0,
+        arranque_frio=0.0,
+        arranque_frio_ms=1500.0,
+        tasa_errores=0.0,
+        codigos_error=(502, 503, 504),
+        tasa_cortes=0.0,
+        api_key=None,
+        semilla=None,
+    ):
+        self.latencia_ms = latencia_ms
+        self.jitter_ms = jitter_ms
+        self.arranque_frio = arranque_frio
+        self.arranque_frio_ms = arranque_frio_ms
+        self.tasa_errores = tasa_errores
+        self.codigos_error = tuple(codigos_error)
+        self.tasa_cortes = tasa_cortes
+        self.api_key = api_key
+        self._random = random.Random(semilla)
+        self._lock = threading.Lock()
+
+    def sortear(self):
+        """
+        Decide la latencia (s) y el resultado de una consulta: 'ok', 'corte'
+        o un codigo de error
+        """
+        with self._lock:
+            latencia = self.latencia_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)
+            if self._random.random() < self.arranque_frio:
+                latencia += self.arranque_frio_ms
+            azar = self._random.random()
+            if azar < self.tasa_cortes:
+                resultado = 'corte'
+            elif azar < self.tasa_cortes + self.tasa_errores:
+                resultado = self._random.choice(self.codigos_error)
+            else:
+                resultado = 'ok'
+        return max(latencia, 0.0) / 1000, resultado
+
+
+def validar_consulta(consulta):
+    """
+    Comprueba los tipos de los campos de una consulta
+
+    Returns:
+        Mensaje de error o None si la consulta es valida
+    """
+    if not isinstance(consulta, dict):
+        return "El cuerpo debe ser un objeto JSON"
+    if 'municipio' not in consulta and 'm2_construidos' not in consulta:
+        return "Falta municipio o m2_construidos"
+    for campo, valor in consulta.items():
+        tipo = TIPOS_CAMPOS.get(campo)
+        if tipo is None:
+            continue
+        if isinstance(valor, bool) or not isinstance(valor, tipo):
+            return f"Tipo no valido para {campo}"
+    return None
+
+
+def precio_simulado(consulta):
+    """
+    Respuesta determinista con el esquema de la API
+
+    El precio/m2 depende del municipio (hash estable) y de algunas
+    caracteristicas, de modo que la misma consulta da siempre el mismo precio.
+    """
+    municipio = str(consulta.get('municipio', ''))
+    huella = int(hashlib.md5(municipio.encode('utf-8')).hexdigest()[:8], 16)
+    precio_m2 = PRECIO_M2_BASE * (0.7 + 0.6 * huella / 0xFFFFFFFF)
+
+    if consulta.get('estado') == 'a_reformar':
+        precio_m2 *= 0.85
+    elif consulta.get('estado') == 'nuevo':
+        precio_m2 *= 1.15
+    if consulta.get('ascensor') == 'si':
+        precio_m2 *= 1.05
+    precio_m2 *= 1 - min(consulta.get('antiguedad_anios', 0), 80) * 0.002
+
+    m2 = float(consulta.get('m2_construidos') or consulta.get('m2_utiles') or M2_POR_DEFECTO)
+    precio = round(precio_m2 * m2, -2)
+    completa = 'municipio' in consulta and 'm2_construidos' in consulta
+    margen = 0.1 if completa else 0.2
+
+    return {
+        'precio_estimado': precio,
+        'precio_m2': round(precio_m2, 1),
+        'rango_inferior': round(precio * (1 - margen), -2),
+        'rango_superior': round(precio * (1 + margen), -2),
+        'confianza': 'alta' if completa else 'media',
+    }
+
+
+class _PrediccionHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Cabeceras y cuerpo salen en escrituras separadas: sin Nagle cada
+    # respuesta no espera al ACK retardado del cliente
+    disable_nagle_algorithm = True
+
+    def _responder(self, estado, cuerpo):
+        datos = json.dumps(cuerpo).encode('utf-8')
+        self.send_response(estado)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def do_POST(self):
+        longitud = int(self.headers.get('Content-Length', 0))
+        cuerpo = self.rfile.read(longitud)
+
+        if self.path.split('?')[0] != RUTA_PREDICCION:
+            self._responder(404, {'message': 'Not Found'})
+            return
+
+        config = self.server.config
+        api_key = self.headers.get('x-api-key')
+        if not api_key or (config.api_key is not None and api_key != config.api_key):
+            self._responder(403, {'message': 'Forbidden'})
+            return
+
+        latencia, resultado = config.sortear()
+        time.sleep(latencia)
+
+        if resultado == 'corte':
+            # Cerrar sin responder, como una conexion reiniciada por el gateway
+            self.close_connection = True
+            return
+        if resultado != 'ok':
+            self._responder(resultado, {'message': 'Service Unavailable'})
+            return
+
+        try:
+            consulta = json.loads(cuerpo or b'null')
+        except ValueError:
+            self._responder(400, {'error': 'JSON no valido'})
+            return
+        error = validar_consulta(consulta)
+        if error is not None:
+            self._responder(400, {'error': error})
+            return
+
+        self._responder(200, precio_simulado(consulta))
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+def crear_servidor(config=None, host='127.0.0.1', puerto=0):
+    """
+    Crea el servidor (sin arrancarlo); puerto 0 elige uno libre
+
+    Returns:
+        ThreadingHTTPServer con el atributo config
+    """
+    servidor = ThreadingHTTPServer((host, puerto), _PrediccionHandler)
+    servidor.daemon_threads = True
+    servidor.config = config or ConfigServidor()
+    return servidor
+
+
+def iniciar_en_segundo_plano(config=None, host='127.0.0.1', puerto=0):
+    """
+    Arranca el servidor en un hilo
+
+    Returns:
+        Tupla (servidor, url de /predict); servidor.shutdown() lo detiene
+    """
+    servidor = crear_servidor(config, host, puerto)
+    threading.Thread(target=servidor.serve_forever, name='servidor-prediccion', daemon=True).start()
+    host, puerto = servidor.server_address[:2]
+    return servidor, f"http://{host}:{puerto}{RUTA_PREDICCION}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local de la API de prediccion")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--puerto', type=int, default=8080)
+    parser.add_argument('--latencia-ms', type=float, default=50.0)
+    parser.add_argument('--jitter-ms', type=float, default=20.0)
+    parser.add_argument('--arranque-frio', type=float, default=0.0, help="Probabilidad de arranque en frio (0-1)")
+    parser.add_argument('--arranque-frio-ms', type=float, default=1500.0)
+    parser.add_argument('--tasa-errores', type=float, default=0.0, help="Fraccion de respuestas con error (0-1)")
+    parser.add_argument('--codigos-error', default='502,503,504')
+    parser.add_argument('--tasa-cortes', type=float, default=0.0, help="Fraccion de conexiones cerradas sin responder (0-1)")
+    parser.add_argument('--api-key', default=None, help="Unica API key aceptada (por defecto cualquiera)")
+    parser.add_argument('--semilla', type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    config = ConfigServidor(
+        latencia_ms=args.latencia_ms,
+        jitter_ms=args.jitter_ms,
+        arranque_frio=args.arranque_frio,
+        arranque_frio_ms=args.arranque_frio_ms,
+        tasa_errores=args.tasa_errores,
+        codigos_error=[int(c) for c in args.codigos_error.split(',') if c],
+        tasa_cortes=args.tasa_cortes,
+        api_key=args.api_key,
+        semilla=args.semilla,
+    )
+    servidor = crear_servidor(config, args.host, args.puerto)
+    logger.info("API de prediccion local en http://%s:%d%s", args.host, args.puerto, RUTA_PREDICCION)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+"""
+Modulo con la cache de los loaders de S3: stale-while-revalidate y single-flight
+
+Sustituye a @st.cache_data(ttl=600) en s3_loader:
+- Mientras un valor es reciente se sirve de memoria. Con version_func, un
+  valor es reciente mientras la version de los datos no cambie (p.ej. la del
+  manifiesto de s3_manifest); sin ella, o si la version no se conoce, durante
+  ttl segundos
+- Cuando caduca se sigue sirviendo el valor anterior y se lanza una unica
+  recarga en segundo plano; nadie espera a S3 por haber caducado la cache
+- Si varias sesiones piden a la vez una clave que no esta en cache, solo una
+  ejecuta la carga y las demas esperan a su resultado (single-flight)
+
+Los DataFrames se devuelven como copia superficial, de modo que añadir
+columnas en una vista no afecta a la cache; los demas valores (p.ej. los
+GeoJSON) se comparten y no deben modificarse.
+"""
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_caches = []
+_local = threading.local()
+
+
+def _congelar(valor):
+    """
+    Convierte listas y diccionarios en tuplas para usarlos en claves
+    """
+    if isinstance(valor, dict):
+        return tuple(sorted((k, _congelar(v)) for k, v in valor.items()))
+    if isinstance(valor, (list, tuple)):
+        return tuple(_congelar(v) for v in valor)
+    return valor
+
+
+def _copia(valor):
+    if isinstance(valor, pd.DataFrame):
+        return valor.copy(deep=False)
+    return valor
+
+
+class _Entrada:
+    def __init__(self, valor, instante, version):
+        self.valor = valor
+        self.instante = instante
+        self.version = version
+
+
+class SWRCache:
+    """
+    Cache de una funcion con stale-while-revalidate y single-flight
+    """
+
+    def __init__(self, funcion, ttl, version_func=None):
+        self.funcion = funcion
+        self.nombre = funcion.__name__
+        self.ttl = ttl
+        self.version_func = version_func
+        self._entradas = {}
+        self._en_curso = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'aciertos': 0,
+            'obsoletos_servidos': 0,
+            'refrescos': 0,
+            'errores_refresco': 0,
+            'esperas': 0,
+            'esperas_compartidas': 0,
+            'segundos_espera': 0.0,
+        }
+
+    def _count(self, stat, amount=1):
+        with self._lock:
+            self._stats[stat] += amount
+
+    def _version_actual(self):
+        if self.version_func is None:
+            return None
+        try:
+            return self.version_func()
+        except Exception as e:
+            logger.warning("No se pudo obtener la version para %s: %s", self.nombre, e)
+            return None
+
+    def _es_reciente(self, entrada, version, ahora):
+        if version is not None:
+            return entrada.version == version
+        return ahora - entrada.instante < self.ttl
+
+    def _cargar(self, clave, args, kwargs, futuro, version):
+        """
+        Ejecuta la funcion, guarda el resultado y resuelve el futuro en curso
+        """
+        profundidad = getattr(_local, 'refrescando', 0)
+        _local.refrescando = profundidad + 1
+        try:
+            valor = self.funcion(*args, **kwargs)
+        except BaseException as e:
+            with self._lock:
+                self._en_curso.pop(clave, None)
+            futuro.set_exception(e)
+            raise
+        finally:
+            _local.refrescando = profundidad
+
+        with self._lock:
+            self._entradas[clave] = _Entrada(valor, time.monotonic(), version)
+            self._en_curso.pop(clave, None)
+        futuro.set_result(valor)
+        return valor
+
+    def _refrescar_en_segundo_plano(self, clave, args, kwargs, futuro, version):
+        def refrescar():
+            try:
+                self._cargar(clave, args, kwargs, futuro, version)
+                self._count('refrescos')
+            except Exception as e:
+                self._count('errores_refresco')
+                logger.warning("Error al refrescar %s%s: %s", self.nombre, args, e)
+
+        threading.Thread(target=refrescar, name=f"swr-{self.nombre}", daemon=True).start()
+
+    def __call__(self, *args, **kwargs):
+        clave = (_congelar(args), _congelar(kwargs))
+        ahora = time.monotonic()
+        # Dentro de una recarga los valores caducados no sirven: la recarga
+        # de un dataset debe leer los datos nuevos de sus dependencias
+        refrescando = getattr(_local, 'refrescando', 0) > 0
+        version = self._version_actual()
+
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            en_curso = self._en_curso.get(clave)
+
+            if entrada is not None and self._es_reciente(entrada, version, ahora):
+                self._stats['aciertos'] += 1
+                return _copia(entrada.valor)
+
+            if entrada is not None and not refrescando:
+                # Caducado: servir el valor anterior y refrescar una sola vez
+                self._stats['obsoletos_servidos'] += 1
+                if en_curso is None:
+                    futuro = Future()
+                    self._en_curso[clave] = futuro
+                    self._refrescar_en_segundo_plano(clave, args, kwargs, futuro, version)
+                return _copia(entrada.valor)
+
+            if en_curso is None:
+                futuro = Future()
+                self._en_curso[clave] = futuro
+
+        inicio = time.perf_counter()
+        try:
+            if en_curso is not None:
+                # Otra sesion ya esta cargando esta clave: esperar a su resultado
+                valor = en_curso.result()
+            else:
+                valor = self._cargar(clave, args, kwargs, futuro, version)
+        finally:
+            # Solo cuentan las esperas de los usuarios, no las de las cargas
+            # anidadas dentro de otra carga o de un refresco
+            if not refrescando:
+                self._count('esperas_compartidas' if en_curso is not None else 'esperas')
+                self._count('segundos_espera', time.perf_counter() - inicio)
+
+        return _copia(valor)
+
+    def clear(self):
+        """
+        Vacia la cache (las cargas en curso terminan normalmente)
+        """
+        with self._lock:
+            self._entradas.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entradas=len(self._entradas))
+
+
+def swr_cache(ttl=600, version_func=None):
+    """
+    Decorador que cachea una funcion con stale-while-revalidate y single-flight
+
+    Args:
+        ttl: Segundos durante los que un valor se considera reciente cuando
+            no se conoce la version de los datos
+        version_func: Funcion sin argumentos que devuelve la version actual
+            de los datos (o None si no se conoce); debe ser barata
+    """
+    def decorator(funcion):
+        cache = SWRCache(funcion, ttl, version_func)
+        with _lock:
+            _caches.append(cache)
+
+        @functools.wraps(funcion)
+        def wrapper(*args, **kwargs):
+            return cache(*args, **kwargs)
+
+        wrapper.clear = cache.clear
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
+
+
+def clear_swr_caches():
+    """
+    Vacia todas las funciones cacheadas del proceso (p.ej. para medir cargas
+    sin la cache en memoria)
+    """
+    with _lock:
+        caches = list(_caches)
+    for cache in caches:
+        cache.clear()
+
+
+def get_swr_stats():
+    """
+    Estadisticas de cada funcion cacheada: aciertos, valores obsoletos
+    servidos, refrescos en segundo plano, esperas y segundos esperando
+    """
+    with _lock:
+        caches = list(_caches)
+    return {cache.nombre: cache.stats() for cache in caches}
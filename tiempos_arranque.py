@@ -0,0 +1,59 @@
+"""
+Modulo con los tiempos de arranque de la app
+
+Registra, para todo el proceso:
+- Cuanto tardaron en importarse las dependencias de app.py y cada vista (la
+  primera vez, que es la que paga el arranque en frio)
+- Las fases del primer rerun del proceso (importaciones, precarga de datos,
+  vista) y las del ultimo rerun, para comparar arranque en frio y en caliente
+"""
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_importaciones = {}
+_reruns = {'total': 0, 'primero': None, 'ultimo': None}
+
+
+def registrar_importacion(nombre, segundos):
+    """
+    Guarda lo que tardo en importarse un modulo (solo la primera vez)
+    """
+    with _lock:
+        if nombre not in _importaciones:
+            _importaciones[nombre] = segundos
+            logger.info("Importacion de %s: %.3f s", nombre, segundos)
+
+
+def registrar_rerun(fases):
+    """
+    Guarda las fases de un rerun
+
+    Args:
+        fases: Diccionario {fase: segundos}
+    """
+    fases = dict(fases, total=sum(fases.values()))
+    with _lock:
+        _reruns['total'] += 1
+        _reruns['ultimo'] = fases
+        if _reruns['primero'] is None:
+            _reruns['primero'] = fases
+            logger.info(
+                "Primer rerun del proceso: %s",
+                ", ".join(f"{fase} {segundos:.2f} s" for fase, segundos in fases.items()),
+            )
+
+
+def get_arranque_report():
+    """
+    Importaciones, fases del primer y del ultimo rerun y numero de reruns
+    """
+    with _lock:
+        return {
+            'importaciones': dict(_importaciones),
+            'primer_rerun': _reruns['primero'],
+            'ultimo_rerun': _reruns['ultimo'],
+            'reruns': _reruns['total'],
+        }
@@ -0,0 +1,221 @@
+"""
+Modulo con trazas ligeras de cada rerun de la app
+
+Una traza agrupa los spans (tramos con nombre y duracion) de un rerun:
+descargas de S3, decodificacion de Parquet, transformaciones de cada vista,
+construccion de figuras, serializacion al navegador... Sirve para saber de
+donde sale el tiempo de una pagina lenta.
+
+- app.py abre una traza al empezar el rerun y la cierra al final
+- span(nombre) mide un bloque y trazado(nombre) una funcion; fuera de una
+  traza no hacen nada, de modo que cuestan una consulta a una ContextVar
+- Los spans de los hilos de prefetch se asocian a la traza del rerun que los
+  lanzo (el contexto se copia al enviar cada tarea)
+- Opcionalmente el rerun se perfila con cProfile
+
+Las trazas solo se recogen con el panel de depuracion activo (?debug=1 en la
+URL, [debug] panel = true en secrets.toml o VIVIENDAS_DEBUG=1).
+"""
+import contextvars
+import cProfile
+import functools
+import io
+import itertools
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+# Funciones del perfil que se guardan, ordenadas por tiempo acumulado
+MAX_FUNCIONES_PERFIL = 40
+
+_traza_actual = contextvars.ContextVar('traza_actual', default=None)
+_span_actual = contextvars.ContextVar('span_actual', default=None)
+_ids = itertools.count(1)
+# cProfile no admite dos perfiles activos a la vez en el proceso
+_lock_perfil = threading.Lock()
+
+
+class Traza:
+    """
+    Spans de un rerun, con sus tiempos relativos al inicio de la traza
+    """
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.instante = time.time()
+        self.inicio = time.perf_counter()
+        self.duracion = None
+        self.spans = []
+        self.perfil = None
+        self._perfilador = None
+        self._lock = threading.Lock()
+
+    def agregar(self, nombre, inicio, duracion, padre=None, atributos=None, span_id=None):
+        """
+        Añade un span ya medido (inicio en segundos de perf_counter)
+
+        Returns:
+            Identificador del span
+        """
+        span_id = span_id if span_id is not None else next(_ids)
+        with self._lock:
+            self.spans.append({
+                'id': span_id,
+                'nombre': nombre,
+                'inicio_ms': (inicio - self.inicio) * 1000,
+                'duracion_ms': duracion * 1000,
+                'padre': padre,
+                'hilo': threading.current_thread().name,
+                'atributos': atributos or {},
+            })
+        return span_id
+
+    def a_diccionario(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s['inicio_ms'])
+        return {
+            'nombre': self.nombre,
+            'instante': self.instante,
+            'duracion_ms': self.duracion * 1000 if self.duracion is not None else None,
+            'spans': spans,
+            'perfil': self.perfil,
+        }
+
+
+def iniciar_traza(nombre='rerun', perfilar=False):
+    """
+    Abre una traza en el contexto actual (el hilo del rerun)
+
+    Args:
+        nombre: Nombre de la traza
+        perfilar: Si True, el rerun se perfila con cProfile hasta
+            finalizar_traza (se ignora si ya hay otro perfil en curso)
+    """
+    traza = Traza(nombre)
+    _traza_actual.set(traza)
+    _span_actual.set(None)
+
+    if perfilar and _lock_perfil.acquire(blocking=False):
+        perfilador = cProfile.Profile()
+        try:
+            perfilador.enable()
+            traza._perfilador = perfilador
+        except ValueError as e:
+            # Otra herramienta de perfilado ya esta activa
+            _lock_perfil.release()
+            logger.warning("No se pudo perfilar el rerun: %s", e)
+    return traza
+
+
+def finalizar_traza():
+    """
+    Cierra la traza del contexto actual
+
+    Returns:
+        La traza cerrada, o None si no habia
+    """
+    traza = _traza_actual.get()
+    if traza is None:
+        return None
+
+    if traza._perfilador is not None:
+        traza._perfilador.disable()
+        _lock_perfil.release()
+        salida = io.StringIO()
+        pstats.Stats(traza._perfilador, stream=salida).sort_stats('cumulative').print_stats(MAX_FUNCIONES_PERFIL)
+        traza.perfil = salida.getvalue()
+        traza._perfilador = None
+
+    traza.duracion = time.perf_counter() - traza.inicio
+    _traza_actual.set(None)
+    _span_actual.set(None)
+    return traza
+
+
+def traza_actual():
+    """
+    Traza abierta en el contexto actual (None si no se esta trazando)
+    """
+    return _traza_actual.get()
+
+
+@contextmanager
+def span(nombre, **atributos):
+    """
+    Mide un bloque como span de la traza actual (no hace nada sin traza)
+    """
+    traza = _traza_actual.get()
+    if traza is None:
+        yield
+        return
+
+    padre = _span_actual.get()
+    # El id se reserva al entrar para que los spans anidados lo usen como padre
+    span_id = next(_ids)
+    token = _span_actual.set(span_id)
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        _span_actual.reset(token)
+        traza.agregar(nombre, inicio, time.perf_counter() - inicio, padre, atributos, span_id)
+
+
+def agregar_span(nombre, inicio, duracion, **atributos):
+    """
+    Añade a la traza actual un span medido antes de abrirla (p.ej. las
+    importaciones del rerun)
+    """
+    traza = _traza_actual.get()
+    if traza is not None:
+        traza.agregar(nombre, inicio, duracion, _span_actual.get(), atributos)
+
+
+def trazado(nombre=None):
+    """
+    Decorador que mide cada llamada a una funcion como un span
+    """
+    def decorator(funcion):
+        nombre_span = nombre or f"{funcion.__module__}.{funcion.__name__}"
+
+        @functools.wraps(funcion)
+        def wrapper(*args, **kwargs):
+            if _traza_actual.get() is None:
+                return funcion(*args, **kwargs)
+            with span(nombre_span):
+                return funcion(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def exportar_json(traza):
+    """
+    Traza serializada como JSON (spans ordenados por inicio)
+    """
+    return json.dumps(traza.a_diccionario(), ensure_ascii=False, indent=2, default=str)
+
+
+def panel_depuracion_activo():
+    """
+    Indica si se deben recoger trazas y mostrar el panel de depuracion
+    """
+    try:
+        if st.query_params.get('debug') in ('1', 'true'):
+            return True
+    except Exception:
+        pass
+
+    try:
+        return bool(st.secrets.get("debug", {}).get("panel", False))
+    except:
+        return os.environ.get('VIVIENDAS_DEBUG', '').lower() in ('1', 'true')
@@ -0,0 +1,78 @@
+"""
+Paquete con las vistas de la app, una por modulo
+
+Cada modulo define mostrar(datos) y se importa la primera vez que se
+selecciona su vista, de modo que el arranque no paga las importaciones de
+las demas (Plotly Express, el cliente de prediccion...). Un modulo puede
+definir tambien mostrar_panel_lateral(), que se llama en cada rerun una vez
+importado (p.ej. las estadisticas de la API de prediccion).
+"""
+import importlib
+import sys
+import time
+
+from geometria import nivel_para_zoom
+from tiempos_arranque import registrar_importacion
+from trazas import span
+
+# Nivel de detalle de las geometrias segun el zoom inicial de cada mapa
+NIVEL_MAPA_CANTABRIA = nivel_para_zoom(7.8)
+NIVEL_MAPA_SANTANDER = nivel_para_zoom(12)
+
+# Nombre de cada vista en el selector y modulo que la implementa
+VISTAS = {
+    "Mapa Geográfico": 'vistas.mapa_geografico',
+    "Mapa de Comarcas": 'vistas.mapa_comarcas',
+    "Mapa Portales": 'vistas.mapa_portales',
+    "Mapa Santander Portales": 'vistas.mapa_santander_portales',
+    "Series Temporales": 'vistas.series_temporales',
+    "Predicción": 'vistas.prediccion',
+}
+
+
+class DatosApp:
+    """
+    Datasets comunes a todas las vistas, cargados en cada rerun por app.py
+    """
+
+    def __init__(self, municipios, distritos, portales, resumen_municipios, resumen_distritos):
+        self.municipios = municipios
+        self.distritos = distritos
+        self.portales = portales
+        self.resumen_municipios = resumen_municipios
+        self.resumen_distritos = resumen_distritos
+        self.municipios_disponibles = sorted(resumen_municipios.index)
+        self.distritos_disponibles = sorted(resumen_distritos.index)
+
+
+def cargar_vista(nombre):
+    """
+    Importa (la primera vez) y devuelve el modulo de una vista
+    """
+    modulo = VISTAS[nombre]
+    if modulo in sys.modules:
+        return sys.modules[modulo]
+
+    inicio = time.perf_counter()
+    with span('importacion', modulo=modulo):
+        vista = importlib.import_module(modulo)
+    registrar_importacion(modulo, time.perf_counter() - inicio)
+    return vista
+
+
+def mostrar_vista(nombre, datos):
+    """
+    Muestra la vista seleccionada
+    """
+    with span('vista', vista=nombre):
+        cargar_vista(nombre).mostrar(datos)
+
+
+def mostrar_paneles_laterales():
+    """
+    Paneles de la barra lateral de las vistas ya importadas
+    """
+    for modulo in VISTAS.values():
+        vista = sys.modules.get(modulo)
+        if vista is not None and hasattr(vista, 'mostrar_panel_lateral'):
+            vista.mostrar_panel_lateral()
@@ -0,0 +1,93 @@
+"""
+Panel de depuracion de la barra lateral: cascada de tiempos del rerun,
+perfil con cProfile y exportacion de la traza
+
+Solo se importa con el panel activo (ver trazas.panel_depuracion_activo).
+"""
+import plotly.graph_objects as go
+import streamlit as st
+
+from trazas import exportar_json
+
+# Clave del boton que pide perfilar el rerun que provoca
+CLAVE_PERFILAR = 'perfilar_rerun'
+
+
+def _profundidades(spans):
+    """
+    Nivel de anidamiento de cada span segun su padre
+    """
+    padres = {s['id']: s['padre'] for s in spans}
+    profundidades = {}
+    for span_id in padres:
+        nivel, actual = 0, padres[span_id]
+        while actual is not None and actual in padres:
+            nivel, actual = nivel + 1, padres[actual]
+        profundidades[span_id] = nivel
+    return profundidades
+
+
+def construir_cascada(traza):
+    """
+    Figura con un tramo horizontal por span, en orden de inicio
+    """
+    datos = traza.a_diccionario()
+    spans = datos['spans']
+    profundidades = _profundidades(spans)
+
+    etiquetas = [
+        f"{'· ' * profundidades[s['id']]}{s['nombre']} #{i}"
+        for i, s in enumerate(spans)
+    ]
+    detalles = [
+        "<br>".join(
+            [f"{s['duracion_ms']:.1f} ms", f"hilo: {s['hilo']}"]
+            + [f"{clave}: {valor}" for clave, valor in s['atributos'].items()]
+        )
+        for s in spans
+    ]
+
+    fig = go.Figure(go.Bar(
+        y=etiquetas,
+        x=[s['duracion_ms'] for s in spans],
+        base=[s['inicio_ms'] for s in spans],
+        orientation='h',
+        customdata=detalles,
+        hovertemplate='<b>%{y}</b><br>%{customdata}<extra></extra>',
+        marker_color=['#d73027' if s['hilo'].startswith('prefetch') else '#4575b4' for s in spans],
+    ))
+    fig.update_layout(
+        height=max(250, 22 * len(spans) + 60),
+        margin=dict(t=10, l=0, r=0, b=30),
+        xaxis_title="ms desde el inicio del rerun",
+        yaxis=dict(autorange='reversed', tickfont=dict(size=10)),
+        showlegend=False,
+    )
+    return fig
+
+
+def mostrar_panel_depuracion(traza):
+    """
+    Muestra en la barra lateral la traza del rerun que acaba de terminar
+    """
+    with st.sidebar.expander("🐞 Depuración"):
+        st.button("🔬 Perfilar un rerun (cProfile)", key=CLAVE_PERFILAR,
+                  help="Vuelve a ejecutar la página perfilando el hilo del rerun")
+
+        if traza is None:
+            st.caption("Sin traza en este rerun")
+            return
+
+        st.caption(f"Rerun: {traza.duracion * 1000:.0f} ms · {len(traza.spans)} spans (rojo: hilos de precarga)")
+        if traza.spans:
+            st.plotly_chart(construir_cascada(traza), use_container_width=True)
+
+        st.download_button(
+            "⬇️ Exportar traza (JSON)",
+            exportar_json(traza).encode('utf-8'),
+            file_name=f"traza_{traza.instante:.0f}.json",
+            mime="application/json",
+        )
+
+        if traza.perfil:
+            st.code(traza.perfil, language=None)
@@ -0,0 +1,93 @@
+"""
+Vista Mapa de Comarcas: precio medio y resumen por comarca
+"""
+import plotly.express as px
+import streamlit as st
+
+from cache_figuras import figura_cacheada, versiones_de
+from trazas import span
+from vistas_materializadas import ultimo_por_zona
+
+
+def mostrar(datos):
+    df = datos.municipios
+
+    st.subheader("🗺️ Mapa de Precios por Comarca")
+
+    with span('mapa_comarcas.transformacion'):
+        # Obtener datos mas recientes por municipio (calculados una vez por version)
+        df_reciente = ultimo_por_zona(df, 'municipio')
+
+        # Calcular precio medio por comarca
+        df_comarcas = df_reciente.groupby('comarca', observed=True).agg({
+            'precio_m2': 'mean',
+            'municipio': 'count'
+        }).reset_index()
+        df_comarcas.columns = ['comarca', 'precio_medio_m2', 'num_municipios']
+
+    # Crear grafico de barras horizontal por comarca
+    def construir_barras_comarcas():
+        fig_mapa = px.bar(
+            df_comarcas.sort_values('precio_medio_m2', ascending=True),
+            x='precio_medio_m2',
+            y='comarca',
+            orientation='h',
+            color='precio_medio_m2',
+            color_continuous_scale='Viridis',
+            labels={'precio_medio_m2': 'Precio Medio (€/m²)', 'comarca': 'Comarca'},
+            title='Precio medio por metro cuadrado por comarca (Último mes disponible)',
+            text='precio_medio_m2'
+        )
+
+        fig_mapa.update_traces(
+            texttemplate='%{text:.0f} €/m²',
+            textposition='outside'
+        )
+
+        fig_mapa.update_layout(
+            height=600,
+            showlegend=False,
+            xaxis_title="Precio Medio (€/m²)",
+            yaxis_title="Comarca"
+        )
+        return fig_mapa
+
+    fig_mapa = figura_cacheada(
+        'barras_comarcas',
+        {},
+        versiones_de(df),
+        construir_barras_comarcas,
+    )
+
+    with span('plotly_chart', figura='barras_comarcas'):
+        st.plotly_chart(fig_mapa, use_container_width=True)
+
+    # Tabla resumen por comarca
+    st.markdown("---")
+    st.subheader("📊 Resumen por Comarca")
+
+    # Crear tabla mas detallada
+    df_resumen = df_reciente.groupby('comarca', observed=True).agg({
+        'precio_m2': ['mean', 'min', 'max', 'count']
+    }).reset_index()
+    df_resumen.columns = ['Comarca', 'Precio Medio', 'Precio Mínimo', 'Precio Máximo', 'Num. Municipios']
+
+    # Formatear la tabla
+    df_resumen['Precio Medio'] = df_resumen['Precio Medio'].apply(lambda x: f"{x:.2f} €/m²")
+    df_resumen['Precio Mínimo'] = df_resumen['Precio Mínimo'].apply(lambda x: f"{x:.2f} €/m²")
+    df_resumen['Precio Máximo'] = df_resumen['Precio Máximo'].apply(lambda x: f"{x:.2f} €/m²")
+
+    st.dataframe(
+        df_resumen.sort_values('Comarca'),
+        use_container_width=True,
+        hide_index=True
+    )
+
+    # Lista de municipios por comarca
+    with st.expander("📍 Ver municipios por comarca"):
+        for comarca in sorted(df_reciente['comarca'].unique()):
+            municipios_comarca = df_reciente[df_reciente['comarca'] == comarca].sort_values('precio_m2', ascending=False)
+            st.markdown(f"**{comarca}**")
+            for _, row in municipios_comarca.iterrows():
+                st.write(f"- {row['municipio']}: {row['precio_m2']:.2f} €/m²")
+            st.markdown("---")
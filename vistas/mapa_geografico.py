@@ -0,0 +1,219 @@
+"""
+Vista Mapa Geografico: mapa coropletico y treemap de precios por municipio
+"""
+import pandas as pd
+import plotly.express as px
+import streamlit as st
+
+from cache_figuras import figura_cacheada, versiones_de
+from trazas import span
+from normalizacion_municipios import normalizar_municipios, obtener_normalizador
+from s3_loader import load_geojson_municipios, GEOJSON_MUNICIPIOS_KEY
+from geometria import version_geojson
+from vistas import NIVEL_MAPA_CANTABRIA
+from vistas_materializadas import ultimo_por_zona
+
+
+def mostrar(datos):
+    df = datos.municipios
+
+    st.subheader("🗺️ Mapa geográfico de Cantabria por municipios")
+
+    with span('mapa_geografico.transformacion'):
+        # Obtener datos mas recientes por municipio (calculados una vez por version)
+        df_reciente = ultimo_por_zona(df, 'municipio')
+
+        # Cargar GeoJSON de municipios desde S3
+        geojson_municipios = load_geojson_municipios(nivel=NIVEL_MAPA_CANTABRIA)
+
+        # Obtener todos los municipios del GeoJSON
+        municipios_geojson = [f['properties']['NOMBRE'] for f in geojson_municipios['features']]
+
+        # Preparar datos para el mapa - normalizar nombres
+        df_mapa = df_reciente[['municipio', 'precio_m2', 'comarca']].copy()
+        df_mapa['municipio_norm'] = normalizar_municipios(df_mapa['municipio'], municipios_geojson)
+
+        # Crear DataFrame completo con TODOS los municipios del GeoJSON
+        municipios_con_datos = dict(zip(df_mapa['municipio_norm'], df_mapa.to_dict('records')))
+
+        # Lista completa de todos los municipios
+        todos_municipios = []
+        municipios_sin_datos_count = 0
+        municipios_con_datos_count = 0
+        for mun_geo in municipios_geojson:
+            if mun_geo in municipios_con_datos:
+                # Municipio con datos
+                todos_municipios.append(municipios_con_datos[mun_geo])
+                municipios_con_datos_count += 1
+            else:
+                # Municipio sin datos - asignar un precio especial para que aparezca gris
+                municipios_sin_datos_count += 1
+                todos_municipios.append({
+                    'municipio': mun_geo,
+                    'municipio_norm': mun_geo,
+                    'precio_m2': -1,  # Valor especial para municipios sin datos
+                    'comarca': 'Sin datos'
+                })
+
+        df_mapa_completo = pd.DataFrame(todos_municipios)
+        municipios_sin_datos = municipios_sin_datos_count > 0
+
+        # Preparar escala de colores personalizada
+        # Crear una escala que incluya gris para municipios sin datos
+        precio_min_real = df_mapa['precio_m2'].min()
+        precio_max_real = df_mapa['precio_m2'].max()
+
+        # Crear escala de colores personalizada: gris para -1, luego el gradiente normal
+        colorscale = [
+            [0, 'lightgray'],  # -1 = sin datos
+            [0.001, 'lightgray'],
+            [0.001, '#2d7f2e'],  # Verde (barato)
+            [0.5, '#ffeb84'],    # Amarillo (medio)
+            [1.0, '#d73027']     # Rojo (caro)
+        ]
+
+    # Crear mapa coropletico de municipios
+    def construir_mapa_geografico():
+        fig_choropleth = px.choropleth_mapbox(
+            df_mapa_completo,
+            geojson=geojson_municipios,
+            locations='municipio_norm',
+            featureidkey="properties.NOMBRE",
+            color='precio_m2',
+            color_continuous_scale=colorscale,
+            range_color=(-1, precio_max_real),
+            mapbox_style="carto-positron",
+            zoom=7.8,
+            center={"lat": 43.25, "lon": -4.0},
+            opacity=0.8,
+            labels={'precio_m2': 'Precio €/m²'},
+            hover_name='municipio',
+            hover_data={
+                'municipio': False,
+                'precio_m2': ':.2f',
+                'comarca': True,
+                'municipio_norm': False
+            }
+        )
+
+        # Actualizar bordes de los municipios
+        fig_choropleth.update_traces(
+            marker_line_width=1.5,
+            marker_line_color='white'
+        )
+
+        # Ajustar la barra de colores para que no muestre el -1
+        fig_choropleth.update_coloraxes(
+            colorbar=dict(
+                tickvals=[precio_min_real, (precio_min_real + precio_max_real) / 2, precio_max_real],
+                ticktext=[f'{precio_min_real:.0f}', f'{(precio_min_real + precio_max_real) / 2:.0f}', f'{precio_max_real:.0f}']
+            )
+        )
+
+        fig_choropleth.update_layout(
+            margin={"r": 0, "t": 0, "l": 0, "b": 0},
+            height=650
+        )
+        return fig_choropleth
+
+    fig_choropleth = figura_cacheada(
+        'mapa_geografico',
+        {},
+        versiones_de(df, version_geojson(GEOJSON_MUNICIPIOS_KEY), NIVEL_MAPA_CANTABRIA),
+        construir_mapa_geografico,
+    )
+
+    with span('plotly_chart', figura='mapa_geografico'):
+        st.plotly_chart(fig_choropleth, use_container_width=True)
+
+    # Mostrar informacion sobre municipios sin datos
+    if municipios_sin_datos:
+        st.info(f"ℹ️ {municipios_sin_datos_count} municipios no tienen datos de precios y aparecen en gris en el mapa.")
+
+    # Nombres de los datos que no se han podido asociar a ningun municipio del mapa
+    nombres_sin_coincidencia = obtener_normalizador(municipios_geojson).sin_coincidencia(df_mapa['municipio'])
+    if nombres_sin_coincidencia:
+        with st.expander(f"⚠️ {len(nombres_sin_coincidencia)} nombres sin correspondencia en el mapa"):
+            st.write(", ".join(nombres_sin_coincidencia))
+
+    st.markdown("""
+    **Cómo leer este mapa:**
+    - Cada zona coloreada representa un **municipio** de Cantabria
+    - 🔴 **Rojo**: Municipios con precios más altos
+    - 🟡 **Amarillo**: Municipios con precios medios
+    - 🟢 **Verde**: Municipios con precios más bajos
+    - ⚪ **Gris/Blanco**: Municipios sin datos disponibles
+    - Pasa el ratón sobre cada municipio para ver detalles
+    - Puedes hacer zoom y desplazarte por el mapa
+    """)
+
+    # Treemap jerarquico por comarca y municipio
+    st.markdown("---")
+    st.subheader("📊 Vista Detallada por Municipio")
+
+    # plotly agrupa el path con observed=False: con columnas categoricas
+    # apareceria una hoja vacia por cada combinacion comarca/municipio
+    df_reciente_sorted = df_reciente.sort_values('precio_m2', ascending=False).astype({'comarca': str, 'municipio': str})
+
+    def construir_treemap_municipios():
+        fig_treemap = px.treemap(
+            df_reciente_sorted,
+            path=['comarca', 'municipio'],
+            values='precio_m2',
+            color='precio_m2',
+            color_continuous_scale='RdYlGn_r',
+            title='Distribución de precios por comarca y municipio',
+            labels={'precio_m2': 'Precio €/m²'},
+            hover_data={'precio_m2': ':.2f'}
+        )
+
+        fig_treemap.update_traces(
+            textposition='middle center',
+            textfont=dict(size=11),
+            marker=dict(line=dict(width=2, color='white'))
+        )
+
+        fig_treemap.update_layout(
+            height=600,
+            margin=dict(t=50, l=0, r=0, b=0)
+        )
+        return fig_treemap
+
+    fig_treemap = figura_cacheada(
+        'treemap_municipios',
+        {},
+        versiones_de(df),
+        construir_treemap_municipios,
+    )
+
+    with span('plotly_chart', figura='treemap_municipios'):
+        st.plotly_chart(fig_treemap, use_container_width=True)
+
+    # Estadisticas generales
+    st.markdown("---")
+    col1, col2, col3 = st.columns(3)
+    precio_min = df_reciente['precio_m2'].min()
+    precio_max = df_reciente['precio_m2'].max()
+
+    with col1:
+        st.metric("Municipios con datos", len(df_reciente))
+    with col2:
+        st.metric("Precio Medio Regional", f"{df_reciente['precio_m2'].mean():.2f} €/m²")
+    with col3:
+        st.metric("Rango de Precios", f"{precio_min:.0f} - {precio_max:.0f} €/m²")
+
+    # Top 10 municipios mas caros y mas baratos
+    st.markdown("---")
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.subheader("📈 Top 10 Municipios Más Caros")
+        top_caros = df_reciente.nlargest(10, 'precio_m2')[['municipio', 'precio_m2', 'comarca']]
+        for idx, row in top_caros.iterrows():
+            st.write(f"**{row['municipio']}** ({row['comarca']}): {row['precio_m2']:.2f} €/m²")
+
+    with col2:
+        st.subheader("📉 Top 10 Municipios Más Baratos")
+        top_baratos = df_reciente.nsmallest(10, 'precio_m2')[['municipio', 'precio_m2', 'comarca']]
+        for idx, row in top_baratos.iterrows():
+            st.write(f"**{row['municipio']}** ({row['comarca']}): {row['precio_m2']:.2f} €/m²")
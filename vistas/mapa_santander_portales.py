@@ -0,0 +1,135 @@
+"""
+Vista Mapa Santander Portales: precios por seccion censal de Santander
+"""
+import hashlib
+import io
+
+import pandas as pd
+import plotly.express as px
+import streamlit as st
+
+from cache_figuras import figura_cacheada, versiones_de
+from trazas import span
+from geometria import version_geojson
+from indice_espacial import agregar_por_seccion
+from s3_loader import load_secciones_santander_portales_data, load_geojson_santander, GEOJSON_SANTANDER_KEY
+from vistas import NIVEL_MAPA_SANTANDER
+
+
+def mostrar(datos):
+    st.subheader("🗺️ Mapa de Precios por Sección Censal - Santander (Portales)")
+
+    with st.expander("📍 Usar anuncios propios"):
+        st.caption("Fichero CSV o Parquet con `latitud`, `longitud` y `precio_m2` (o `precio` y `m2_construidos`). Cada anuncio se asigna a la sección que contiene sus coordenadas.")
+        fichero_anuncios = st.file_uploader("Fichero de anuncios", type=["csv", "parquet"])
+
+    with span('mapa_santander_portales.transformacion'):
+        # Cargar datos
+        df_secciones = load_secciones_santander_portales_data()
+        geojson_santander = load_geojson_santander(nivel=NIVEL_MAPA_SANTANDER)
+
+        # Anuncios propios agregados por seccion en lugar de los precalculados
+        if fichero_anuncios is not None:
+            try:
+                contenido = fichero_anuncios.getvalue()
+                if fichero_anuncios.name.lower().endswith('.parquet'):
+                    df_anuncios = pd.read_parquet(io.BytesIO(contenido))
+                else:
+                    df_anuncios = pd.read_csv(io.BytesIO(contenido), sep=None, engine='python')
+                with span('mapa_santander_portales.asignacion_secciones', anuncios=len(df_anuncios)):
+                    df_agregado, descartados = agregar_por_seccion(df_anuncios)
+            except Exception as e:
+                st.error(f"❌ No se pudieron agregar los anuncios: {str(e)}")
+            else:
+                if df_agregado.empty:
+                    st.warning("⚠️ Ningún anuncio cae en una sección censal de Santander")
+                else:
+                    df_secciones = df_agregado
+                    df_secciones.attrs['version'] = ('anuncios', hashlib.md5(contenido).hexdigest())
+                    st.caption(f"{len(df_anuncios) - descartados} anuncios en {len(df_secciones)} secciones · {descartados} fuera de Santander o sin precio")
+
+        # Crear campo para matching: añadir prefijo 39075 al código de sección
+        df_secciones['seccion_completa'] = '39075' + df_secciones['seccion'].astype(str)
+
+        # Obtener todas las secciones del GeoJSON
+        secciones_geojson = [f['properties']['seccion'] for f in geojson_santander['features']]
+
+        # Preparar datos para el mapa
+        secciones_con_datos = dict(zip(df_secciones['seccion_completa'], df_secciones.to_dict('records')))
+
+        todos_registros = []
+        for seccion_geo in secciones_geojson:
+            if seccion_geo in secciones_con_datos:
+                registro = secciones_con_datos[seccion_geo].copy()
+                registro['seccion_geo'] = seccion_geo
+                todos_registros.append(registro)
+            else:
+                todos_registros.append({
+                    'seccion': seccion_geo[-5:],
+                    'seccion_completa': seccion_geo,
+                    'seccion_geo': seccion_geo,
+                    'precio_m2': -1,
+                    'distrito': 'Sin datos',
+                    'num_viviendas': 0
+                })
+
+        df_mapa = pd.DataFrame(todos_registros)
+
+        # Escala de color
+        precio_min_real = df_mapa[df_mapa['precio_m2'] > 0]['precio_m2'].min()
+        precio_max_real = df_mapa['precio_m2'].max()
+
+        colorscale = [
+            [0, 'lightgray'],
+            [0.001, 'lightgray'],
+            [0.001, '#2d7f2e'],
+            [0.5, '#ffeb84'],
+            [1.0, '#d73027']
+        ]
+
+    # Crear mapa
+    def construir_mapa_santander():
+        fig = px.choropleth_mapbox(
+            df_mapa,
+            geojson=geojson_santander,
+            locations='seccion_geo',
+            featureidkey="properties.seccion",
+            color='precio_m2',
+            color_continuous_scale=colorscale,
+            range_color=(-1, precio_max_real),
+            mapbox_style="carto-positron",
+            zoom=12,
+            center={"lat": 43.46, "lon": -3.81},
+            opacity=0.8,
+            labels={'precio_m2': 'Precio €/m²'},
+            hover_name='seccion',
+            hover_data={
+                'seccion_geo': False,
+                'precio_m2': ':.2f',
+                'distrito': True,
+                'num_viviendas': True
+            }
+        )
+
+        fig.update_traces(marker_line_width=1, marker_line_color='white')
+        fig.update_layout(margin={"r": 0, "t": 0, "l": 0, "b": 0}, height=650)
+        return fig
+
+    fig = figura_cacheada(
+        'mapa_santander',
+        {},
+        versiones_de(df_secciones, version_geojson(GEOJSON_SANTANDER_KEY), NIVEL_MAPA_SANTANDER),
+        construir_mapa_santander,
+    )
+
+    with span('plotly_chart', figura='mapa_santander'):
+        st.plotly_chart(fig, use_container_width=True)
+
+    # Métricas resumen
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Precio medio", f"{df_secciones['precio_m2'].mean():,.0f} €/m²")
+    with col2:
+        st.metric("Secciones con datos", f"{len(df_secciones)}")
+    with col3:
+        st.metric("Precio máximo", f"{precio_max_real:,.0f} €/m²")
@@ -0,0 +1,287 @@
+"""
+Vista Prediccion: consulta a la API de prediccion de un inmueble o de un lote
+"""
+import time
+
+import requests
+import streamlit as st
+
+from prediccion_api import predecir, construir_payload, get_prediccion_stats, CAMPOS_PAYLOAD
+from prediccion_lotes import leer_lote, completar_municipios, predecir_lote, combinar_resultados, get_lotes_config, MAX_CONCURRENCIA, COLUMNA_ERROR
+from indice_espacial import obtener_indice_municipios
+from normalizacion_municipios import plegar
+
+
+def mostrar(datos):
+    st.subheader("🔮 Predicción de Precio de Vivienda")
+
+    # Pedir API key al usuario
+    api_key = st.text_input("🔑 API Key *", type="password", help="Introduce tu API key para acceder a las predicciones")
+
+    if not api_key:
+        st.warning("⚠️ Introduce tu API key para poder realizar predicciones.")
+        st.stop()
+
+    tab_individual, tab_lotes = st.tabs(["🏠 Un inmueble", "📁 Por lotes"])
+
+    with tab_individual:
+        st.markdown("Introduce las características del inmueble para obtener una estimación del precio.")
+
+        # Lista completa de municipios de Cantabria
+        municipios_prediccion = sorted([
+            # Santander y Bahía
+            "Santander", "Camargo", "El Astillero", "Santa Cruz de Bezana", "Piélagos",
+            "Villaescusa", "Santa Maria de Cayon", "Miengo", "Castañeda",
+            # Trasmiera
+            "Arnuero", "Bareyo", "Escalante", "Meruelo", "Noja", "Ribamontan al Mar",
+            "Ribamontan al Monte", "Solares", "Marina de Cudeyo", "Medio Cudeyo",
+            "Entrambasaguas", "Hoznayo", "Liérganes", "Penagos", "Riotuerto",
+            "Soto de la Marina", "Miera",
+            # Asón-Agüera
+            "Ampuero", "Arredondo", "Guriezo", "Liendo", "Rasines",
+            "Ramales de la Victoria", "Ruesga", "Soba", "Solorzano", "Voto",
+            # Costa Oriental
+            "Castro-Urdiales", "Laredo", "Colindres", "Limpias", "Santoña",
+            "Barcena de Cicero", "Argoños", "Hazas de Cesto",
+            # Valles Pasiegos
+            "San Roque de Riomiera", "San Pedro del Romeral", "Vega de Pas",
+            "Selaya", "Villacarriedo", "Corvera de Toranzo", "Santiurde de Toranzo",
+            # Costa Occidental
+            "Alfoz de Lloredo", "Comillas", "Ruiloba", "San Vicente de la Barquera",
+            "Santillana del Mar", "Suances", "Udias", "Val de San Vicente", "Valdaliga", "Reocin",
+            # Saja-Nansa
+            "Cabuérniga", "Cabezon de la Sal", "Herrerias", "Lamason", "Mazcuerras",
+            "Polaciones", "Rionansa", "Ruente", "Los Tojos", "Tudanca",
+            # Besaya
+            "Torrelavega", "Cartes", "Los Corrales de Buelna", "Cieza",
+            "San Felices de Buelna", "Polanco", "Barcena de Pie de Concha",
+            "Molledo", "Arenas de Iguña", "Anievas", "Puente Viesgo",
+            # Campoo-Los Valles
+            "Reinosa", "Campoo de Enmedio", "Campoo de Yuso", "Hermandad de Campoo de Suso",
+            "Las Rozas", "Luena", "Pesaguero", "Pesquera", "San Miguel de Aguayo",
+            "Santiurde de Reinosa", "Valdeolea", "Valdeprado del Río", "Valderredible",
+            # Liébana
+            "Potes", "Cabezon de Liébana", "Camaleño", "Cillorigo", "Peñarrubia",
+            "Tresviso", "Vega de Liébana",
+        ])
+
+        # Formulario de predicción
+        col1, col2, col3 = st.columns(3)
+
+        with col1:
+            st.markdown("**📐 Características básicas**")
+            m2_construidos = st.number_input("M² construidos *", min_value=20, max_value=1000, value=100)
+            habitaciones = st.number_input("Habitaciones", min_value=1, max_value=10, value=2)
+            banos = st.number_input("Baños", min_value=1, max_value=5, value=1)
+            latitud = st.number_input("latitud", min_value=42.5, max_value=43.6, value=None, format="%.6f", help="Coordenada de latitud (ej: 43.462306)")
+            longitud = st.number_input("longitud", min_value=-4.9, max_value=-3.1, value=None, format="%.6f", help="Coordenada de longitud (ej: -3.809980)")
+
+            # Con coordenadas se propone el municipio que las contiene
+            opciones_municipio = [""] + municipios_prediccion
+            localizado = None
+            if latitud is not None and longitud is not None:
+                localizado = obtener_indice_municipios().localizar(latitud, longitud)
+            indice_municipio = 0
+            if localizado is not None:
+                por_nombre = {plegar(opcion): i for i, opcion in enumerate(opciones_municipio)}
+                indice_municipio = por_nombre.get(plegar(localizado['municipio']), 0)
+
+            municipio = st.selectbox("Municipio", options=opciones_municipio, index=indice_municipio)
+            if localizado is not None:
+                st.caption(f"📍 Municipio según coordenadas: {localizado['municipio']} (comarca {localizado['comarca']})")
+                if municipio and plegar(municipio) != plegar(localizado['municipio']):
+                    st.warning(f"⚠️ Las coordenadas están en {localizado['municipio']}, no en {municipio}")
+            tipo_inmueble = st.selectbox("Tipo de inmueble", options=["piso", "chalet", "adosado", "duplex"])
+
+        with col2:
+            st.markdown("**🏗️ Estado y antigüedad**")
+            estado = st.selectbox("Estado", options=["", "buen_estado", "a_reformar", "nuevo"])
+            antiguedad_anios = st.number_input("Antigüedad (años)", min_value=0, max_value=100, value=15)
+            planta = st.selectbox("Planta", options=["", "bajo", "1", "2", "3", "4", "5", "atico"])
+            orientacion = st.selectbox("Orientación", options=["", "norte", "sur", "este", "oeste"])
+            calificacion_energetica = st.selectbox("Calificación energética", options=["", "A", "B", "C", "D", "E", "F", "G"])
+
+        with col3:
+            st.markdown("**🏊 Extras**")
+            terraza = st.selectbox("Terraza", options=["", "si", "no", "desconocido"])
+            garaje = st.selectbox("Garaje", options=["", "si", "no", "desconocido"])
+            ascensor = st.selectbox("Ascensor", options=["", "si", "no", "desconocido"])
+            piscina = st.selectbox("Piscina", options=["", "si", "no"])
+            gas_natural = st.selectbox("Gas natural", options=["", "si", "no"])
+            amueblado = st.selectbox("Amueblado", options=["", "si", "no"])
+
+        st.markdown("---")
+
+        # Botón de predicción
+        if st.button("🔮 Obtener Predicción", type="primary", use_container_width=True):
+            # Construir payload solo con campos con valor
+            payload = construir_payload({
+                "m2_construidos": m2_construidos,
+                "habitaciones": habitaciones,
+                "banos": banos,
+                "municipio": municipio,
+                "tipo_inmueble": tipo_inmueble,
+                "estado": estado,
+                "antiguedad_anios": antiguedad_anios,
+                "terraza": terraza,
+                "garaje": garaje,
+                "ascensor": ascensor,
+                "piscina": piscina,
+                "planta": planta,
+                "gas_natural": gas_natural,
+                "amueblado": amueblado,
+                "orientacion": orientacion,
+                "calificacion_energetica": calificacion_energetica,
+                "latitud": latitud,
+                "longitud": longitud,
+            })
+
+            with st.spinner("Calculando predicción..."):
+                try:
+                    # Cliente compartido: conexion keep-alive, timeouts y reintentos
+                    response = predecir(payload, api_key)
+
+                    if response.status_code == 200:
+                        resultado = response.json()
+
+                        # Mostrar resultado
+                        st.markdown("---")
+                        st.markdown("## 📊 Resultado de la Predicción")
+
+                        col_res1, col_res2, col_res3 = st.columns(3)
+
+                        with col_res1:
+                            if "precio_estimado" in resultado:
+                                precio = resultado["precio_estimado"]
+                                st.metric("💰 Precio Estimado", f"{precio:,.0f} €")
+
+                        with col_res2:
+                            if "precio_m2" in resultado:
+                                precio_m2 = resultado["precio_m2"]
+                                st.metric("📐 Precio por m²", f"{precio_m2:,.0f} €/m²")
+
+                        with col_res3:
+                            if "confianza" in resultado:
+                                confianza = resultado["confianza"]
+                                # Porcentaje o etiqueta ("alta", "media") segun el contrato del README
+                                st.metric("📈 Confianza", f"{confianza}%" if isinstance(confianza, (int, float)) else str(confianza))
+
+                        # Mostrar rango si existe
+                        rango_min = resultado.get("rango_min", resultado.get("rango_inferior"))
+                        rango_max = resultado.get("rango_max", resultado.get("rango_superior"))
+                        if rango_min is not None and rango_max is not None:
+                            st.info(f"📊 Rango estimado: **{rango_min:,.0f} €** - **{rango_max:,.0f} €**")
+
+                        # Mostrar detalles de la predicción
+                        with st.expander("📋 Ver detalles de la consulta"):
+                            st.json(payload)
+                            st.json(resultado)
+
+                    elif response.status_code == 403:
+                        st.error("❌ API Key inválida. Verifica tu clave de acceso.")
+                    else:
+                        st.error(f"❌ Error en la API: {response.status_code}")
+                        st.error(f"Detalle: {response.text}")
+
+                except requests.exceptions.ConnectTimeout:
+                    st.error("❌ Timeout: No se pudo conectar con la API.")
+                except requests.exceptions.Timeout:
+                    st.error("❌ Timeout: La API tardó demasiado en responder.")
+                except requests.exceptions.RequestException as e:
+                    st.error(f"❌ Error de conexión: {str(e)}")
+                except Exception as e:
+                    st.error(f"❌ Error inesperado: {str(e)}")
+
+        # Información adicional
+        st.markdown("---")
+        st.caption("* Campo obligatorio. Los demás campos son opcionales pero mejoran la precisión de la predicción.")
+
+    with tab_lotes:
+        st.markdown("Sube un fichero CSV o Parquet con una fila por inmueble y las mismas columnas que el formulario (`m2_construidos` obligatoria). Las filas sin `municipio` lo toman de `latitud` y `longitud`.")
+        st.caption("Columnas reconocidas: " + ", ".join(CAMPOS_PAYLOAD))
+
+        fichero_lote = st.file_uploader("Fichero de inmuebles", type=["csv", "parquet"])
+        concurrencia_defecto, por_segundo_defecto = get_lotes_config()
+        col_lote1, col_lote2 = st.columns(2)
+        with col_lote1:
+            concurrencia = st.slider("Consultas simultáneas", min_value=1, max_value=MAX_CONCURRENCIA, value=concurrencia_defecto)
+        with col_lote2:
+            por_segundo = st.number_input("Consultas por segundo (0 = sin límite)", min_value=0.0, max_value=100.0, value=float(por_segundo_defecto))
+
+        if fichero_lote is not None:
+            try:
+                df_lote = leer_lote(fichero_lote.getvalue(), fichero_lote.name)
+            except Exception as e:
+                st.error(f"❌ No se pudo leer el fichero: {str(e)}")
+                df_lote = None
+
+            if df_lote is not None:
+                st.write(f"**{len(df_lote)}** inmuebles en el fichero")
+                df_lote, completados = completar_municipios(df_lote)
+                if completados:
+                    st.caption(f"📍 Municipio obtenido de las coordenadas en {completados} filas")
+
+                # Un lote nuevo descarta los resultados del anterior
+                id_lote = (fichero_lote.name, fichero_lote.size)
+                if st.session_state.get('lote_id') != id_lote:
+                    st.session_state['lote_id'] = id_lote
+                    st.session_state['lote_resultados'] = {}
+
+                resultados = st.session_state['lote_resultados']
+                pendientes = None
+                col_boton1, col_boton2 = st.columns(2)
+                with col_boton1:
+                    if st.button("🔮 Predecir lote", type="primary", use_container_width=True):
+                        resultados.clear()
+                        pendientes = df_lote
+                with col_boton2:
+                    fallidos_previos = [i for i, r in resultados.items() if COLUMNA_ERROR in r]
+                    if st.button(f"🔁 Reintentar fallidas ({len(fallidos_previos)})", disabled=not fallidos_previos, use_container_width=True):
+                        pendientes = df_lote.loc[fallidos_previos]
+
+                if pendientes is not None:
+                    barra = st.progress(0.0, text="Enviando consultas...")
+                    inicio_lote = time.perf_counter()
+                    for hechas, (indice, resultado) in enumerate(
+                        predecir_lote(pendientes, api_key, concurrencia, por_segundo), start=1
+                    ):
+                        resultados[indice] = resultado
+                        barra.progress(hechas / len(pendientes), text=f"{hechas}/{len(pendientes)} consultas")
+                    barra.empty()
+                    st.caption(f"{len(pendientes)} consultas en {time.perf_counter() - inicio_lote:.1f} s")
+
+                if resultados:
+                    df_correctos, df_fallidos = combinar_resultados(df_lote, resultados)
+                    st.success(f"✅ {len(df_correctos)} inmuebles valorados")
+                    st.dataframe(df_correctos, use_container_width=True)
+                    st.download_button(
+                        "⬇️ Descargar resultados (CSV)",
+                        df_correctos.to_csv(index=False).encode('utf-8'),
+                        file_name="predicciones.csv",
+                        mime="text/csv",
+                    )
+
+                    if len(df_fallidos):
+                        st.error(f"❌ {len(df_fallidos)} inmuebles sin valorar")
+                        st.dataframe(df_fallidos, use_container_width=True)
+                        st.download_button(
+                            "⬇️ Descargar filas fallidas (CSV)",
+                            df_fallidos.to_csv(index=False).encode('utf-8'),
+                            file_name="predicciones_fallidas.csv",
+                            mime="text/csv",
+                        )
+
+
+def mostrar_panel_lateral():
+    """
+    Latencias de la API de prediccion (comunes a todas las sesiones)
+    """
+    stats_prediccion = get_prediccion_stats()
+    if stats_prediccion['consultas']:
+        with st.sidebar.expander("🔮 API de predicción"):
+            latencias = stats_prediccion['latencias']
+            st.caption(f"{stats_prediccion['consultas']} consultas · {stats_prediccion['reintentos']} reintentos · {stats_prediccion['errores_conexion']} errores de conexión")
+            st.caption(f"Latencia media {latencias['media_ms']:.0f} ms · p50 ≤ {latencias['p50_ms']:.0f} ms · p95 ≤ {latencias['p95_ms']:.0f} ms")
+            for intervalo, cuenta in latencias['intervalos'].items():
+                if cuenta:
+                    st.write(f"**{intervalo}**: {cuenta}")
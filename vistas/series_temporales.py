@@ -0,0 +1,168 @@
+"""
+Vista Series Temporales: evolucion del precio y sus variaciones por zona
+"""
+import plotly.graph_objects as go
+import streamlit as st
+
+from cache_figuras import figura_cacheada, versiones_de
+from trazas import span
+from metricas_derivadas import serie_con_metricas
+
+
+def mostrar(datos):
+    df = datos.municipios
+    df_distritos = datos.distritos
+    resumen_municipios = datos.resumen_municipios
+    resumen_distritos = datos.resumen_distritos
+    municipios_disponibles = datos.municipios_disponibles
+    distritos_disponibles = datos.distritos_disponibles
+
+    # Selector de tipo de zona
+    tipo_zona = st.sidebar.radio(
+        "Tipo de zona:",
+        options=["Municipios", "Distritos de Santander"]
+    )
+
+    # Seleccion multiple segun el tipo de zona
+    if tipo_zona == "Municipios":
+        zonas_seleccionadas = st.sidebar.multiselect(
+            "Selecciona uno o más municipios:",
+            options=municipios_disponibles,
+            default=[m for m in ['Santander', 'Torrelavega', 'Comillas'] if m in municipios_disponibles] or [municipios_disponibles[0]]
+        )
+        df_usado = df
+        resumen_zonas = resumen_municipios
+        columna_zona = 'municipio'
+    else:  # Distritos de Santander
+        zonas_seleccionadas = st.sidebar.multiselect(
+            "Selecciona uno o más distritos:",
+            options=distritos_disponibles,
+            default=[distritos_disponibles[0]] if distritos_disponibles else []
+        )
+        df_usado = df_distritos
+        resumen_zonas = resumen_distritos
+        columna_zona = 'distrito'
+
+    # Tipo de visualizacion
+    tipo_visualizacion = st.sidebar.radio(
+        "Tipo de visualización:",
+        options=["Precio Absoluto", "Variación Mensual (%)", "Variación Anual (%)"]
+    )
+
+    # Filtrar datos por zonas seleccionadas
+    if zonas_seleccionadas:
+        # Series ordenadas por zona y fecha con las variaciones ya calculadas
+        # (una vez por version del dataset)
+        with span('series_temporales.transformacion'):
+            df_metricas = serie_con_metricas(df_usado, columna_zona)
+            df_filtrado = df_metricas[df_metricas[columna_zona].isin(zonas_seleccionadas)]
+
+        # Seleccionar la columna segun el tipo de visualizacion
+        if tipo_visualizacion == "Variación Mensual (%)":
+            columna_valor = 'variacion_mensual'
+            titulo_grafico = "Variación mensual del precio por m² (%)"
+            ylabel = "Variación Mensual (%)"
+        elif tipo_visualizacion == "Variación Anual (%)":
+            columna_valor = 'variacion_anual'
+            titulo_grafico = "Variación anual del precio por m² (%)"
+            ylabel = "Variación Anual (%)"
+        else:
+            columna_valor = 'precio_m2'
+            titulo_grafico = "Evolución del precio por m²"
+            ylabel = "Precio (€/m²)"
+
+        # Crear grafico con Plotly
+        def construir_series_temporales():
+            fig = go.Figure()
+
+            for zona in zonas_seleccionadas:
+                df_zona = df_filtrado[df_filtrado[columna_zona] == zona]
+                fig.add_trace(go.Scatter(
+                    x=df_zona['fecha'],
+                    y=df_zona[columna_valor],
+                    mode='lines+markers',
+                    name=zona,
+                    hovertemplate='<b>%{fullData.name}</b><br>' +
+                                 'Fecha: %{x|%B %Y}<br>' +
+                                 ylabel + ': %{y:.2f}<br>' +
+                                 '<extra></extra>'
+                ))
+
+            fig.update_layout(
+                title=titulo_grafico,
+                xaxis_title="Fecha",
+                yaxis_title=ylabel,
+                hovermode='x unified',
+                height=600,
+                template='plotly_white',
+                legend=dict(
+                    orientation="h",
+                    yanchor="bottom",
+                    y=1.02,
+                    xanchor="right",
+                    x=1
+                )
+            )
+            return fig
+
+        fig = figura_cacheada(
+            'series_temporales',
+            {'zonas': zonas_seleccionadas, 'columna_zona': columna_zona, 'valor': columna_valor},
+            versiones_de(df_usado),
+            construir_series_temporales,
+        )
+
+        # Mostrar grafico
+        with span('plotly_chart', figura='series_temporales'):
+            st.plotly_chart(fig, use_container_width=True)
+
+        # Estadisticas resumidas
+        st.markdown("---")
+        st.subheader("📈 Estadísticas Resumidas")
+
+        cols = st.columns(len(zonas_seleccionadas))
+
+        for idx, zona in enumerate(zonas_seleccionadas):
+            df_zona = df_filtrado[df_filtrado[columna_zona] == zona]
+
+            with cols[idx]:
+                st.markdown(f"**{zona}**")
+                if zona in resumen_zonas.index:
+                    periodo = resumen_zonas.loc[zona]
+                    st.caption(
+                        f"{periodo['primera_fecha']:%Y-%m} a {periodo['ultima_fecha']:%Y-%m} "
+                        f"({periodo['num_registros']} registros)"
+                    )
+
+                if tipo_visualizacion == "Precio Absoluto":
+                    precio_actual = df_zona['precio_m2'].iloc[-1]
+                    variacion_total = df_zona['variacion_desde_inicio'].iloc[-1]
+
+                    st.metric(
+                        label="Precio Actual",
+                        value=f"{precio_actual:.2f} €/m²",
+                        delta=f"{variacion_total:.2f}%"
+                    )
+                    st.write(f"**Precio Mínimo:** {df_zona['precio_m2'].min():.2f} €/m²")
+                    st.write(f"**Precio Máximo:** {df_zona['precio_m2'].max():.2f} €/m²")
+                    st.write(f"**Precio Medio:** {df_zona['precio_m2'].mean():.2f} €/m²")
+                else:
+                    st.write(f"**Variación Media:** {df_zona[columna_valor].mean():.2f}%")
+                    st.write(f"**Variación Mínima:** {df_zona[columna_valor].min():.2f}%")
+                    st.write(f"**Variación Máxima:** {df_zona[columna_valor].max():.2f}%")
+
+        # Tabla de datos
+        st.markdown("---")
+        with st.expander("📋 Ver tabla de datos"):
+            # Preparar tabla para mostrar
+            tabla_mostrar = df_filtrado[[columna_zona, 'fecha_texto', 'precio_m2']].copy()
+            tabla_mostrar = tabla_mostrar.pivot(
+                index='fecha_texto',
+                columns=columna_zona,
+                values='precio_m2'
+            )
+            st.dataframe(tabla_mostrar, use_container_width=True)
+
+    else:
+        mensaje = "municipio" if tipo_zona == "Municipios" else "distrito"
+        st.warning(f"⚠️ Por favor, selecciona al menos un {mensaje} para visualizar los datos.")
@@ -0,0 +1,248 @@
+"""
+Modulo con vistas materializadas por zona de los datasets cargados
+
+Para cada dataset (municipios, distritos, portales) calcula una sola vez por
+version del dataset:
+- El ultimo registro de cada zona (lo que antes hacia cada vista con
+  df.sort_values('fecha').groupby(zona).tail(1) en cada rerun)
+- La primera y ultima fecha y el numero de registros de cada zona
+
+Las vistas se guardan por dataset, proyeccion y columna de zona. Cuando llega
+una version nueva que solo añade meses posteriores al final del dataset, la
+vista se actualiza con las filas nuevas en lugar de recalcularse entera. Para
+comprobar que el principio del dataset es el anterior no se recorre toda la
+historia: se comparan el numero de filas, la ultima fecha y el hash de las
+filas de control (el ultimo registro de cada zona, que es lo que devuelve la
+vista, y unas pocas filas de cada extremo).
+
+Los DataFrames devueltos se comparten entre sesiones: no deben modificarse.
+"""
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Filas del principio y del final del dataset que se comprueban, ademas del
+# ultimo registro de cada zona, antes de actualizar una vista
+FILAS_FRONTERA = 16
+
+_lock = threading.Lock()
+_vistas = {}
+_stats = {'aciertos': 0, 'completas': 0, 'incrementales': 0}
+
+
+class VistaZonas:
+    """
+    Vista materializada de un dataset por zona
+
+    Attributes:
+        ultimo: Ultimo registro de cada zona, ordenado por fecha
+        resumen: DataFrame indexado por zona con primera_fecha, ultima_fecha
+            y num_registros
+    """
+
+    def __init__(self, version, columna_zona, ultimo, posiciones, resumen, num_filas, fecha_max, huella):
+        self.version = version
+        self.columna_zona = columna_zona
+        self.ultimo = ultimo
+        # Posicion en el dataset de cada fila de ultimo
+        self.posiciones = posiciones
+        self.resumen = resumen
+        self.num_filas = num_filas
+        self.fecha_max = fecha_max
+        self.huella = huella
+
+
+def _control(posiciones, num_filas):
+    """
+    Posiciones de las filas de control: el ultimo registro de cada zona y
+    FILAS_FRONTERA filas de cada extremo
+    """
+    frontera = np.r_[0:min(FILAS_FRONTERA, num_filas), max(num_filas - FILAS_FRONTERA, 0):num_filas]
+    return np.unique(np.concatenate([posiciones, frontera]).astype(np.int64))
+
+
+def _huella(df, posiciones):
+    """
+    Huella de las filas de control de un DataFrame (suma de sus hashes)
+
+    Depende del numero de zonas y no de la longitud de la historia.
+    """
+    control = df.iloc[_control(posiciones, len(df))]
+    if control.empty:
+        return np.uint64(0)
+    return pd.util.hash_pandas_object(control, index=False).to_numpy().sum(dtype=np.uint64)
+
+
+def _posiciones_ultimo(df, columna_zona):
+    """
+    Posiciones del ultimo registro de cada zona, ordenadas por fecha
+
+    Equivale a df.sort_values('fecha', kind='stable').groupby(zona).tail(1)
+    sin ordenar todo el historico: con fechas repetidas gana la ultima fila.
+    """
+    fechas = df['fecha'].reset_index(drop=True)
+    zonas = df[columna_zona].reset_index(drop=True)
+
+    # idxmax devuelve la primera aparicion del maximo: recorriendo las filas
+    # al reves se obtiene la ultima
+    posiciones = fechas.iloc[::-1].groupby(zonas.iloc[::-1], observed=True).idxmax().dropna()
+    posiciones = np.sort(posiciones.to_numpy(dtype=np.int64))
+    return posiciones[np.argsort(fechas.to_numpy()[posiciones], kind='stable')]
+
+
+def _resumen_por_zona(df, columna_zona):
+    """
+    Primera y ultima fecha y numero de registros de cada zona
+    """
+    return df.groupby(columna_zona, observed=True).agg(
+        primera_fecha=('fecha', 'min'),
+        ultima_fecha=('fecha', 'max'),
+        num_registros=('fecha', 'size'),
+    )
+
+
+def _materializar(df, columna_zona, version):
+    """
+    Calcula la vista completa de un dataset
+    """
+    posiciones = _posiciones_ultimo(df, columna_zona)
+    return VistaZonas(
+        version=version,
+        columna_zona=columna_zona,
+        ultimo=df.iloc[posiciones],
+        posiciones=posiciones,
+        resumen=_resumen_por_zona(df, columna_zona),
+        num_filas=len(df),
+        fecha_max=df['fecha'].max(),
+        huella=_huella(df, posiciones),
+    )
+
+
+def _actualizar(anterior, df, version):
+    """
+    Actualiza una vista con los meses nuevos añadidos al final del dataset
+
+    El principio del dataset se da por el anterior si coinciden sus filas de
+    control (ver _huella). Un cambio en otra fila del historico no se
+    detecta, pero tampoco cambiaria la vista salvo que alterase las fechas o
+    zonas de los registros: el ultimo registro de cada zona es una fila de
+    control.
+
+    Returns:
+        La vista actualizada, o None si el dataset no es el anterior mas
+        filas posteriores a su ultima fecha (hay que recalcular)
+    """
+    n = anterior.num_filas
+    if len(df) <= n or pd.isna(anterior.fecha_max):
+        return None
+
+    prefijo = df.iloc[:n]
+    nuevas = df.iloc[n:]
+    if not (nuevas['fecha'] > anterior.fecha_max).all():
+        return None
+    if _huella(prefijo, anterior.posiciones) != anterior.huella:
+        return None
+
+    columna_zona = anterior.columna_zona
+    posiciones_nuevas = _posiciones_ultimo(nuevas, columna_zona)
+    ultimo_nuevas = nuevas.iloc[posiciones_nuevas]
+    mantener = ~anterior.ultimo[columna_zona].isin(ultimo_nuevas[columna_zona]).to_numpy()
+    ultimo = pd.concat([anterior.ultimo[mantener], ultimo_nuevas])
+    posiciones = np.concatenate([anterior.posiciones[mantener], posiciones_nuevas + n])
+
+    resumen = pd.concat([anterior.resumen, _resumen_por_zona(nuevas, columna_zona)])
+    resumen = resumen.groupby(level=0, observed=True).agg(
+        primera_fecha=('primera_fecha', 'min'),
+        ultima_fecha=('ultima_fecha', 'max'),
+        num_registros=('num_registros', 'sum'),
+    )
+
+    return VistaZonas(
+        version=version,
+        columna_zona=columna_zona,
+        ultimo=ultimo,
+        posiciones=posiciones,
+        resumen=resumen,
+        num_filas=len(df),
+        fecha_max=nuevas['fecha'].max(),
+        huella=_huella(df, posiciones),
+    )
+
+
+def clave_dataset(df, columna_zona):
+    """
+    Clave de un DataFrame cargado para guardar resultados calculados sobre el
+
+    Incluye las columnas porque df.attrs se propaga a los DataFrames
+    derivados (p.ej. con columnas añadidas) y no deben confundirse con el
+    original.
+
+    Returns:
+        Tupla (clave, version); la version es None si el DataFrame no la lleva
+    """
+    clave = (df.attrs.get('dataset'), df.attrs.get('proyeccion'), tuple(df.columns), columna_zona)
+    return clave, df.attrs.get('version')
+
+
+def obtener_vista(df, columna_zona='municipio'):
+    """
+    Devuelve la vista materializada de un dataset cargado con s3_loader
+
+    La vista se identifica por df.attrs (dataset, proyeccion y version que
+    fijan los loaders), las columnas y la columna de zona. Si el DataFrame no
+    lleva version se calcula sin guardarla.
+
+    Args:
+        df: DataFrame devuelto por un loader de dominio
+        columna_zona: Columna que identifica la zona
+
+    Returns:
+        VistaZonas
+    """
+    clave, version = clave_dataset(df, columna_zona)
+    if version is None:
+        return _materializar(df, columna_zona, None)
+
+    with _lock:
+        anterior = _vistas.get(clave)
+        if anterior is not None and anterior.version == version and anterior.num_filas == len(df):
+            _stats['aciertos'] += 1
+            return anterior
+
+    vista = _actualizar(anterior, df, version) if anterior is not None else None
+    tipo = 'incrementales'
+    if vista is None:
+        vista = _materializar(df, columna_zona, version)
+        tipo = 'completas'
+    logger.info("Vista %s por %s (%s): %d zonas", clave[0], columna_zona, tipo, len(vista.resumen))
+
+    with _lock:
+        _vistas[clave] = vista
+        _stats[tipo] += 1
+    return vista
+
+
+def ultimo_por_zona(df, columna_zona='municipio'):
+    """
+    Ultimo registro de cada zona (una fila por zona, ordenadas por fecha)
+    """
+    return obtener_vista(df, columna_zona).ultimo
+
+
+def resumen_por_zona(df, columna_zona='municipio'):
+    """
+    Primera fecha, ultima fecha y numero de registros de cada zona
+    """
+    return obtener_vista(df, columna_zona).resumen
+
+
+def get_vistas_stats():
+    """
+    Contadores de vistas servidas, calculadas completas y actualizadas
+    """
+    with _lock:
+        return dict(_stats)